@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+"""
+Capture of GStreamer debug output in memory.
+
+Debug records are kept in a bounded ring instead of being printed, and
+the last seconds of it are formatted and written to disk only when
+something goes wrong (errors posted on the bus, stalls), see :func:`dump`.
+"""
+
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+
+from core import graph
+
+
+# Default GStreamer debug threshold of captured output, as in GST_DEBUG.
+DEFAULT_THRESHOLD = "4"
+# Duration in seconds of debug output written by a dump.
+LOG_DURATION = 30
+# Maximum number of records kept in memory.
+LOG_MAX_LINES = 200000
+# Minimum interval in seconds between two dumps.
+DUMP_INTERVAL = 10
+
+logger = logging.getLogger("core.debuglog")
+
+
+class LogRing:
+    """
+    Keep the most recent records of a log. Records are added from
+    GStreamer streaming threads and read from the main thread.
+
+    :param duration: age in seconds after which a record is dropped
+    :param max_lines: maximum number of records kept
+    """
+    def __init__(self, duration, max_lines):
+        self.duration = duration
+        self._lock = threading.Lock()
+        # Formatted as deque([(monotonic time, record), ...])
+        self._records = collections.deque(maxlen=max_lines)
+
+    def add(self, record, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._records.append((now, record))
+            while now - self._records[0][0] > self.duration:
+                self._records.popleft()
+
+    def get_records(self, now=None):
+        """
+        :return: :class:`list` of records added during the last
+            :attr:`duration` seconds, oldest first
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [record for record_time, record in self._records
+                    if now - record_time <= self.duration]
+
+    def __len__(self):
+        return len(self._records)
+
+
+def format_record(record):
+    """
+    :param record: ``(wall-clock time, thread identifier, level name,
+        category name, filename, line, function, message)``, as captured
+        from GStreamer debug output
+
+    :return: line of the log, without trailing newline
+    """
+    return "{:.6f} {} {:<7} {:<20} {}:{}:{} {}".format(*record)
+
+
+def write_dump(lines, reason, directory=None):
+    """
+    :param lines: lines of the log, without trailing newline
+    :param reason: why the log is dumped, it's part of the filename
+    :param directory: directory of the dump, default to
+        :const:`~core.graph.DUMP_DIRECTORY`
+
+    :return: path of the dump
+    """
+    directory = directory or graph.DUMP_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    filename = "hubangl-{}-{}.log".format(
+        datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f"), reason)
+    path = os.path.join(directory, filename)
+    with open(path, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+    return path
+
+
+_ring = None
+_last_dump = None
+
+
+def setup(duration=LOG_DURATION, max_lines=LOG_MAX_LINES):
+    """
+    Create the ring receiving debug output.
+
+    :return: :class:`LogRing`
+    """
+    global _ring, _last_dump
+    _ring = LogRing(duration, max_lines)
+    _last_dump = None
+    return _ring
+
+
+def get_ring():
+    """
+    :return: :class:`LogRing` or ``None`` if debug output is not captured
+    """
+    return _ring
+
+
+def dump(reason, now=None):
+    """
+    Write captured debug output into
+    :const:`~core.graph.DUMP_DIRECTORY`, at most once every
+    :const:`DUMP_INTERVAL` seconds.
+
+    :param reason: why the log is dumped, it's part of the filename
+
+    :return: path of the dump, ``None`` if nothing was written
+    """
+    global _last_dump
+    if _ring is None:
+        return None
+
+    now = time.monotonic() if now is None else now
+    if _last_dump is not None and now - _last_dump < DUMP_INTERVAL:
+        return None
+
+    _last_dump = now
+    try:
+        path = write_dump([format_record(record)
+                           for record in _ring.get_records(now)], reason)
+    except OSError as e:
+        logger.error("Failed to dump GStreamer debug log ({})".format(e))
+        return None
+
+    logger.info("GStreamer debug log dumped to {}".format(path))
+    return path
+
+
+def shutdown():
+    global _ring
+    _ring = None
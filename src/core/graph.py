@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+"""
+Dumps of the pipeline graph in Graphviz dot format, annotated with live
+state of elements, see :meth:`~core.process.Pipeline.dump_graph`.
+
+An SVG rendering is written along each dump if Graphviz is installed, it's
+rendered in the background so that dumping never stalls the main loop.
+"""
+
+import collections
+import datetime
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+
+# Directory in which dumps are written.
+DUMP_DIRECTORY = os.path.join(tempfile.gettempdir(), "hubangl-graphs")
+# Minimum interval in seconds between two dumps written on errors.
+ERROR_DUMP_INTERVAL = 10
+DOT = "dot"
+
+STATE_COLORS = {"PLAYING": "#c8e6c9",
+                "PAUSED": "#fff9c4",
+                "READY": "#e0e0e0",
+                "NULL": "#ffffff"}
+
+Node = collections.namedtuple("Node", ("name", "state", "lines"))
+Edge = collections.namedtuple(
+    "Edge", ("source", "source_pad", "sink", "sink_pad", "caps"))
+
+logger = logging.getLogger("core.graph")
+
+
+def _quote(text):
+    return '"{}"'.format(text.replace("\\", "\\\\").replace('"', '\\"')
+                         .replace("\n", "\\n"))
+
+
+def format_caps(caps):
+    """
+    :param caps: caps as :class:`str`
+
+    :return: caps without field types, one field per line
+    """
+    caps = re.sub(r"=\(\w+\)", "=", caps)
+    return "\n".join(field.strip() for field in caps.split(", "))
+
+
+def format_dot(name, nodes, edges):
+    """
+    :param name: name of the graph
+    :param nodes: :class:`Node` sequence, ``state`` is the name of the
+        element state (e.g. ``PLAYING``) and ``lines`` annotations
+    :param edges: :class:`Edge` sequence, ``caps`` is ``None`` if they're
+        not negotiated
+
+    :return: graph in dot format as :class:`str`
+    """
+    lines = ["digraph {} {{".format(_quote(name)),
+             "  rankdir=LR;",
+             '  node [shape=box, style="rounded,filled", fontname=monospace,'
+             " fontsize=10];",
+             "  edge [fontname=monospace, fontsize=8];"]
+    for node in nodes:
+        label = "\n".join((node.name,) + tuple(node.lines))
+        lines.append("  {} [label={}, fillcolor={}];".format(
+            _quote(node.name), _quote(label),
+            _quote(STATE_COLORS.get(node.state, "#ffffff"))))
+    for edge in edges:
+        label = "{} -> {}".format(edge.source_pad, edge.sink_pad)
+        if edge.caps:
+            attributes = ""
+            label += "\n" + format_caps(edge.caps)
+        else:
+            attributes = ", color=red, style=dashed"
+            label += "\nnot negotiated"
+        lines.append("  {} -> {} [label={}{}];".format(
+            _quote(edge.source), _quote(edge.sink), _quote(label),
+            attributes))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _render_svg(path):
+    svg_path = os.path.splitext(path)[0] + ".svg"
+    try:
+        process = subprocess.run((DOT, "-Tsvg", "-o", svg_path, path),
+                                 stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE)
+    except OSError as e:
+        logger.warning("Failed to render {} ({})".format(path, e))
+        return
+    if process.returncode:
+        logger.warning("Failed to render {} ({})".format(
+            path, process.stderr.decode(errors="replace").strip()))
+
+
+def write_dump(dot, reason, directory=None):
+    """
+    Write a graph and render it as SVG in the background, if Graphviz is
+    installed.
+
+    :param dot: graph in dot format as :class:`str`
+    :param reason: why the graph is dumped, it's part of the filename
+    :param directory: directory of the dump, default to
+        :const:`DUMP_DIRECTORY`
+
+    :return: path of the dot file
+    """
+    directory = directory or DUMP_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    filename = "hubangl-{}-{}.dot".format(
+        datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f"), reason)
+    path = os.path.join(directory, filename)
+    with open(path, "w") as f:
+        f.write(dot)
+
+    if shutil.which(DOT):
+        threading.Thread(target=_render_svg, args=(path,), daemon=True,
+                         name="graph_renderer").start()
+    return path
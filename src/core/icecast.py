@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import base64
+import concurrent.futures
+import hashlib
+import logging
+import socket
+import threading
+import time
+
+
+# Duration in seconds after which a server that doesn't reply is considered
+# unreachable.
+PROBE_TIMEOUT = 3
+# Duration in seconds during which a successful probe result is reused.
+PROBE_CACHE_TTL = 60
+# Duration in seconds during which a failed probe result is reused, it's kept
+# short so that a fixed server is detected quickly.
+PROBE_FAILURE_CACHE_TTL = 5
+
+# Error messages, they match the ones reported by shout2send.
+COULD_NOT_CONNECT = "couldn't connect"
+LOGIN_FAILED = "login failed"
+MOUNT_IN_USE = "mountpoint in use"
+UNEXPECTED_REPLY = "unexpected reply"
+
+logger = logging.getLogger("core.icecast")
+
+_executor = None
+_lock = threading.Lock()
+# Formatted as {key: (timestamp, error_message)}
+_cache = {}
+# Probes running, formatted as {key: future}
+_pending = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            thread_name_prefix="icecast_probe")
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def _get_key(address, port, mount, password):
+    password_hash = hashlib.sha256((password or "").encode()).hexdigest()
+    return address, port, mount, password_hash
+
+
+def _get_cached(key):
+    try:
+        timestamp, error_message = _cache[key]
+    except KeyError:
+        return False, None
+
+    ttl = PROBE_FAILURE_CACHE_TTL if error_message else PROBE_CACHE_TTL
+    if time.monotonic() - timestamp > ttl:
+        del _cache[key]
+        return False, None
+
+    return True, error_message
+
+
+def _build_request(method, address, port, mount, password):
+    credentials = base64.b64encode(
+        "source:{}".format(password or "").encode()).decode()
+    lines = ["{} {} HTTP/1.{}".format(method, mount,
+                                      1 if method == "PUT" else 0),
+             "Host: {}:{}".format(address, port),
+             "Authorization: Basic {}".format(credentials),
+             "User-Agent: hubangl",
+             "Content-Type: application/ogg",
+             "Ice-Public: 0"]
+    if method == "PUT":
+        # Server replies as soon as the source is accepted, no data needs
+        # to be sent.
+        lines.append("Expect: 100-continue")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+def _read_status(sock):
+    data = b""
+    while b"\r\n" not in data and b"\n" not in data:
+        chunk = sock.recv(1024)
+        if not chunk:
+            break
+        data += chunk
+    status_line = data.splitlines()[0] if data else b""
+    try:
+        return int(status_line.split()[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _handshake(method, address, port, mount, password, timeout):
+    """
+    Perform a source handshake then close the connection before sending any
+    data.
+
+    :return: HTTP status code as :class:`int`, ``None`` if the reply can't be
+        parsed
+    """
+    with socket.create_connection((address, port), timeout=timeout) as sock:
+        sock.sendall(_build_request(method, address, port, mount, password))
+        return _read_status(sock)
+
+
+def _probe(address, port, mount, password, timeout):
+    """
+    Check that a source client can connect and log in to an Icecast server.
+    HTTP PUT is used first (Icecast >= 2.4) then legacy SOURCE method.
+
+    :return: error message as :class:`str`, ``None`` if succeeded
+    """
+    status = None
+    try:
+        for method in ("PUT", "SOURCE"):
+            status = _handshake(method, address, port, mount, password,
+                                timeout)
+            if status not in (400, 405, 501):
+                # Method is supported.
+                break
+    except OSError as e:
+        logger.debug("Icecast probe of {}:{} failed ({})".format(
+            address, port, e))
+        return COULD_NOT_CONNECT
+
+    if status in (100, 200):
+        return
+    elif status == 401:
+        return LOGIN_FAILED
+    elif status == 403:
+        return MOUNT_IN_USE
+    return UNEXPECTED_REPLY
+
+
+def _run_probe(key, address, port, mount, password, timeout):
+    start = time.monotonic()
+    error_message = _probe(address, port, mount, password, timeout)
+    logger.debug("Icecast probe of {}:{}{} done in {:.3f}s ({})".format(
+        address, port, mount, time.monotonic() - start,
+        error_message or "ok"))
+
+    with _lock:
+        _cache[key] = (time.monotonic(), error_message)
+        _pending.pop(key, None)
+    return error_message
+
+
+def probe_async(address, port, mount, password, timeout=None):
+    """
+    Start probing an Icecast server in background. Result is taken from the
+    cache if available and a probe already running for the same server is
+    reused.
+
+    :param address: server IP address
+    :param port: server port to connect to
+    :param mount: mountpoint as :class:`str`
+    :param password: source password
+    :param timeout: time to wait for the server in seconds, default to
+        :const:`PROBE_TIMEOUT`
+
+    :return: :class:`concurrent.futures.Future` whose result is an error
+        message as :class:`str`, ``None`` if the server accepted the source
+    """
+    if timeout is None:
+        timeout = PROBE_TIMEOUT
+
+    key = _get_key(address, port, mount, password)
+    with _lock:
+        found, error_message = _get_cached(key)
+        if found:
+            future = concurrent.futures.Future()
+            future.set_result(error_message)
+            return future
+
+        try:
+            return _pending[key]
+        except KeyError:
+            future = _pending[key] = _get_executor().submit(
+                _run_probe, key, address, port, mount, password, timeout)
+            return future
+
+
+def probe_all(servers, timeout=None):
+    """
+    Probe several Icecast servers concurrently.
+
+    :param servers: :class:`list` of ``(address, port, mount, password)``
+    :param timeout: time to wait for each server in seconds, default to
+        :const:`PROBE_TIMEOUT`
+
+    :return: :class:`list` of error messages, see :func:`probe_async`
+    """
+    if timeout is None:
+        timeout = PROBE_TIMEOUT
+
+    futures = [probe_async(*server, timeout=timeout) for server in servers]
+    # Connection and reply each take at most ``timeout``.
+    deadline = time.monotonic() + timeout * 2
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(
+                max(deadline - time.monotonic(), 0)))
+        except concurrent.futures.TimeoutError:
+            results.append(COULD_NOT_CONNECT)
+    return results
+
+
+def probe_all_async(servers, callback, timeout=None):
+    """
+    Probe several Icecast servers concurrently without waiting for them.
+
+    :param servers: :class:`list` of ``(address, port, mount, password)``
+    :param callback: called with the :class:`list` of error messages, see
+        :func:`probe_async`, once all probes are done. It's called from a
+        probing thread, or right away if all results are cached.
+    :param timeout: time to wait for each server in seconds, default to
+        :const:`PROBE_TIMEOUT`
+    """
+    futures = [probe_async(*server, timeout=timeout) for server in servers]
+    if not futures:
+        callback([])
+        return
+
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_probe_done(future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        callback([future.result() for future in futures])
+
+    for future in futures:
+        future.add_done_callback(on_probe_done)
+
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import collections
+import time
+
+
+# Number of recent samples the live latency of a pad is averaged on.
+LATENCY_WINDOW = 100
+
+
+class PadCounters:
+    """
+    Counters of data flowing through a pad. They are updated from GStreamer
+    streaming thread of the pad, and can be read from any thread.
+
+    :param name: name of the instrumented pad as :class:`str`
+    """
+    __slots__ = ("name", "buffers", "bytes", "last_pts", "last_time",
+                 "first_time")
+
+    def __init__(self, name):
+        self.name = name
+        self.buffers = 0
+        self.bytes = 0
+        # Timestamp of last buffer in nanoseconds, ``None`` if unknown.
+        self.last_pts = None
+        # Monotonic time of first and last buffers.
+        self.first_time = None
+        self.last_time = None
+
+    def add(self, buffers, size, pts=None, now=None):
+        """
+        Register ``buffers`` buffers totalling ``size`` bytes.
+        """
+        now = time.monotonic() if now is None else now
+        if self.first_time is None:
+            self.first_time = now
+        self.buffers += buffers
+        self.bytes += size
+        if pts is not None:
+            self.last_pts = pts
+        self.last_time = now
+
+    def get_stats(self, now=None):
+        """
+        :return: :class:`dict` describing data flow through the pad
+        """
+        now = time.monotonic() if now is None else now
+        last_time = self.last_time
+        first_time = self.first_time
+        elapsed = (last_time - first_time
+                   if first_time is not None and last_time is not None
+                   else 0)
+        return {"buffers": self.buffers,
+                "bytes": self.bytes,
+                "last_timestamp": (self.last_pts / 1e9
+                                   if self.last_pts is not None else None),
+                "idle_time": now - last_time if last_time is not None else None,
+                "average_rate": self.bytes / elapsed if elapsed else 0.0}
+
+
+class LatencyStats:
+    """
+    Latency between capture of buffers and their arrival on a pad. Samples
+    are added from GStreamer streaming thread of the pad, and can be read
+    from any thread.
+
+    :param name: name of the traced pad as :class:`str`
+    """
+    __slots__ = ("name", "samples", "total", "max", "recent")
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, latency):
+        """
+        Register a buffer that arrived ``latency`` seconds after capture.
+        """
+        self.samples += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.recent.append(latency)
+
+    def get_stats(self):
+        """
+        :return: :class:`dict` describing latency in seconds, ``latency``
+            is averaged on the last :const:`LATENCY_WINDOW` samples
+        """
+        recent = tuple(self.recent)
+        samples = self.samples
+        return {"samples": samples,
+                "latency": sum(recent) / len(recent) if recent else None,
+                "average": self.total / samples if samples else None,
+                "max": self.max if samples else None}
+
+
+def get_latency_breakdown(pad_latencies):
+    """
+    Split capture-to-pad latencies into latency added by each element.
+
+    :param pad_latencies: :class:`dict` as ``{element name: (sink pads
+        latencies, source pads latencies)}``, latencies in seconds are
+        ``None`` for pads no buffer went through
+
+    :return: ``(elements, sinks)``, ``elements`` maps element names to the
+        latency they add, ``sinks`` maps names of elements without source
+        pads to latency from capture to them
+    """
+    elements = {}
+    sinks = {}
+    for name, (sink_latencies, src_latencies) in pad_latencies.items():
+        sink_latencies = [latency for latency in sink_latencies
+                          if latency is not None]
+        src_latencies = [latency for latency in src_latencies
+                         if latency is not None]
+        if not src_latencies:
+            if sink_latencies:
+                sinks[name] = max(sink_latencies)
+            continue
+        # Sources have no input, their latency is the capture one. A muxer
+        # waits for its slowest input.
+        input_latency = max(sink_latencies) if sink_latencies else 0.0
+        output_latency = sum(src_latencies) / len(src_latencies)
+        # Muxers may timestamp their output with an earlier input, it
+        # can't be less than nothing though.
+        elements[name] = max(output_latency - input_latency, 0.0)
+    return elements, sinks
+
+
+def format_latency_report(elements, sinks):
+    """
+    :param elements: latency added by each element, see
+        :func:`get_latency_breakdown`
+    :param sinks: latency from capture to each sink
+
+    :return: human readable report as :class:`str`, slowest first
+    """
+    lines = ["End-to-end latency:"]
+    for name, latency in sorted(sinks.items(), key=lambda item: -item[1]):
+        lines.append("  {:<32} {:8.1f} ms".format(name, latency * 1000))
+    lines.append("Latency added by element:")
+    for name, latency in sorted(elements.items(), key=lambda item: -item[1]):
+        lines.append("  {:<32} {:8.1f} ms".format(name, latency * 1000))
+    return "\n".join(lines)
@@ -18,6 +18,11 @@
 #
 # Copyright (c) 2016-2019 David Testé
 
+import os
+
+from gi.repository import Gst
+
+from core import reconnect
 from core import utils
 from core.gstelement import GstElement
 from core.exceptions import (GstElementInitError,
@@ -152,10 +157,20 @@ class OutputElement:
     def set_property(self, property_name, property_value):
         self.gstelement.set_property(property_name, property_value)
 
+    def get_property(self, property_name):
+        return self.gstelement.get_property(property_name)
+
 
 class StreamElement(OutputElement):
+    """
+    Stream sink sending a feed to an Icecast server.
+
+    ``ip`` and ``port`` designate the primary ingest server, the other ones
+    are given in ``backup_servers`` as a :class:`list` of ``(ip, port)`` by
+    order of preference. All servers share the same mountpoint and password.
+    """
     def __init__(self, name, ip, port, mount,
-                 password=None, **kwargs):
+                 password=None, backup_servers=None, **kwargs):
         OutputElement.__init__(self, name)
         self.ip = ip
         self.mount = mount
@@ -163,6 +178,30 @@ class StreamElement(OutputElement):
         self.password = password
         self.gstelement = self.create_gstelement(
             self.ip, self.port, self.mount, self.password, **kwargs)
+        self.reconnect_state = reconnect.ReconnectState(name)
+
+        # Formatted as [(ip, port), ...], primary server comes first.
+        self.servers = [(ip, port)] + list(backup_servers or ())
+        self.server_index = 0
+
+    @property
+    def server(self):
+        """
+        :return: current ingest server as ``(ip, port)``
+        """
+        return self.servers[self.server_index]
+
+    def set_server(self, index):
+        """
+        Target another ingest server. It's taken into account the next time
+        the sink connects.
+
+        :param index: index of the server in :attr:`servers`
+        """
+        self.server_index = index
+        self.ip, self.port = self.servers[index]
+        self.gstelement.set_property("ip", self.ip)
+        self.gstelement.set_property("port", self.port)
 
     def create_gstelement(self, ip, port, mount, password, **kwargs):
         """
@@ -185,11 +224,143 @@ class StreamElement(OutputElement):
 
 
 class StoreElement(OutputElement):
-    def __init__(self, name, path, **kwargs):
+    """
+    File sink recording a feed.
+
+    If ``segment_duration`` (in seconds) or ``segment_size`` (in bytes) is
+    given, the recording is split into several files named after ``path``
+    with the segment index, e.g. ``show_00000.webm``. A new segment is started
+    on the first keyframe after the limit is reached. Duration takes
+    precedence over size if both are given.
+
+    If ``crash_safe`` is ``True``, keyframe positions are written in an index
+    file while recording, so that the recording can be recovered with
+    :func:`~core.recovery.recover` after an interruption.
+
+    ``buffer_size`` (in bytes) and ``buffer_mode`` (``0`` full, ``1`` line,
+    ``2`` unbuffered) set write buffering of a single file recording, file
+    sink defaults are used if ``None``.
+
+    If ``fallback_directories`` are given, recording can continue in one of
+    them with :meth:`switch_directory`. Files written after a switch are
+    named like segments, e.g. ``show_00001.webm``.
+
+    Recordings that can be written in several files (see :attr:`multifile`)
+    use a multifile sink from the start, even if they never switch: write
+    buffering settings don't apply, and the sink can't seek back, so files
+    have no cues nor duration until they are remuxed (see
+    :func:`~core.recovery.needs_remux`).
+    """
+    def __init__(self, name, path, segment_duration=None, segment_size=None,
+                 crash_safe=False, buffer_size=None, buffer_mode=None,
+                 fallback_directories=None, **kwargs):
         OutputElement.__init__(self, name)
         self.location = path
+        self.segment_duration = segment_duration
+        self.segment_size = segment_size
+        self.crash_safe = crash_safe
+        self.buffer_size = buffer_size
+        self.buffer_mode = buffer_mode
+        self.fallback_directories = list(fallback_directories or [])
+        # Index of the segment being written.
+        self.segment_index = 0
+        # Directory of each file written, formatted as
+        # [(index of first file, directory), ...]
+        self._directory_changes = [(0, os.path.dirname(path))]
         self.gstelement = self.create_gstelement(path, **kwargs)
 
+    @property
+    def segmented(self):
+        return bool(self.segment_duration or self.segment_size)
+
+    @property
+    def multifile(self):
+        """
+        ``True`` if recording can be written in several files.
+        """
+        return self.segmented or bool(self.fallback_directories)
+
+    @property
+    def directories(self):
+        """
+        Recording directory followed by fallback directories.
+        """
+        return [os.path.dirname(self.location)] + self.fallback_directories
+
+    @property
+    def switched(self):
+        """
+        ``True`` if recording has been switched to a fallback directory.
+        """
+        return len(self._directory_changes) > 1
+
+    @property
+    def directory(self):
+        """
+        Directory in which the recording is currently written.
+        """
+        return self._directory_changes[-1][1]
+
+    @property
+    def directory_index(self):
+        """
+        Index of the first file written in :attr:`directory`.
+        """
+        return self._directory_changes[-1][0]
+
+    def get_directory(self, index):
+        """
+        :return: directory of the file numbered ``index`` as :class:`str`
+        """
+        for first_index, directory in reversed(self._directory_changes):
+            if index >= first_index:
+                return directory
+
+    def get_segment_path(self, index):
+        """
+        :param index: segment index as :class:`int`
+
+        :return: path of the segment as :class:`str`
+        """
+        root, extension = os.path.splitext(os.path.basename(self.location))
+        if not self.segmented and index == 0:
+            # Single file recording as long as there is no switch.
+            return self.location
+        return os.path.join(self.get_directory(index),
+                            "{}_{:05d}{}".format(root, index, extension))
+
+    def _get_location_template(self, index):
+        """
+        :return: ``location`` property of multifilesink for file numbered
+            ``index`` onwards
+        """
+        if not self.segmented and index == 0:
+            return self.location.replace("%", "%%")
+        root, extension = os.path.splitext(os.path.basename(self.location))
+        return os.path.join(self.get_directory(index).replace("%", "%%"),
+                            root.replace("%", "%%") + "_%05d" + extension)
+
+    def switch_directory(self, directory):
+        """
+        Write next files in ``directory``. It must be called from the
+        streaming thread, just before a keyframe is written. A segmented
+        recording goes on in the current file until its next segment.
+
+        :return: index of the first file written in ``directory``
+        """
+        index = self.get_property("index") + 1
+        self._directory_changes.append((index, directory))
+        self.set_property("location", self._get_location_template(index))
+        return index
+
+    def get_current_path(self):
+        """
+        :return: path of the file being written as :class:`str`
+        """
+        if self.segmented:
+            return self.get_segment_path(self.segment_index)
+        return self.location
+
     def create_gstelement(self, path, **kwargs):
         """
         Creates a GStreamer file sink.
@@ -197,10 +368,54 @@ class StoreElement(OutputElement):
         if not path:
             raise ValueError
 
+        if self.multifile:
+            return self._create_segmented_filesink(path, **kwargs)
+
         _gstelement = GstElement("filesink", self.name, **kwargs)
         if not _gstelement:
             raise GstElementInitError
         _gstelement.set_property("location", path)
         _gstelement.set_property("sync", False)
+        if self.buffer_mode is not None:
+            _gstelement.set_property("buffer-mode", self.buffer_mode)
+        if self.buffer_size is not None:
+            _gstelement.set_property("buffer-size", self.buffer_size)
 
         return _gstelement
+
+    def _create_segmented_filesink(self, path, **kwargs):
+        _gstelement = GstElement("multifilesink", self.name, **kwargs)
+        if not _gstelement:
+            raise GstElementInitError
+
+        _gstelement.set_property("location",
+                                 self._get_location_template(0))
+        _gstelement.set_property("sync", False)
+        # Stream headers (taken from caps) are written at the beginning of
+        # each segment, so each one is playable on its own as long as the
+        # muxer is streamable.
+        # Data is handled a GOP at a time, so segments start on keyframes.
+        _gstelement.set_property("aggregate-gops", True)
+        if self.segment_duration:
+            _gstelement.set_property("next-file", 5)  # max-duration
+            _gstelement.set_property(
+                "max-file-duration", int(self.segment_duration * Gst.SECOND))
+        elif not self.segmented:
+            # New file is only started on switch_directory().
+            _gstelement.set_property("next-file", 3)  # key-unit-event
+        else:
+            _gstelement.set_property("next-file", 4)  # max-size
+            _gstelement.set_property("max-file-size", int(self.segment_size))
+        # A message is posted on the bus each time a segment is closed.
+        _gstelement.set_property("post-messages", True)
+
+        return _gstelement
+
+    def on_segment_closed(self, index):
+        """
+        Register closing of segment numbered ``index``.
+
+        :return: path of the closed segment as :class:`str`
+        """
+        self.segment_index = index + 1
+        return self.get_segment_path(index)
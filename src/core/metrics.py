@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+"""
+Metrics exposed over HTTP in Prometheus text exposition format.
+
+Metrics are collected from the GLib main loop by :func:`collect_metrics`
+into a text snapshot, the HTTP server only serves the latest snapshot so
+that scraping never waits for the main loop.
+"""
+
+import http.server
+import logging
+import math
+import os
+import threading
+import time
+
+from core import reconnect
+from core import storage
+from core import telemetry
+from core import watch
+
+
+# Interval in seconds between two snapshots of metrics.
+SNAPSHOT_INTERVAL = 5
+# Metrics are only served locally by default.
+DEFAULT_ADDRESS = "127.0.0.1"
+DEFAULT_PORT = 9711
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_PATH = "/metrics"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+
+logger = logging.getLogger("core.metrics")
+
+
+def _escape_label_value(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_value(value):
+    if value is True or value is False:
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class Metric:
+    """
+    Metric family and its samples.
+
+    :param name: name of the metric
+    :param metric_type: :const:`COUNTER` or :const:`GAUGE`
+    :param description: help text of the metric
+    """
+    def __init__(self, name, metric_type, description):
+        self.name = name
+        self.type = metric_type
+        self.description = description
+        # Formatted as [(labels, value), ...]
+        self.samples = []
+
+    def add(self, value, **labels):
+        """
+        Add a sample, it's skipped if ``value`` is ``None``.
+        """
+        if value is not None:
+            self.samples.append((labels, value))
+
+    def _get_sample_name(self, labels):
+        if not labels:
+            return self.name
+        return "{}{{{}}}".format(self.name, ",".join(
+            '{}="{}"'.format(key, _escape_label_value(label_value))
+            for key, label_value in sorted(labels.items())))
+
+    def format(self):
+        """
+        :return: metric in text exposition format as :class:`str`
+        """
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} {}".format(self.name, self.type)]
+        for labels, value in self.samples:
+            lines.append("{} {}".format(self._get_sample_name(labels),
+                                        _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def get_values(self):
+        """
+        :return: :class:`dict` as ``{sample name: value}``, sample names
+            include labels as in text exposition format
+        """
+        return {self._get_sample_name(labels): float(value)
+                for labels, value in self.samples}
+
+
+class MetricSet:
+    """
+    Collection of metrics, all prefixed with ``hubangl_``.
+    """
+    def __init__(self):
+        self._metrics = {}
+
+    def add(self, name, metric_type, description, value, **labels):
+        name = "hubangl_" + name
+        metric = self._metrics.get(name)
+        if not metric:
+            metric = self._metrics[name] = Metric(name, metric_type,
+                                                  description)
+        metric.add(value, **labels)
+
+    def format(self):
+        return "".join(metric.format() for metric in self._metrics.values()
+                       if metric.samples)
+
+    def get_values(self):
+        """
+        :return: values of all samples, see :meth:`Metric.get_values`
+        """
+        values = {}
+        for metric in self._metrics.values():
+            values.update(metric.get_values())
+        return values
+
+
+def _collect_pipeline(metrics, pipeline):
+    metrics.add("pipeline_playing", GAUGE,
+                "Whether the main pipeline is broadcasting",
+                pipeline.is_playing)
+
+    for name, state in pipeline.get_stream_states().items():
+        server = "{}:{}".format(*state["server"])
+        metrics.add("stream_connected", GAUGE,
+                    "Whether the stream branch is connected to its server",
+                    state["state"] == reconnect.CONNECTED,
+                    stream=name, server=server)
+        metrics.add("stream_reconnect_attempts_total", COUNTER,
+                    "Reconnection attempts of the stream branch",
+                    state["total_attempts"], stream=name)
+        metrics.add("stream_outages_total", COUNTER,
+                    "Disconnections of the stream branch",
+                    state["outages"], stream=name)
+        metrics.add("stream_downtime_seconds_total", COUNTER,
+                    "Time spent disconnected by the stream branch",
+                    state["downtime"], stream=name)
+        metrics.add("stream_outage_buffered_bytes", GAUGE,
+                    "Data kept by the outage buffer of the stream branch",
+                    state.get("buffered_bytes"), stream=name)
+
+    for name, stats in pipeline.get_store_stats().items():
+        metrics.add("store_written_bytes_total", COUNTER,
+                    "Data written by the store branch",
+                    stats["bytes"], recording=name)
+        metrics.add("store_write_rate_bytes", GAUGE,
+                    "Recent write rate of the store branch in bytes/s",
+                    stats["rate"], recording=name)
+        metrics.add("store_buffered_bytes", GAUGE,
+                    "Data waiting in the write-behind buffer",
+                    stats["buffered_bytes"], recording=name)
+        metrics.add("store_fsync_max_seconds", GAUGE,
+                    "Longest sync to disk of the store branch",
+                    stats["max_fsync_duration"], recording=name)
+
+    for name, stats in pipeline.get_pad_stats().items():
+        metrics.add("pad_buffers_total", COUNTER,
+                    "Buffers that went through the pad",
+                    stats["buffers"], pad=name)
+        metrics.add("pad_bytes_total", COUNTER,
+                    "Data that went through the pad",
+                    stats["bytes"], pad=name)
+        metrics.add("pad_idle_seconds", GAUGE,
+                    "Time since the last buffer went through the pad",
+                    stats["idle_time"], pad=name)
+
+    for name, stats in pipeline.get_stall_stats().items():
+        metrics.add("stalled", GAUGE,
+                    "Whether data stopped flowing through the pad",
+                    stats["stalled"], pad=name)
+        metrics.add("stalls_total", COUNTER,
+                    "Times data stopped flowing through the pad, sources are"
+                    " restarted and streams reconnected each time",
+                    stats["stalls"], pad=name)
+
+    elements, sinks = pipeline.get_latency_report()
+    for name, latency in elements.items():
+        metrics.add("element_latency_seconds", GAUGE,
+                    "Recent latency added by the element",
+                    latency, element=name)
+    for name, latency in sinks.items():
+        metrics.add("end_to_end_latency_seconds", GAUGE,
+                    "Recent latency from capture to the sink",
+                    latency, sink=name)
+
+    for name, stats in pipeline.get_queue_stats().items():
+        metrics.add("queue_level_buffers", GAUGE, "Buffers in the queue",
+                    stats["buffers"], queue=name)
+        metrics.add("queue_level_bytes", GAUGE, "Data in the queue",
+                    stats["bytes"], queue=name)
+        metrics.add("queue_level_seconds", GAUGE, "Duration of data in the"
+                    " queue", stats["time"], queue=name)
+        metrics.add("queue_fill_ratio", GAUGE,
+                    "Fill ratio of the most constraining queue limit",
+                    stats["fill"], queue=name)
+        metrics.add("queue_overruns_total", COUNTER,
+                    "Buffers that reached the queue while full, they are"
+                    " dropped by leaky queues",
+                    stats["overruns"], queue=name)
+
+    for name, stats in pipeline.get_encoder_stats().items():
+        metrics.add("encoder_target_bitrate", GAUGE,
+                    "Target bitrate of the encoder in bits/s",
+                    stats.get("target_bitrate"), encoder=name)
+        metrics.add("video_dropped_frames_total", COUNTER,
+                    "Video frames dropped to keep the framerate",
+                    stats.get("dropped_frames"))
+        metrics.add("video_duplicated_frames_total", COUNTER,
+                    "Video frames duplicated to keep the framerate",
+                    stats.get("duplicated_frames"))
+        metrics.add("video_input_frames_total", COUNTER,
+                    "Video frames received from the source",
+                    stats.get("input_frames"))
+        metrics.add("video_output_frames_total", COUNTER,
+                    "Video frames sent at constant framerate",
+                    stats.get("output_frames"))
+
+    for name, stats in pipeline.get_qos_stats().items():
+        metrics.add("qos_dropped_total", COUNTER,
+                    "Frames lost or dropped for lateness by the element",
+                    stats.get("dropped"), element=name)
+        metrics.add("qos_jitter_seconds", GAUGE,
+                    "Lateness of the last frame reported by the element",
+                    stats.get("jitter"), element=name)
+        metrics.add("qos_proportion", GAUGE,
+                    "Processing rate of the element, above 1 it can't keep"
+                    " up", stats.get("proportion"), element=name)
+        metrics.add("warnings_total", COUNTER,
+                    "GStreamer warnings posted by the element",
+                    stats.get("warnings"), element=name)
+
+    av_sync = pipeline.get_av_sync_stats()
+    metrics.add("av_drift_seconds", GAUGE,
+                "Drift of audio relatively to video since the feed started",
+                av_sync["drift"])
+    metrics.add("av_correction_seconds", GAUGE,
+                "Delay applied to audio to keep it in sync with video",
+                av_sync["correction"])
+
+    health = pipeline.get_health()
+    if health:
+        metrics.add("realtime_health_score", GAUGE,
+                    "Percentage of genuine video frames sent over the last"
+                    " {}s".format(telemetry.HEALTH_WINDOW), health["score"])
+
+    directories = set()
+    for _, sinks in pipeline.store_sink_branches.items():
+        for branch in sinks["branches"]:
+            directories.update(branch[-1].directories)
+    for directory in sorted(directories):
+        metrics.add("disk_free_bytes", GAUGE,
+                    "Free space of the recording directory",
+                    storage.get_free_space(directory), directory=directory)
+
+
+def _collect_watchers(metrics):
+    watcher = watch.get_remote_watcher()
+    if not watcher:
+        return
+
+    for (host, port), element in watcher.get_elements().items():
+        state = element.get_state()
+        if state["unknown_state"]:
+            continue
+        metrics.add("remote_available", GAUGE,
+                    "Whether the remote server is reachable",
+                    state["available"], host=host, port=port)
+        latency = state["latency"]
+        metrics.add("remote_latency_seconds", GAUGE,
+                    "Ping latency of the remote server",
+                    latency / 1000 if latency is not None else None,
+                    host=host, port=port)
+
+
+def _read_proc_file(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _collect_host(metrics):
+    metrics.add("process_cpu_seconds_total", COUNTER,
+                "CPU time spent by hubangl, in user and system mode",
+                sum(os.times()[:2]))
+
+    statm = _read_proc_file("/proc/self/statm")
+    if statm:
+        metrics.add("process_resident_memory_bytes", GAUGE,
+                    "Resident memory of hubangl",
+                    int(statm.split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+
+    stat = _read_proc_file("/proc/stat")
+    if stat:
+        # First line is formatted as "cpu user nice system idle iowait ..."
+        # in clock ticks.
+        ticks = stat.splitlines()[0].split()[1:]
+        for mode, index in (("user", 0), ("system", 2), ("idle", 3),
+                            ("iowait", 4)):
+            metrics.add("host_cpu_seconds_total", COUNTER,
+                        "CPU time spent by the host in each mode",
+                        int(ticks[index]) / os.sysconf("SC_CLK_TCK"),
+                        mode=mode)
+
+    meminfo = _read_proc_file("/proc/meminfo")
+    if meminfo:
+        for line in meminfo.splitlines():
+            if line.startswith("MemAvailable:"):
+                metrics.add("host_memory_available_bytes", GAUGE,
+                            "Memory available on the host",
+                            int(line.split()[1]) * 1024)
+
+    metrics.add("host_load1", GAUGE, "Load average of the host over 1 min",
+                os.getloadavg()[0])
+
+
+def collect_metric_set(pipeline):
+    """
+    Collect metrics of ``pipeline``, watchers and host. It must be called
+    from the GLib main loop.
+
+    :param pipeline: :class:`~core.process.Pipeline`
+
+    :return: :class:`MetricSet`
+    """
+    metrics = MetricSet()
+    _collect_pipeline(metrics, pipeline)
+    _collect_watchers(metrics)
+    _collect_host(metrics)
+    metrics.add("snapshot_timestamp_seconds", GAUGE,
+                "Time at which metrics were collected", time.time())
+    return metrics
+
+
+def collect_metrics(pipeline):
+    """
+    :return: metrics of ``pipeline``, watchers and host in text exposition
+        format as :class:`str`, see :func:`collect_metric_set`
+    """
+    return collect_metric_set(pipeline).format()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+
+        body = self.server.snapshot.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("{} {}".format(self.address_string(), format % args))
+
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server exposing the latest metrics snapshot on
+    :const:`METRICS_PATH`.
+
+    :param address: address to listen on
+    :param port: port to listen on, ``0`` to pick a free one
+    """
+    daemon_threads = True
+
+    def __init__(self, address=DEFAULT_ADDRESS, port=DEFAULT_PORT):
+        super().__init__((address, port), _MetricsHandler)
+        #: Text served to scrapers, replaced as a whole on update.
+        self.snapshot = ""
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True, name="metrics_server")
+        self._thread.start()
+        logger.info("Metrics available on http://{}:{}{}".format(
+            self.server_address[0], self.server_address[1], METRICS_PATH))
+
+    def stop(self):
+        if not self._thread:
+            return
+
+        self.shutdown()
+        self.server_close()
+        self._thread = None
+
+    def set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+
+
+_server = None
+
+
+def setup(port=DEFAULT_PORT, address=DEFAULT_ADDRESS):
+    """
+    Create and start the metrics server.
+
+    :return: :class:`MetricsServer` or ``None`` if it couldn't be started
+    """
+    global _server
+    shutdown()
+    try:
+        _server = MetricsServer(address, port)
+    except OSError as e:
+        logger.error("Could not start metrics server on {}:{} ({})".format(
+            address, port, e))
+        return None
+    _server.start()
+    return _server
+
+
+def get_server():
+    """
+    :return: :class:`MetricsServer` or ``None`` if metrics are not enabled
+    """
+    return _server
+
+
+def shutdown():
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+"""
+Post-processing of finished recordings.
+
+Each job runs in its own process, started with the lowest CPU and I/O
+priority, so that post-processing never competes with a live capture. At
+most :const:`POSTPROCESS_WORKERS` processes run at the same time.
+"""
+
+import array
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from core import recovery
+
+
+# Jobs run on each finished recording, in this order. Remuxing only
+# rewrites recordings that are not seekable (e.g. streamable segments).
+POSTPROCESS_JOBS = ("remux", "checksum")
+# Maximum number of jobs running at the same time.
+POSTPROCESS_WORKERS = 1
+# Niceness of job processes.
+POSTPROCESS_NICENESS = 19
+# Number of finished jobs kept for status reporting.
+JOB_HISTORY_SIZE = 50
+
+# Encoding profile of archive copies, as accepted by GStreamer
+# ``uritranscodebin``.
+ARCHIVE_PROFILE = "video/webm:video/x-vp8:audio/x-vorbis"
+ARCHIVE_SUFFIX = "_archive.webm"
+CHECKSUM_SUFFIX = ".sha256"
+WAVEFORM_SUFFIX = ".waveform.json"
+# Sample rate in Hz at which audio is decoded to compute waveform.
+WAVEFORM_SAMPLE_RATE = 8000
+# Number of audio samples summarized by a point of the waveform.
+WAVEFORM_SAMPLES_PER_POINT = 800
+# Suffix of files being written by a job, they are renamed once complete.
+PARTIAL_SUFFIX = ".part"
+
+GST_LAUNCH = "gst-launch-1.0"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+logger = logging.getLogger("core.postprocess")
+
+
+class PostProcessError(Exception):
+    pass
+
+
+def get_checksum_path(path):
+    return path + CHECKSUM_SUFFIX
+
+
+def get_archive_path(path):
+    return os.path.splitext(path)[0] + ARCHIVE_SUFFIX
+
+
+def get_waveform_path(path):
+    return path + WAVEFORM_SUFFIX
+
+
+def _run_gst_launch(*args, stdout=subprocess.DEVNULL):
+    if not shutil.which(GST_LAUNCH):
+        raise PostProcessError("{} is not installed".format(GST_LAUNCH))
+
+    process = subprocess.Popen((GST_LAUNCH, "-q") + args, stdout=stdout,
+                               stderr=subprocess.PIPE)
+    return process
+
+
+def _check_gst_launch(process):
+    _, stderr = process.communicate()
+    if process.returncode:
+        raise PostProcessError(stderr.decode(errors="replace").strip()
+                               or "{} failed".format(GST_LAUNCH))
+
+
+def remux(path):
+    """
+    Rewrite a recording with a seek index, see :func:`core.recovery.recover`.
+    Recordings that are already seekable are left as is, see
+    :func:`core.recovery.needs_remux`.
+    """
+    if not recovery.needs_remux(path):
+        logger.info("{} is already seekable, not remuxed".format(path))
+        return
+
+    result = recovery.recover(path, in_place=True)
+    logger.info("Remuxed {} ({})".format(
+        path, ", ".join("{}: {}".format(key, value)
+                        for key, value in sorted(result.items())
+                        if key != "output")))
+
+
+def checksum(path):
+    """
+    Write SHA-256 checksum of a recording next to it, in a format
+    understood by ``sha256sum --check``.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    with open(get_checksum_path(path), "w") as f:
+        f.write("{}  {}\n".format(digest.hexdigest(), os.path.basename(path)))
+
+
+def transcode(path):
+    """
+    Transcode a recording to :const:`ARCHIVE_PROFILE`.
+    """
+    output = get_archive_path(path)
+    partial = output + PARTIAL_SUFFIX
+    process = _run_gst_launch(
+        "uritranscodebin",
+        "source-uri=" + pathlib.Path(path).absolute().as_uri(),
+        "dest-uri=" + pathlib.Path(partial).absolute().as_uri(),
+        "profile=" + ARCHIVE_PROFILE)
+    try:
+        _check_gst_launch(process)
+    except PostProcessError:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, output)
+
+
+def compute_peaks(stream, samples_per_point):
+    """
+    Compute minimum and maximum values of audio samples per chunk of
+    ``samples_per_point`` samples.
+
+    :param stream: binary file object giving signed 16 bits little-endian
+        mono samples
+    :param samples_per_point: number of samples per chunk
+
+    :return: :class:`list` of alternating minimum and maximum values
+    """
+    peaks = []
+    chunk_size = samples_per_point * 2
+    remainder = b""
+    while True:
+        data = stream.read(chunk_size - len(remainder))
+        if not data:
+            break
+        data = remainder + data
+        if len(data) < chunk_size:
+            remainder = data
+            continue
+
+        remainder = b""
+        samples = array.array("h", data)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        peaks.extend((min(samples), max(samples)))
+
+    if len(remainder) >= 2:
+        samples = array.array("h", remainder[:len(remainder) // 2 * 2])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        peaks.extend((min(samples), max(samples)))
+
+    return peaks
+
+
+def waveform(path):
+    """
+    Write waveform of a recording audio track next to it. It uses the JSON
+    format of BBC ``audiowaveform`` tool, understood by most web players.
+    """
+    caps = "audio/x-raw,format=S16LE,channels=1,rate={}".format(
+        WAVEFORM_SAMPLE_RATE)
+    process = _run_gst_launch(
+        "uridecodebin", "uri=" + pathlib.Path(path).absolute().as_uri(),
+        "!", "audioconvert", "!", "audioresample", "!", caps,
+        "!", "fdsink", "fd=1",
+        stdout=subprocess.PIPE)
+    # Stderr is only read once stdout is drained, errors are short enough
+    # to fit in the pipe buffer.
+    peaks = compute_peaks(process.stdout, WAVEFORM_SAMPLES_PER_POINT)
+    _check_gst_launch(process)
+
+    output = get_waveform_path(path)
+    with open(output + PARTIAL_SUFFIX, "w") as f:
+        json.dump({"version": 2,
+                   "channels": 1,
+                   "sample_rate": WAVEFORM_SAMPLE_RATE,
+                   "samples_per_pixel": WAVEFORM_SAMPLES_PER_POINT,
+                   "bits": 16,
+                   "length": len(peaks) // 2,
+                   "data": peaks}, f)
+    os.replace(output + PARTIAL_SUFFIX, output)
+
+
+JOBS = collections.OrderedDict((("remux", remux),
+                                ("checksum", checksum),
+                                ("transcode", transcode),
+                                ("waveform", waveform)))
+
+
+class Job:
+    """
+    Post-processing job of a recording.
+
+    :param name: name of the job, a key of :const:`JOBS`
+    :param path: path of the recording
+    """
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.state = PENDING
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self):
+        if self.start_time is None:
+            return None
+        end_time = self.end_time or time.monotonic()
+        return end_time - self.start_time
+
+    def __repr__(self):
+        return "<Job {} {} ({})>".format(self.name, self.path, self.state)
+
+
+def _get_job_command(name, path):
+    """
+    :return: command running a job as :class:`list`
+    """
+    command = [sys.executable, "-m", "core.postprocess", name, path]
+    if shutil.which("ionice"):
+        # Idle I/O scheduling class.
+        command = ["ionice", "-c", "3"] + command
+    if shutil.which("nice"):
+        command = ["nice", "-n", str(POSTPROCESS_NICENESS)] + command
+    return command
+
+
+class PostProcessor:
+    """
+    Run post-processing jobs on finished recordings. Jobs of a recording are
+    run sequentially, several recordings can be processed concurrently.
+
+    :param jobs: names of jobs to run, default to :const:`POSTPROCESS_JOBS`
+    :param workers: maximum number of jobs running at the same time, default
+        to :const:`POSTPROCESS_WORKERS`
+    """
+    def __init__(self, jobs=None, workers=None):
+        self.jobs = tuple(jobs if jobs is not None else POSTPROCESS_JOBS)
+        for name in self.jobs:
+            if name not in JOBS:
+                raise ValueError("Unknown post-processing job: " + name)
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers or POSTPROCESS_WORKERS,
+            thread_name_prefix="postprocess")
+        self._lock = threading.Lock()
+        self._is_shutting_down = False
+        # Jobs not finished yet, in submission order.
+        self._jobs = []
+        self._history = collections.deque(maxlen=JOB_HISTORY_SIZE)
+        self._processes = set()
+
+    def submit(self, path, callback=None):
+        """
+        Schedule post-processing of a finished recording.
+
+        :param path: path of the recording
+        :param callback: function called with ``path`` as argument once all
+            jobs are finished, successfully or not
+
+        :return: :class:`list` of :class:`Job` created
+        """
+        jobs = [Job(name, path) for name in self.jobs]
+        if not jobs:
+            if callback:
+                callback(path)
+            return jobs
+
+        with self._lock:
+            if self._is_shutting_down:
+                return []
+            self._jobs.extend(jobs)
+        logger.info("Post-processing of {} scheduled ({})".format(
+            path, ", ".join(self.jobs)))
+        self._executor.submit(self._run_jobs, jobs, callback)
+        return jobs
+
+    def _run_jobs(self, jobs, callback=None):
+        for job in jobs:
+            with self._lock:
+                if self._is_shutting_down:
+                    return
+                job.state = RUNNING
+                job.start_time = time.monotonic()
+
+            try:
+                self._run_job(job)
+            except Exception as e:
+                job.error = str(e)
+            job.end_time = time.monotonic()
+
+            with self._lock:
+                if job.state == RUNNING:
+                    job.state = FAILED if job.error else DONE
+                self._jobs.remove(job)
+                self._history.append(job)
+
+            if job.state == DONE:
+                logger.info("Post-processing job '{}' done on {} in {:.1f}s"
+                            .format(job.name, job.path, job.duration))
+            elif job.state == FAILED:
+                logger.error("Post-processing job '{}' failed on {} ({})"
+                             .format(job.name, job.path, job.error))
+
+        if callback and not self._is_shutting_down:
+            try:
+                callback(jobs[0].path)
+            except Exception:
+                logger.exception("Unexpected error in post-processing"
+                                 " callback")
+
+    def _run_job(self, job):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, (os.path.dirname(os.path.dirname(__file__)),
+                          env.get("PYTHONPATH"))))
+        process = subprocess.Popen(_get_job_command(job.name, job.path),
+                                   env=env, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE)
+        with self._lock:
+            self._processes.add(process)
+        try:
+            _, stderr = process.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+        if process.returncode:
+            lines = stderr.decode(errors="replace").strip().splitlines()
+            raise PostProcessError(
+                lines[-1] if lines
+                else "exited with code {}".format(process.returncode))
+
+    def get_jobs(self):
+        """
+        :return: :class:`list` of unfinished jobs followed by the last
+            finished ones
+        """
+        with self._lock:
+            return list(self._jobs) + list(reversed(self._history))
+
+    def get_summary(self):
+        """
+        :return: :class:`dict` giving number of jobs per state
+        """
+        summary = {state: 0
+                   for state in (PENDING, RUNNING, DONE, FAILED, CANCELLED)}
+        for job in self.get_jobs():
+            summary[job.state] += 1
+        return summary
+
+    def shutdown(self):
+        """
+        Cancel pending jobs and stop running ones. Files being written by
+        jobs are left unfinished but original recordings are untouched.
+        """
+        with self._lock:
+            self._is_shutting_down = True
+            for job in self._jobs:
+                job.state = CANCELLED
+            processes = tuple(self._processes)
+            if self._jobs:
+                logger.warning("Post-processing cancelled for {}".format(
+                    ", ".join(sorted({job.path for job in self._jobs}))))
+
+        for process in processes:
+            process.terminate()
+        self._executor.shutdown(wait=False)
+
+
+_postprocessor = None
+
+
+def get_postprocessor():
+    """
+    Get the post-processor, it's created on first call.
+
+    :return: :class:`PostProcessor`
+    """
+    global _postprocessor
+    if _postprocessor is None:
+        _postprocessor = PostProcessor()
+    return _postprocessor
+
+
+def shutdown():
+    global _postprocessor
+    if _postprocessor is not None:
+        _postprocessor.shutdown()
+        _postprocessor = None
+
+
+def run_job(name, path):
+    """
+    Run a job in the current process.
+
+    :raise: :class:`PostProcessError` or :class:`OSError` if the job fails
+    """
+    try:
+        JOBS[name](path)
+    except recovery.RecoveryError as e:
+        raise PostProcessError(str(e))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a post-processing job on a recording.")
+    parser.add_argument("job", choices=tuple(JOBS))
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="[%(levelname)s] %(message)s",
+                        level=logging.WARNING)
+    try:
+        run_job(args.job, args.path)
+    except (OSError, PostProcessError) as e:
+        sys.exit("{}: {}".format(args.job, e))
@@ -19,17 +19,33 @@
 #
 # Copyright (c) 2016-2019 David Testé
 
+import collections
 import logging
+import os
 import pathlib
+import threading
+import time
 
 from gi.repository import Gst
 from gi.repository import GLib
+from gi.repository import GstVideo
 
+from core import debuglog
+from core import graph
+from core import instrumentation
 from core import iofetch
 from core import ioelements
+from core import profiling
+from core import reconnect
+from core import recovery
+from core import storage
+from core import telemetry
+from core import watch
+from core import watchdog
 from core.gstelement import GstElement
 from core.exceptions import (TeePatchingError,
                              AddingElementError,
+                             LinkingElementError,
                              NotAudioVideoSource,
                              ElementAlreadyAdded,
                              TransportElementNotFound)
@@ -49,8 +65,109 @@ AUDIO_VIDEO_STREAM = "audiovideo"
 VIDEO_ONLY_STREAM = "video"
 AUDIO_ONLY_STREAM = "audio"
 
-# Time to wait in seconds before trying to reconnect to an Icecast server.
-RECONNECT_INTERVAL = 5
+# Time in seconds a stream branch must run without error after a
+# reconnection attempt to be considered as connected again.
+RECONNECT_STABLE_DELAY = 10
+
+# Outage buffer of stream branches, it keeps encoded data while the Icecast
+# server is unreachable and sends it once reconnected.
+# Sending the backlog faster than realtime is not supported: stream sinks
+# never wait for the clock already, but shout2send waits for libshout's
+# pacing before each write and it can't be turned off. A stream thus resumes
+# behind live by the backlog it kept, at most OUTAGE_BUFFER_DURATION, until
+# it's restarted. This delay is logged and reported as ``buffered_time`` by
+# Pipeline.get_stream_states().
+OUTAGE_BUFFER_ENABLED = False
+# Duration in seconds of data kept, oldest data is dropped first.
+OUTAGE_BUFFER_DURATION = 30
+# Maximum memory in bytes used by each outage buffer.
+OUTAGE_BUFFER_MAX_BYTES = 64 * 1024 * 1024
+
+# Write an index of keyframe positions along recordings, so that they can be
+# recovered after an interruption.
+CRASH_SAFE_RECORDING = False
+
+# Size in bytes of file sink write buffer, larger buffers mean fewer and
+# bigger writes. File sink default is used if ``None``. Data in this buffer
+# isn't covered by periodic syncs, it's written once the recording is
+# closed. Recordings written in several files (segments, fallback
+# directories) aren't buffered this way, see core.ioelements.StoreElement.
+STORE_BUFFER_SIZE = 1024 * 1024
+# Buffering mode of file sink (0: full, 1: line, 2: unbuffered), file sink
+# default is used if ``None``.
+STORE_BUFFER_MODE = None
+# Interval in seconds between two syncs of recordings to disk, recordings
+# are synced only by the OS if 0. Closed recordings are synced entirely, see
+# core.storage.FileSyncer.
+STORE_FSYNC_INTERVAL = 5
+# Store branch queue acts as a write-behind buffer run by its own thread,
+# so that bursty disk latency doesn't back up into the tee.
+STORE_WRITER_THREAD = True
+# Limits of the write-behind buffer.
+STORE_WRITE_BUFFER_MAX_TIME = 10
+STORE_WRITE_BUFFER_MAX_BYTES = 128 * 1024 * 1024
+
+# Store branches having fallback directories switch to the next one when
+# free space of the current one gets below this value in bytes.
+STORE_MIN_FREE_SPACE = 1024 * 1024 * 1024
+# Interval in seconds between two checks of free space.
+STORE_SPACE_CHECK_INTERVAL = 10
+
+# Count buffers and bytes flowing through key pads of the pipeline, see
+# Pipeline.get_pad_stats(). No probe is attached when disabled, unless
+# the stall watchdog is enabled.
+PAD_STATS_ENABLED = False
+
+# Measure latency from capture to each pad of the pipeline while playing,
+# see Pipeline.set_latency_tracing(). It can be toggled at runtime.
+LATENCY_TRACING_ENABLED = False
+
+# Interval in seconds between two samples of queue levels, see
+# Pipeline.get_queue_stats(). Queues are not observed if 0.
+QUEUE_SAMPLE_INTERVAL = 1
+
+# Interval in seconds between two samples of video frame counters, see
+# Pipeline.get_health(). Health isn't computed if 0.
+HEALTH_SAMPLE_INTERVAL = 1
+
+# Measure drift between audio and video of the audiovideo feed, see
+# Pipeline.get_av_sync_stats().
+AV_SYNC_MONITORING = True
+# Delay in milliseconds applied to audio of the audiovideo feed, video is
+# delayed if it's negative.
+AV_SYNC_OFFSET = 0
+# Compensate drift automatically once it exceeds this threshold in
+# milliseconds, drift is only reported if 0.
+AV_SYNC_AUTO_THRESHOLD = 0
+# Drift in milliseconds above which a warning is logged.
+AV_SYNC_WARNING_DRIFT = 40
+
+# Time in seconds without any buffer going through a source, an encoder or
+# an output sink after which it's considered stalled, and restarted if
+# possible. Data flow isn't watched if 0, since watching it requires the
+# pad probes of PAD_STATS_ENABLED.
+STALL_TIMEOUT = 0
+STALL_CHECK_INTERVAL = 1
+# Encoders feeding output branches of each feed type.
+FEED_ENCODERS = {"audio": ("vorbis_encoder",),
+                 "video": ("vp8_encoder",),
+                 "audiovideo": ("vorbis_encoder", "vp8_encoder")}
+
+# Interval in seconds between two checks of ingest servers availability for
+# stream branches having backup servers.
+FAILOVER_CHECK_INTERVAL = 1
+
+# Video preview displayed in the monitor:
+PREVIEW_ENABLED = True
+# Maximum framerate of the preview, 0 means no limit.
+PREVIEW_MAX_FRAMERATE = 10
+# Size of the frames produced by the video process.
+VIDEO_WIDTH = 1280
+VIDEO_HEIGHT = 720
+
+# Placeholder renders its card once and displays it as a still frame,
+# instead of an animated pattern.
+PLACEHOLDER_IDLE_MODE = True
 
 logger = logging.getLogger("core.process")
 
@@ -59,11 +176,18 @@ class PlaceholderPipeline:
     """
     Pipeline used as a placeholder waiting for user to select a audio and/or
     a video source.
+
+    :param idle_mode: if ``True`` the placeholder card is rendered only once
+        and then displayed as a still frame at 1 fps, otherwise it's rendered
+        continuously over an animated snow pattern
     """
-    def __init__(self):
+    def __init__(self, idle_mode=None):
+        self.idle_mode = (PLACEHOLDER_IDLE_MODE if idle_mode is None
+                          else idle_mode)
         self.pipeline = Gst.Pipeline()
         self.pipeline_elements = self._create_elements()
         self.is_playing = False
+        self.is_paused = False
 
         self._build_pipeline(*self.pipeline_elements)
 
@@ -80,13 +204,20 @@ class PlaceholderPipeline:
     def _create_elements(self):
         self.video_source = Gst.ElementFactory.make(
             "videotestsrc", "video_source_placeholder")
-        self.video_source.set_property("pattern", 1)  # snow pattern
+        if self.idle_mode:
+            self.video_source.set_property("pattern", 2)  # black pattern
+            # Only one frame is rendered, imagefreeze repeats it.
+            self.video_source.set_property("num-buffers", 1)
+            framerate = "1/1"
+        else:
+            self.video_source.set_property("pattern", 1)  # snow pattern
+            framerate = "24/1"
 
         caps_string = ("video/x-raw,"
                        + "format=I420,"
                        + "width=1280,"  # TODO: adjust value
                        + "height=720,"  # TODO: adjust value
-                       + "framerate=24/1")
+                       + "framerate=" + framerate)
         caps = Gst.caps_from_string(caps_string)
         self.capsfilter = Gst.ElementFactory.make("capsfilter", "capsfilter")
         self.capsfilter.set_property("caps", caps)
@@ -112,8 +243,22 @@ class PlaceholderPipeline:
         self.screen_sink = Gst.ElementFactory.make(
             "xvimagesink", "screen_sink_placeholder")
 
+        if not self.idle_mode:
+            return (self.video_source, self.capsfilter, self.text_overlay,
+                    self.image_overlay, self.video_convert, self.screen_sink)
+
+        self.image_freeze = Gst.ElementFactory.make(
+            "imagefreeze", "image_freeze_placeholder")
+        # imagefreeze outputs the framerate negotiated downstream, which
+        # is 25 fps by default.
+        self.freeze_capsfilter = Gst.ElementFactory.make(
+            "capsfilter", "freeze_capsfilter_placeholder")
+        self.freeze_capsfilter.set_property(
+            "caps", Gst.caps_from_string("video/x-raw,framerate=1/1"))
+
         return (self.video_source, self.capsfilter, self.text_overlay,
-                self.image_overlay, self.video_convert, self.screen_sink)
+                self.image_overlay, self.video_convert, self.image_freeze,
+                self.freeze_capsfilter, self.screen_sink)
 
     def set_play_state(self):
         """
@@ -121,6 +266,7 @@ class PlaceholderPipeline:
         """
         self.pipeline.set_state(Gst.State.PLAYING)
         self.is_playing = True
+        self.is_paused = False
         logger.debug("[placeholder pipeline] Switched to PLAY state")
 
     def set_stop_state(self):
@@ -129,8 +275,28 @@ class PlaceholderPipeline:
         """
         self.pipeline.set_state(Gst.State.NULL)
         self.is_playing = False
+        self.is_paused = False
         logger.debug("[placeholder pipeline] Switched to STOP state")
 
+    def set_pause_state(self):
+        """
+        Set pipeline instance to PAUSED state if it's playing, e.g. while
+        nothing can be displayed.
+        """
+        if not self.is_playing or self.is_paused:
+            return
+
+        self.pipeline.set_state(Gst.State.PAUSED)
+        self.is_paused = True
+        logger.debug("[placeholder pipeline] Switched to PAUSE state")
+
+    def resume(self):
+        """
+        Set pipeline instance back to PLAYING state if it has been paused.
+        """
+        if self.is_paused:
+            self.set_play_state()
+
     def is_playing_state(self):
         """
         Return ``True`` if pipeline instance is in playing state.
@@ -152,14 +318,68 @@ class Pipeline:
         self.is_preview_state = False
         self.is_playing = False
 
+        self.preview_enabled = PREVIEW_ENABLED
+        self.preview_max_framerate = PREVIEW_MAX_FRAMERATE
+        self.preview_size = (VIDEO_WIDTH, VIDEO_HEIGHT)
+
         # Map fakesink to tee element
         self._output_tee_pool = {}
+        # Map name of stream sinks having an outage buffer to their
+        # reconnect.OutageGate.
+        self._outage_gates = {}
+        self._failover_check_id = None
+        self._space_check_id = None
+        # Map store sink name to directory it's switching to.
+        self._pending_directory_switches = {}
+        # Switches are done from streaming threads.
+        self._directory_switch_lock = threading.Lock()
+        # Functions called with (sink, path) each time a recording file is
+        # closed.
+        self._recording_callbacks = []
+        # Map store sink name to state of its recovery index.
+        self._recovery_indexes = {}
+        # Map store sink name to its WriteStats.
+        self._write_stats = {}
+        # Map store sink name to its FileSyncer.
+        self._file_syncers = {}
+        # Map instrumented pad name to its PadCounters.
+        self._pad_counters = {}
+        # Map instrumented pad name to the pad.
+        self._counted_pads = {}
+        # Map queue name to its QueueMonitor.
+        self._queue_monitors = {}
+        # Map queue name to the queue element whose overruns are counted.
+        # Branches are rebuilt with queues of the same name.
+        self._monitored_queues = {}
+        self._queue_sample_id = None
+        # Map element name to its QosStats.
+        self._qos_stats = {}
+        # Number of warnings posted by each element.
+        self._warnings = collections.Counter()
+        self._health = telemetry.RealtimeHealth()
+        self._health_stats = None
+        self._health_degraded = False
+        self._health_sample_id = None
+        self._av_sync = telemetry.AvSyncMonitor()
+        # Delay in seconds applied to audio by automatic drift correction.
+        self._av_sync_correction = 0.0
+        # Delays in seconds of audio and video entering the audiovideo muxer.
+        self._av_delays = (0.0, 0.0)
+        self._av_sync_warned = False
+        self._av_sync_check_id = None
+        self._watchdog = watchdog.StallWatchdog(STALL_TIMEOUT)
+        self._stall_check_id = None
+        self.latency_tracing = LATENCY_TRACING_ENABLED
+        # Map traced pad name to (pad, probe_id, element name, LatencyStats).
+        self._latency_probes = {}
+        self._last_error_dump = None
 
         self.speaker_volume = None
 
-        self.audio_sources = self.create_audio_sources()
-        self.video_sources = self.create_video_sources()
-        self.speaker_sinks = self.get_speaker_sinks()
+        with profiling.phase("Device discovery"):
+            self.audio_sources = self.create_audio_sources()
+            self.video_sources = self.create_video_sources()
+            self.speaker_sinks = self.get_speaker_sinks()
         #: GstElement used in the pipeline
         self.speaker_sink = None
 
@@ -173,36 +393,40 @@ class Pipeline:
                                     "video": {"tee": None, "branches": []},
                                     "audiovideo": {"tee": None, "branches": []}}
 
-        (self.audio_process_source,
-         self.audio_process_branch1,
-         self.audio_process_branch2,
-         self.audio_process_branch3,
-         self.audio_muxer_source) = self.create_audio_process()
-
-        (self.video_process_source,
-         self.video_process_branch1,
-         self.video_process_branch2,
-         self.video_process_branch3,
-         self.video_muxer_source) = self.create_video_process()
-
-        (self.av_process_branch1,
-         self.av_process_branch2,
-         self.av_process_branch3) = self.create_audiovideo_process(
-             self.audio_muxer_source,
-             self.video_muxer_source)
-
-        self.build_pipeline(self.pipeline,
-                            self.audio_process_source,
-                            self.audio_process_branch1,
-                            self.audio_process_branch2,
-                            self.audio_process_branch3,
-                            self.video_process_source,
-                            self.video_process_branch1,
-                            self.video_process_branch2,
-                            self.video_process_branch3,
-                            self.av_process_branch1,
-                            self.av_process_branch2,
-                            self.av_process_branch3,)
+        with profiling.phase("Pipeline construction"):
+            (self.audio_process_source,
+             self.audio_process_branch1,
+             self.audio_process_branch2,
+             self.audio_process_branch3,
+             self.audio_muxer_source) = self.create_audio_process()
+
+            (self.video_process_source,
+             self.video_process_branch1,
+             self.video_process_branch2,
+             self.video_process_branch3,
+             self.video_muxer_source) = self.create_video_process()
+
+            (self.av_process_branch1,
+             self.av_process_branch2,
+             self.av_process_branch3) = self.create_audiovideo_process(
+                 self.audio_muxer_source,
+                 self.video_muxer_source)
+
+            self.build_pipeline(self.pipeline,
+                                self.audio_process_source,
+                                self.audio_process_branch1,
+                                self.audio_process_branch2,
+                                self.audio_process_branch3,
+                                self.video_process_source,
+                                self.video_process_branch1,
+                                self.video_process_branch2,
+                                self.video_process_branch3,
+                                self.av_process_branch1,
+                                self.av_process_branch2,
+                                self.av_process_branch3,)
+            self._instrument_pipeline()
+            if AV_SYNC_MONITORING:
+                self._watch_av_sync()
 
     def set_play_state(self):
         """
@@ -218,6 +442,25 @@ class Pipeline:
             self.pipeline.set_state(Gst.State.PLAYING)
             self.is_playing = True
             logger.debug("[main pipeline] Switched to PLAY state")
+            self._start_failover_check()
+            self._start_space_check()
+            self._start_queue_sampling()
+            self._start_health_sampling()
+            self._start_av_sync_check()
+            self._start_stall_check()
+            self._start_file_syncers()
+            if self.latency_tracing:
+                self._trace_latency()
+
+    def is_streaming(self):
+        """
+        :return: ``True`` if the pipeline is playing with at least one
+            streaming branch connected to its server, ``False`` otherwise
+        """
+        return self.is_playing and any(
+            branch[-1].reconnect_state.state == reconnect.CONNECTED
+            for sinks in self.stream_sink_branches.values()
+            for branch in sinks["branches"])
 
     def set_pause_state(self):
         """
@@ -236,6 +479,8 @@ class Pipeline:
         Set pipeline instance to NULL state and end broadcasting, then
         the pipeline gets back to preview mode.
         """
+        self._untrace_latency()
+        self._log_av_sync()
         self.remove_output_branches()
 
         self.set_null_state()
@@ -347,6 +592,50 @@ class Pipeline:
         if alpha:
             self.image_overlay.set_property("alpha", alpha)
 
+    def set_preview_enabled(self, value):
+        """
+        Enable or disable the video preview displayed in the monitor.
+        When disabled, frames are dropped before being scaled.
+
+        :param value: :class:`bool`
+        """
+        self.preview_enabled = value
+        self.preview_valve.set_property("drop", not value)
+        logger.info("Video preview is {}".format(
+            "enabled" if value else "disabled"))
+
+    def set_preview_framerate(self, framerate):
+        """
+        Limit the framerate of the video preview.
+
+        :param framerate: maximum number of frames per second as :class:`int`,
+            ``0`` means no limit
+        """
+        self.preview_max_framerate = framerate
+        self.preview_rate.set_property("max-rate", framerate or 2**31 - 1)
+
+    def set_preview_size(self, width, height):
+        """
+        Scale down the video preview to fit in ``width`` x ``height``,
+        keeping aspect ratio. The preview is never scaled up.
+
+        :param width: available width in pixels
+        :param height: available height in pixels
+        """
+        ratio = min(width / VIDEO_WIDTH, height / VIDEO_HEIGHT, 1)
+        # I420 format requires even dimensions.
+        size = (max(int(VIDEO_WIDTH * ratio) // 2 * 2, 2),
+                max(int(VIDEO_HEIGHT * ratio) // 2 * 2, 2))
+        if size == self.preview_size:
+            return
+
+        self.preview_size = size
+        caps = Gst.caps_from_string(
+            "video/x-raw,width={},height={}".format(*size))
+        self.preview_capsfilter.set_property("caps", caps)
+        logger.debug("[main pipeline] Preview size set to {}x{}".format(
+            *size))
+
     def mute_audio_input(self, value):
         """
         Mute or unmute the audio input source based on ``value``.
@@ -548,16 +837,48 @@ class Pipeline:
         Perform auto reconnect to the icecast server. It assumes that
         ``message`` was emitted from stream sink element.
 
+        Time to wait before reconnecting grows exponentially with each failed
+        attempt, see :class:`~core.reconnect.ReconnectState`.
+
         :param message: GStreamer bus message
         """
-        for feed_type, sinks in self.stream_sink_branches.items():
+        for _, sinks in self.stream_sink_branches.items():
             for branch in sinks["branches"]:
                 if message.src == branch[-1].gstelement.gstelement:
-                    pad = branch[0].gstelement.get_static_pad("sink")
-                    tee_pad = pad.get_peer()
-                    tee_pad.add_probe(Gst.PadProbeType.BLOCK_DOWNSTREAM,
-                                      self._on_stream_down, {"branch": branch})
-                    break
+                    self._reconnect_branch(branch)
+                    return
+
+    def _reconnect_branch(self, branch):
+        """
+        Unlink stream ``branch`` from its tee and schedule its reconnection.
+        """
+        sink = branch[-1]
+        delay = sink.reconnect_state.on_failure()
+        if delay is None:
+            # Branch is already waiting for reconnection.
+            return
+
+        index = self._get_failover_server(sink)
+        if index is not None:
+            logger.warning("Stream '{}' fails over to {}:{}".format(
+                sink.name, *sink.servers[index]))
+            sink.set_server(index)
+            if sink.reconnect_state.attempts < len(sink.servers):
+                # Each server is tried once without waiting.
+                delay = 0
+
+        pad = branch[0].gstelement.get_static_pad("sink")
+        tee_pad = pad.get_peer()
+        if sink.name in self._outage_gates:
+            # Queue stays linked to the tee and fills up while its streaming
+            # thread waits in the outage gate.
+            GLib.timeout_add(int(delay * 1000),
+                             self._reconnect_stream, tee_pad, branch)
+            return
+
+        tee_pad.add_probe(Gst.PadProbeType.BLOCK_DOWNSTREAM,
+                          self._on_stream_down,
+                          {"branch": branch, "delay": delay})
 
     def _on_stream_down(self, pad, info, user_data):
         Gst.Pad.remove_probe(pad, info.id)
@@ -568,13 +889,86 @@ class Pipeline:
             if isinstance(element, ioelements.OutputElement):
                 element = element.gstelement
             element.gstelement.set_state(Gst.State.NULL)
-        GLib.timeout_add_seconds(RECONNECT_INTERVAL, self._reconnect_stream, pad, branch)
+        GLib.timeout_add(int(user_data["delay"] * 1000),
+                         self._reconnect_stream, pad, branch)
         return Gst.PadProbeReturn.OK
 
+    def _on_outage_buffer_push(self, pad, info, gate):
+        """
+        Push data from an outage buffer queue to its stream sink. Errors of
+        the sink never reach the queue, it would stop accepting data
+        otherwise: while the sink is down, the queue streaming thread waits
+        in ``gate`` and data piles up in the queue.
+        """
+        if gate.stopped:
+            return Gst.PadProbeReturn.OK
+
+        buffer = info.get_buffer()
+        resumed = []
+
+        def send():
+            peer = pad.get_peer()
+            return (peer is not None
+                    and peer.chain(buffer) == Gst.FlowReturn.OK)
+
+        def on_attempt():
+            resumed.append(True)
+            self._resend_sticky_events(pad)
+
+        if gate.push(send, on_attempt):
+            if resumed:
+                delay = pad.get_parent_element().get_property(
+                    "current-level-time") / Gst.SECOND
+                logger.warning("Stream '{}' resumed {:.1f}s behind live,"
+                               " the backlog is sent at realtime rate".format(
+                                   gate.name, delay))
+            # Buffer has been handed to the sink.
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def _resend_sticky_events(self, pad):
+        """
+        Send stream events of ``pad`` again to its peer, they're cleared
+        when the peer is reset.
+        """
+        peer = pad.get_peer()
+        if peer is None:
+            return
+        for event_type in (Gst.EventType.STREAM_START, Gst.EventType.CAPS,
+                           Gst.EventType.SEGMENT):
+            event = pad.get_sticky_event(event_type, 0)
+            if event:
+                peer.send_event(event)
+
     def _reconnect_stream(self, tee_pad, branch):
-        tee_pad.add_probe(Gst.PadProbeType.BLOCK_DOWNSTREAM,
-                          self._on_reconnect_stream,
-                          {"branch": branch})
+        state = branch[-1].reconnect_state
+        if not self.is_playing or state.state != reconnect.DISCONNECTED:
+            # Pipeline has been stopped in the meantime.
+            return False
+
+        state.on_attempt()
+        gate = self._outage_gates.get(branch[-1].name)
+        if gate:
+            # Only the sink is reset, the queue keeps buffered data. A sink
+            # stuck on the network could block the main loop while it's
+            # reset, so it's done in a thread, like reconnection probes.
+            threading.Thread(target=self._reset_stream_sink,
+                             args=(branch[-1], gate), daemon=True,
+                             name="stream_sink_reset").start()
+        else:
+            tee_pad.add_probe(Gst.PadProbeType.BLOCK_DOWNSTREAM,
+                              self._on_reconnect_stream,
+                              {"branch": branch})
+        GLib.timeout_add_seconds(RECONNECT_STABLE_DELAY,
+                                 self._check_stream_reconnected,
+                                 state, state.attempts)
+        return False
+
+    def _reset_stream_sink(self, sink, gate):
+        sink = sink.gstelement.gstelement
+        sink.set_state(Gst.State.NULL)
+        sink.set_state(Gst.State.PLAYING)
+        gate.on_attempt()
 
     def _on_reconnect_stream(self, pad, info, user_data):
         Gst.Pad.remove_probe(pad, info.id)
@@ -587,12 +981,1141 @@ class Pipeline:
             element.gstelement.set_state(Gst.State.PLAYING)
         return Gst.PadProbeReturn.OK
 
+    def _check_stream_reconnected(self, state, attempt):
+        """
+        Mark a stream branch as connected if no error has been posted since
+        reconnection ``attempt``.
+        """
+        if (self.is_playing
+                and state.state == reconnect.RECONNECTING
+                and state.attempts == attempt):
+            state.on_connected()
+        return False
+
+    def _is_server_available(self, address, default=True):
+        """
+        Check availability of an ingest server as reported by
+        :class:`~core.watch.RemoteWatcher`.
+
+        :param address: :class:`tuple` as ``(ip, port)``
+        :param default: value returned when availability is not known
+
+        :return: ``True`` if the server is available, ``False`` otherwise
+        """
+        watcher = watch.get_remote_watcher()
+        element = watcher.get_element(address) if watcher else None
+        if element is None or element.unknown_state:
+            return default
+        if not element.available and element.unavailable_since is None:
+            # Server has not been pinged yet.
+            return default
+        return element.available
+
+    def _get_failover_server(self, sink):
+        """
+        Get the next ingest server of ``sink`` that is not known to be
+        unavailable, servers are tried by order of preference.
+
+        :param sink: :class:`~core.ioelements.StreamElement`
+
+        :return: index of the server in ``sink.servers``, ``None`` if there
+            is no other server to fail over to
+        """
+        count = len(sink.servers)
+        for offset in range(1, count):
+            index = (sink.server_index + offset) % count
+            if self._is_server_available(sink.servers[index]):
+                return index
+
+    def _start_failover_check(self):
+        if self._failover_check_id:
+            return
+
+        for _, sinks in self.stream_sink_branches.items():
+            for branch in sinks["branches"]:
+                if len(branch[-1].servers) > 1:
+                    self._failover_check_id = GLib.timeout_add_seconds(
+                        FAILOVER_CHECK_INTERVAL, self._check_stream_servers)
+                    return
+
+    def _check_stream_servers(self):
+        """
+        Switch connected stream branches to another ingest server when the
+        current one is reported unavailable, or back to a preferred server
+        once it has recovered.
+        """
+        if not self.is_playing:
+            self._failover_check_id = None
+            return False
+
+        for _, sinks in self.stream_sink_branches.items():
+            for branch in sinks["branches"]:
+                sink = branch[-1]
+                if (len(sink.servers) < 2
+                        or sink.reconnect_state.state != reconnect.CONNECTED):
+                    continue
+
+                index = None
+                for preferred in range(sink.server_index):
+                    if self._is_server_available(sink.servers[preferred],
+                                                 default=False):
+                        index = preferred
+                        logger.info("Stream '{}' switches back to {}:{}".format(
+                            sink.name, *sink.servers[index]))
+                        break
+                else:
+                    if not self._is_server_available(sink.server):
+                        index = self._get_failover_server(sink)
+                        if index is not None:
+                            logger.warning(
+                                "Stream '{}' fails over to {}:{}".format(
+                                    sink.name, *sink.servers[index]))
+
+                if index is not None:
+                    self.switch_stream_server(branch, index)
+
+        return True
+
+    def switch_stream_server(self, branch, index):
+        """
+        Switch a stream branch to another ingest server without stopping the
+        pipeline. Data is held in the branch queue meanwhile.
+
+        :param branch: stream branch as :class:`tuple`
+        :param index: index of the server in ``sink.servers``
+        """
+        queue_pad = branch[0].get_static_pad("src")
+        queue_pad.add_probe(Gst.PadProbeType.BLOCK_DOWNSTREAM,
+                            self._on_switch_stream_server,
+                            {"sink": branch[-1], "index": index})
+
+    def _on_switch_stream_server(self, pad, info, user_data):
+        Gst.Pad.remove_probe(pad, info.id)
+        sink = user_data["sink"]
+        sink.gstelement.gstelement.set_state(Gst.State.NULL)
+        sink.set_server(user_data["index"])
+        sink.gstelement.gstelement.set_state(Gst.State.PLAYING)
+        return Gst.PadProbeReturn.OK
+
+    def add_recording_callback(self, callback):
+        """
+        Register a function called each time a recording file is closed,
+        either a segment or a whole recording.
+
+        :param callback: function called with
+            :class:`~core.ioelements.StoreElement` and path of the file
+            as arguments
+        """
+        self._recording_callbacks.append(callback)
+
+    def is_segment_message(self, message):
+        """
+        Check if a message emitted on the bus signals the closing of a
+        recording segment.
+
+        :param message: GStreamer bus message
+
+        :return: ``True`` if a segment has been closed, ``False`` otherwise
+        """
+        structure = message.get_structure()
+        return bool(structure
+                    and structure.get_name() == "GstMultiFileSink")
+
+    def on_segment_closed(self, message):
+        """
+        Handle closing of a recording segment. It assumes that ``message``
+        was emitted from a segmented store sink element.
+
+        :param message: GStreamer bus message
+        """
+        for _, sinks in self.store_sink_branches.items():
+            for branch in sinks["branches"]:
+                sink = branch[-1]
+                if message.src == sink.gstelement.gstelement:
+                    index = message.get_structure().get_value("index")
+                    path = sink.on_segment_closed(index)
+                    if (sink.segmented and sink.switched
+                            and sink.directory_index == index + 1):
+                        # Next segment is the first one written in the
+                        # fallback directory.
+                        logger.info("Recording '{}' continues in {}".format(
+                            sink.name, sink.get_segment_path(index + 1)))
+                    self._notify_recording_closed(sink, path)
+                    return
+
+    def _notify_recording_closed(self, sink, path):
+        logger.info("Recording file closed: {}".format(path))
+        if sink.switched:
+            self._write_manifest(sink)
+        for callback in self._recording_callbacks:
+            callback(sink, path)
+
+    def _close_recordings(self):
+        """
+        Close files being written, sinks are set to NULL state so that
+        buffered data is written before files are reported as closed.
+        Segmented sinks don't post a message for their last segment.
+
+        :return: :class:`list` of ``(sink, path)`` of files closed
+        """
+        closed = []
+        for _, sinks in self.store_sink_branches.items():
+            for branch in sinks["branches"]:
+                sink = branch[-1]
+                with self._directory_switch_lock:
+                    self._pending_directory_switches.pop(sink.name, None)
+                sink.gstelement.gstelement.set_state(Gst.State.NULL)
+                if not sink.multifile:
+                    path = sink.get_current_path()
+                    if os.path.exists(path):
+                        closed.append((sink, path))
+                    continue
+
+                path = sink.on_segment_closed(sink.segment_index)
+                if sink.segmented or sink.switched:
+                    # Next recording must not overwrite existing segments.
+                    sink.set_property("index", sink.segment_index)
+                else:
+                    # Single file is overwritten, as done by filesink.
+                    sink.segment_index = 0
+                if os.path.exists(path):
+                    closed.append((sink, path))
+        return closed
+
+    def _start_space_check(self):
+        if self._space_check_id:
+            return
+
+        for _, sinks in self.store_sink_branches.items():
+            for branch in sinks["branches"]:
+                if branch[-1].fallback_directories:
+                    self._space_check_id = GLib.timeout_add_seconds(
+                        STORE_SPACE_CHECK_INTERVAL, self._check_store_space)
+                    self._check_store_space()
+                    return
+
+    def _check_store_space(self):
+        """
+        Switch store branches to their next fallback directory when free
+        space of the current one gets low.
+        """
+        if not self.is_playing:
+            self._space_check_id = None
+            return False
+
+        for _, sinks in self.store_sink_branches.items():
+            for branch in sinks["branches"]:
+                sink = branch[-1]
+                if not sink.fallback_directories:
+                    continue
+                with self._directory_switch_lock:
+                    if sink.name in self._pending_directory_switches:
+                        continue
+
+                free_space = storage.get_free_space(sink.directory)
+                if free_space is None or free_space >= STORE_MIN_FREE_SPACE:
+                    continue
+
+                directories = sink.directories
+                candidates = directories[
+                    directories.index(sink.directory) + 1:]
+                directory = storage.choose_directory(candidates,
+                                                     STORE_MIN_FREE_SPACE)
+                if not directory:
+                    logger.error("Recording '{}' is running out of space in"
+                                 " {} ({:.0f} MB left) and no fallback"
+                                 " directory is available".format(
+                                     sink.name, sink.directory,
+                                     free_space / 1000000))
+                    continue
+
+                logger.warning("Recording '{}' is running out of space in {}"
+                               " ({:.0f} MB left), switching to {} on next"
+                               " {}".format(sink.name, sink.directory,
+                                            free_space / 1000000, directory,
+                                            "segment" if sink.segmented
+                                            else "keyframe"))
+                with self._directory_switch_lock:
+                    self._pending_directory_switches[sink.name] = directory
+                pad = sink.gstelement.get_static_pad("sink")
+                pad.add_probe(Gst.PadProbeType.BUFFER,
+                              self._on_switch_store_directory, sink)
+        return True
+
+    def _on_switch_store_directory(self, pad, info, sink):
+        """
+        Start a new file in the fallback directory on first keyframe, so that
+        no data is lost between the two files.
+
+        Segmented sinks ignore requests for a new file, the next segment is
+        written in the fallback directory instead, see
+        :meth:`on_segment_closed`.
+        """
+        buffer = info.get_buffer()
+        is_keyframe = not (buffer.has_flags(Gst.BufferFlags.DELTA_UNIT)
+                           or buffer.has_flags(Gst.BufferFlags.HEADER))
+        with self._directory_switch_lock:
+            directory = self._pending_directory_switches.get(sink.name)
+            if directory is None:
+                # Recording has been stopped meanwhile.
+                return Gst.PadProbeReturn.REMOVE
+            if not is_keyframe and not sink.segmented:
+                return Gst.PadProbeReturn.OK
+
+            index = sink.switch_directory(directory)
+            self._pending_directory_switches.pop(sink.name, None)
+
+        if sink.segmented:
+            return Gst.PadProbeReturn.REMOVE
+
+        # Only the first file is indexed for recovery.
+        user_data = self._recovery_indexes.get(sink.name)
+        if user_data and user_data["writer"]:
+            user_data["writer"].close()
+            user_data["writer"] = None
+        # Sink closes current file and starts a new one with stream headers.
+        pad.send_event(GstVideo.video_event_new_downstream_force_key_unit(
+            buffer.pts, Gst.CLOCK_TIME_NONE, Gst.CLOCK_TIME_NONE, True,
+            index))
+        logger.info("Recording '{}' continues in {}".format(
+            sink.name, sink.get_segment_path(index)))
+        GLib.idle_add(self._write_manifest, sink, index)
+        return Gst.PadProbeReturn.REMOVE
+
+    def _write_manifest(self, sink, last_index=None):
+        """
+        Write manifest chaining files of a recording switched to a fallback
+        directory, see :func:`~core.storage.write_manifest`. It's written
+        along the first file if possible.
+        """
+        if last_index is None:
+            last_index = max(sink.segment_index,
+                             sink.get_property("index"))
+        files = [sink.get_segment_path(index)
+                 for index in range(last_index + 1)]
+        files = [path for path in files
+                 if os.path.exists(path) or path == files[-1]]
+        for directory in (None, sink.directory):
+            path = storage.get_manifest_path(sink.location, directory)
+            try:
+                storage.write_manifest(path, files)
+            except OSError as e:
+                logger.warning("Could not write manifest {} ({})".format(
+                    path, e))
+                continue
+            logger.info("Recording '{}' manifest {}: {}".format(
+                sink.name, path, " -> ".join(files)))
+            break
+        return False
+
+    def _add_recovery_index(self, sink):
+        """
+        Write keyframe positions of the recording made by ``sink`` in an
+        index file, see :class:`~core.recovery.IndexWriter`.
+        """
+        user_data = self._recovery_indexes[sink.name] = {
+            "sink": sink, "offset": 0, "writer": None}
+        pad = sink.gstelement.get_static_pad("sink")
+        pad.add_probe(Gst.PadProbeType.BUFFER
+                      | Gst.PadProbeType.EVENT_DOWNSTREAM,
+                      self._on_recorded_data, user_data)
+
+    def _on_recorded_data(self, pad, info, user_data):
+        if info.type & Gst.PadProbeType.BUFFER:
+            buffer = info.get_buffer()
+            writer = user_data["writer"]
+            if (writer
+                    and not buffer.has_flags(Gst.BufferFlags.DELTA_UNIT)
+                    and not buffer.has_flags(Gst.BufferFlags.HEADER)):
+                pts = buffer.pts
+                writer.add(user_data["offset"],
+                           None if pts == Gst.CLOCK_TIME_NONE else pts)
+            user_data["offset"] += buffer.get_size()
+            return Gst.PadProbeReturn.OK
+
+        event = info.get_event()
+        if event.type == Gst.EventType.STREAM_START:
+            # File sink truncates the file when it starts.
+            if user_data["writer"]:
+                user_data["writer"].close()
+            user_data["offset"] = 0
+            user_data["writer"] = recovery.IndexWriter(
+                user_data["sink"].get_current_path())
+        elif event.type == Gst.EventType.SEGMENT:
+            segment = event.parse_segment()
+            if segment.format == Gst.Format.BYTES:
+                # Muxer rewrites headers at this position.
+                user_data["offset"] = segment.start
+        elif event.type == Gst.EventType.EOS:
+            # Recording is finalized, there is nothing to recover.
+            if user_data["writer"]:
+                user_data["writer"].close(remove=True)
+                user_data["writer"] = None
+        return Gst.PadProbeReturn.OK
+
+    def _close_recovery_indexes(self):
+        """
+        Close index files of recordings that have not been finalized, they
+        are kept so that recordings can be recovered.
+        """
+        for user_data in self._recovery_indexes.values():
+            if user_data["writer"]:
+                user_data["writer"].close()
+                user_data["writer"] = None
+
+    def _on_stored_buffer(self, pad, info, stats):
+        stats.add(info.get_buffer().get_size())
+        return Gst.PadProbeReturn.OK
+
+    def _start_file_syncers(self):
+        for syncer in self._file_syncers.values():
+            syncer.start()
+
+    def _stop_file_syncers(self, closed_recordings, callback):
+        """
+        Stop syncing recordings, last syncs of closed files are done in
+        syncer threads.
+
+        :param closed_recordings: :class:`list` of ``(sink, path)`` of files
+            closed, see :meth:`_close_recordings`
+        :param callback: function called with ``closed_recordings`` from the
+            main loop once last syncs are done
+        """
+        syncers = {name: syncer for name, syncer in self._file_syncers.items()
+                   if syncer.running}
+        if not syncers:
+            callback(closed_recordings)
+            return
+
+        remaining = [len(syncers)]
+        lock = threading.Lock()
+
+        def on_stopped():
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            GLib.idle_add(callback, closed_recordings)
+
+        for name, syncer in syncers.items():
+            # Sink may already target the next file of a segmented
+            # recording, closed files are synced instead.
+            syncer.stop(on_stopped, [path for sink, path in closed_recordings
+                                     if sink.name == name])
+
+    def get_store_stats(self):
+        """
+        Get write throughput of all store branches.
+
+        :return: :class:`dict` as ``{sink name: stats}``, see
+            :meth:`~core.storage.WriteStats.get_stats`. Data waiting in the
+            write-behind buffer is given by ``buffered_bytes`` and
+            ``buffered_time`` keys.
+        """
+        stats = {}
+        for _, sinks in self.store_sink_branches.items():
+            for queue, sink in sinks["branches"]:
+                sink_stats = self._write_stats[sink.name].get_stats()
+                sink_stats["buffered_bytes"] = queue.get_property(
+                    "current-level-bytes")
+                sink_stats["buffered_time"] = queue.get_property(
+                    "current-level-time") / Gst.SECOND
+                stats[sink.name] = sink_stats
+        return stats
+
+    def get_stream_states(self):
+        """
+        Get reconnection state of all stream branches.
+
+        :return: :class:`dict` as ``{sink name: state}``, see
+            :meth:`~core.reconnect.ReconnectState.get_state`
+        """
+        states = {}
+        for _, sinks in self.stream_sink_branches.items():
+            for branch in sinks["branches"]:
+                state = branch[-1].reconnect_state.get_state()
+                state["server"] = branch[-1].server
+                if branch[-1].name in self._outage_gates:
+                    state["buffered_time"] = branch[0].get_property(
+                        "current-level-time") / Gst.SECOND
+                    state["buffered_bytes"] = branch[0].get_property(
+                        "current-level-bytes")
+                states[branch[-1].name] = state
+        return states
+
+    def _instrument_pipeline(self):
+        """
+        Count data flowing out of sources and encoders, and into endpoint
+        tees.
+        """
+        self._instrument_pad("audio_source",
+                             self.audio_process_source[0], "sink")
+        self._instrument_pad("video_source",
+                             self.video_process_source[0], "sink")
+        for name in ("vorbis_encoder", "vp8_encoder"):
+            self._instrument_pad(name, self.pipeline.get_by_name(name),
+                                 "src")
+        for feed_type, sinks in self.store_sink_branches.items():
+            self._instrument_pad("tee_output_" + feed_type, sinks["tee"],
+                                 "sink")
+
+        self._watch_pad("audio_source")
+        self._watch_pad("video_source")
+        self._watch_pad("vorbis_encoder", ("audio_source",))
+        self._watch_pad("vp8_encoder", ("video_source",))
+
+    def _instrument_pad(self, name, element, pad_name):
+        """
+        Attach a probe counting buffers flowing through a pad of
+        ``element``, if :const:`PAD_STATS_ENABLED` or :const:`STALL_TIMEOUT`
+        is set.
+        """
+        if ((not PAD_STATS_ENABLED and not STALL_TIMEOUT)
+                or name in self._pad_counters):
+            return
+
+        counters = instrumentation.PadCounters(name)
+        pad = element.get_static_pad(pad_name)
+        pad.add_probe(Gst.PadProbeType.BUFFER | Gst.PadProbeType.BUFFER_LIST,
+                      self._on_counted_data, counters)
+        self._pad_counters[name] = counters
+        self._counted_pads[name] = pad
+
+    def _on_counted_data(self, pad, info, counters):
+        if info.type & Gst.PadProbeType.BUFFER:
+            buffer = info.get_buffer()
+            pts = buffer.pts
+            counters.add(1, buffer.get_size(),
+                         None if pts == Gst.CLOCK_TIME_NONE else pts)
+        else:
+            buffer_list = info.get_buffer_list()
+            size = sum(buffer_list.get(index).get_size()
+                       for index in range(buffer_list.length()))
+            counters.add(buffer_list.length(), size)
+        return Gst.PadProbeReturn.OK
+
+    def get_encoder_stats(self):
+        """
+        Get encoders settings and video frames dropped or duplicated to keep
+        the framerate constant.
+
+        :return: :class:`dict` as ``{element name: stats}``
+        """
+        vp8_encoder = self.pipeline.get_by_name("vp8_encoder")
+        vorbis_encoder = self.pipeline.get_by_name("vorbis_encoder")
+        videorate = self.pipeline.get_by_name("videorate")
+        # Vorbis encoder is in quality mode if bitrate is not set.
+        vorbis_bitrate = vorbis_encoder.get_property("bitrate")
+        return {"vp8_encoder": {
+                    "target_bitrate": vp8_encoder.get_property(
+                        "target-bitrate")},
+                "vorbis_encoder": {
+                    "target_bitrate": (vorbis_bitrate
+                                       if vorbis_bitrate > 0 else None)},
+                "videorate": {
+                    "input_frames": videorate.get_property("in"),
+                    "output_frames": videorate.get_property("out"),
+                    "dropped_frames": videorate.get_property("drop"),
+                    "duplicated_frames": videorate.get_property("duplicate")}}
+
+    def get_pad_stats(self):
+        """
+        Get data flow through instrumented pads: sources, encoders, endpoint
+        tees and head of each stream and store branch.
+
+        :return: :class:`dict` as ``{pad name: stats}``, see
+            :meth:`~core.instrumentation.PadCounters.get_stats`. It's empty
+            if neither :const:`PAD_STATS_ENABLED` nor :const:`STALL_TIMEOUT`
+            is set.
+        """
+        return {name: counters.get_stats()
+                for name, counters in self._pad_counters.items()}
+
+    def set_latency_tracing(self, enabled):
+        """
+        Start or stop tracing latency of each element while playing. A
+        summary report is logged once tracing stops, see
+        :meth:`get_latency_report`.
+
+        :param enabled: :class:`bool`
+        """
+        self.latency_tracing = enabled
+        logger.info("Latency tracing {}".format(
+            "enabled" if enabled else "disabled"))
+        if not enabled:
+            self._untrace_latency()
+        elif self.is_playing:
+            self._trace_latency()
+
+    def _trace_latency(self):
+        """
+        Attach a probe measuring latency since capture on every pad of the
+        pipeline.
+        """
+        for element in self.pipeline.iterate_elements():
+            element_name = element.get_name()
+            for pad in element.iterate_pads():
+                name = element_name + ":" + pad.get_name()
+                if name in self._latency_probes:
+                    continue
+                stats = instrumentation.LatencyStats(name)
+                probe_id = pad.add_probe(Gst.PadProbeType.BUFFER,
+                                         self._on_traced_buffer, stats)
+                self._latency_probes[name] = (pad, probe_id, element_name,
+                                              stats)
+
+    def _untrace_latency(self):
+        if not self._latency_probes:
+            return
+
+        elements, sinks = self.get_latency_report(live=False)
+        if elements or sinks:
+            logger.info("Latency report:\n" + instrumentation
+                        .format_latency_report(elements, sinks))
+        for pad, probe_id, _, _ in self._latency_probes.values():
+            pad.remove_probe(probe_id)
+        self._latency_probes.clear()
+
+    def _get_buffer_latency(self, pad, buffer):
+        """
+        :return: time in seconds since ``buffer`` flowing through ``pad`` was
+            captured, ``None`` if it can't be determined
+        """
+        element = pad.get_parent_element()
+        clock = element.get_clock() if element else None
+        event = pad.get_sticky_event(Gst.EventType.SEGMENT, 0)
+        if buffer.pts == Gst.CLOCK_TIME_NONE or not clock or not event:
+            return None
+
+        # Live sources timestamp buffers with running time of capture.
+        running_time = event.parse_segment().to_running_time(
+            Gst.Format.TIME, buffer.pts)
+        if running_time == Gst.CLOCK_TIME_NONE:
+            return None
+        now = clock.get_time() - element.get_base_time()
+        return (now - running_time) / Gst.SECOND
+
+    def _on_traced_buffer(self, pad, info, stats):
+        latency = self._get_buffer_latency(pad, info.get_buffer())
+        if latency is not None:
+            stats.add(latency)
+        return Gst.PadProbeReturn.OK
+
+    def get_latency_report(self, live=True):
+        """
+        Get latency measured while :attr:`latency_tracing` is enabled.
+
+        :param live: if ``True`` latencies are averaged on recent buffers,
+            otherwise since tracing started
+
+        :return: ``(elements, sinks)`` mapping element names to latency they
+            add, and sink names to latency since capture, see
+            :func:`~core.instrumentation.get_latency_breakdown`
+        """
+        pad_latencies = {}
+        for pad, _, element_name, stats in self._latency_probes.values():
+            latency = stats.get_stats()["latency" if live else "average"]
+            sink_latencies, src_latencies = pad_latencies.setdefault(
+                element_name, ([], []))
+            if pad.get_direction() == Gst.PadDirection.SINK:
+                sink_latencies.append(latency)
+            else:
+                src_latencies.append(latency)
+        return instrumentation.get_latency_breakdown(pad_latencies)
+
+    def _watch_av_sync(self):
+        """
+        Measure latency of audio and video buffers entering the audiovideo
+        muxer.
+        """
+        for stream, name in ((telemetry.AUDIO, "queue_muxer_audio"),
+                             (telemetry.VIDEO, "queue_muxer_video")):
+            self.pipeline.get_by_name(name).get_static_pad("sink").add_probe(
+                Gst.PadProbeType.BUFFER, self._on_av_sync_buffer, stream)
+
+    def _on_av_sync_buffer(self, pad, info, stream):
+        latency = self._get_buffer_latency(pad, info.get_buffer())
+        if latency is not None:
+            self._av_sync.add(stream, time.monotonic(), latency)
+        return Gst.PadProbeReturn.OK
+
+    def _start_av_sync_check(self):
+        if self._av_sync_check_id or not AV_SYNC_MONITORING:
+            return
+
+        self._av_sync.reset()
+        self._av_sync_correction = 0.0
+        self._av_delays = (0.0, 0.0)
+        self._av_sync_warned = False
+        self._apply_av_offset()
+        self._av_sync_check_id = GLib.timeout_add_seconds(
+            telemetry.AV_SYNC_WINDOW, self._check_av_sync)
+
+    def _check_av_sync(self):
+        """
+        Warn when audio and video drift apart, and compensate drift if
+        :const:`AV_SYNC_AUTO_THRESHOLD` is set.
+        """
+        if not self.is_playing:
+            self._av_sync_check_id = None
+            return False
+
+        drift = self._av_sync.drift
+        if drift is None:
+            return True
+
+        warned = abs(drift) * 1000 >= AV_SYNC_WARNING_DRIFT
+        if warned and not self._av_sync_warned:
+            logger.warning("Audio and video drifted apart by {:.0f} ms".format(
+                drift * 1000))
+        self._av_sync_warned = warned
+
+        if (AV_SYNC_AUTO_THRESHOLD and abs(drift - self._av_sync_correction)
+                * 1000 >= AV_SYNC_AUTO_THRESHOLD):
+            logger.info("Compensating {:.0f} ms of audio/video drift".format(
+                drift * 1000))
+            self._av_sync_correction = drift
+            self._apply_av_offset()
+        return True
+
+    def _apply_av_offset(self):
+        """
+        Offset running time of audio or video entering the audiovideo muxer
+        by :const:`AV_SYNC_OFFSET` and automatic drift correction, see
+        :func:`~core.telemetry.get_av_delays`.
+        """
+        self._av_delays = telemetry.get_av_delays(
+            *self._av_delays, AV_SYNC_OFFSET / 1000 + self._av_sync_correction)
+        for name, delay in zip(("queue_muxer_audio", "queue_muxer_video"),
+                               self._av_delays):
+            self.pipeline.get_by_name(name).get_static_pad("src").set_offset(
+                int(delay * Gst.SECOND))
+
+    def _log_av_sync(self):
+        stats = self.get_av_sync_stats()
+        if stats["drift"] is None:
+            return
+
+        logger.info("Audio/video drift over {:.0f} min: {:.0f} ms, largest"
+                    " {:.0f} ms, trend {} ms/h, {:.0f} ms compensated".format(
+                        stats["duration"] / 60, stats["drift"] * 1000,
+                        stats["max_drift"] * 1000,
+                        "{:.0f}".format(stats["drift_rate"] * 1000)
+                        if stats["drift_rate"] is not None else "N/A",
+                        stats["correction"] * 1000))
+
+    def get_av_sync_stats(self):
+        """
+        Get drift between audio and video of the audiovideo feed since the
+        pipeline started playing.
+
+        :return: :class:`dict`, see
+            :meth:`~core.telemetry.AvSyncMonitor.get_stats`, along with
+            ``correction`` the delay in seconds applied to audio
+        """
+        stats = self._av_sync.get_stats()
+        stats["correction"] = AV_SYNC_OFFSET / 1000 + self._av_sync_correction
+        return stats
+
+    def _watch_pad(self, name, upstream=()):
+        """
+        Watch data flow through instrumented pad ``name``, fed by pads
+        ``upstream``, see :const:`STALL_TIMEOUT`.
+        """
+        if STALL_TIMEOUT and name in self._pad_counters:
+            self._watchdog.watch(name, upstream)
+
+    def _start_stall_check(self):
+        if self._stall_check_id or not STALL_TIMEOUT:
+            return
+
+        self._watchdog.reset(time.monotonic())
+        self._stall_check_id = GLib.timeout_add(
+            int(STALL_CHECK_INTERVAL * 1000), self._check_stalls)
+
+    def _check_stalls(self):
+        """
+        Restart the part of the pipeline where data stopped flowing without
+        any error posted.
+        """
+        if not self.is_playing:
+            self._stall_check_id = None
+            return False
+
+        now = time.monotonic()
+        _, state, _ = self.pipeline.get_state(0)
+        if state != Gst.State.PLAYING:
+            # Data isn't expected to flow while paused.
+            self._watchdog.reset(now)
+            return True
+
+        # Disconnected streams are handled by reconnection.
+        self._watchdog.reset(
+            now, [branch[-1].name
+                  for _, sinks in self.stream_sink_branches.items()
+                  for branch in sinks["branches"]
+                  if branch[-1].reconnect_state.state != reconnect.CONNECTED])
+
+        last_times = {name: counters.last_time
+                      for name, counters in self._pad_counters.items()}
+        stalled = self._watchdog.check(now, last_times)
+        if stalled:
+            # Before restarting, so that the log shows how data stopped.
+            debuglog.dump("stall")
+        for name, idle_time in stalled:
+            self._restart_stalled(name, idle_time)
+            self._watchdog.on_stall(name, now)
+        return True
+
+    def _restart_stalled(self, name, idle_time):
+        """
+        Restart stalled part of the pipeline named ``name``, sources are
+        restarted and stream branches are reconnected.
+        """
+        if name in ("audio_source", "video_source"):
+            branch = (self.audio_process_source if name == "audio_source"
+                      else self.video_process_source)
+            source = self.get_connected_element(
+                branch[0].get_static_pad("sink"))
+            if source:
+                logger.warning("Source '{}' produced no data for {:.0f}s,"
+                               " restarting it".format(source.get_name(),
+                                                       idle_time))
+                # Changing state interrupts the blocked streaming thread
+                # and reopens the device.
+                source.set_state(Gst.State.NULL)
+                source.sync_state_with_parent()
+                return
+
+        for _, sinks in self.stream_sink_branches.items():
+            for branch in sinks["branches"]:
+                if branch[-1].name == name:
+                    logger.warning("Stream '{}' sent no data for {:.0f}s,"
+                                   " reconnecting it".format(name, idle_time))
+                    # The sink is reset by reconnection, out of the main
+                    # loop since it may be blocked on the network.
+                    self._reconnect_branch(branch)
+                    return
+
+        # Encoders and file sinks can't be restarted on their own.
+        logger.error("'{}' passed no data for {:.0f}s".format(name,
+                                                              idle_time))
+
+    def get_stall_stats(self):
+        """
+        Get state of parts of the pipeline watched for stalls, see
+        :const:`STALL_TIMEOUT`.
+
+        :return: :class:`dict` as ``{pad name: stats}``, see
+            :meth:`~core.watchdog.StallWatchdog.get_stats`
+        """
+        return self._watchdog.get_stats()
+
+    def _start_queue_sampling(self):
+        if self._queue_sample_id or not QUEUE_SAMPLE_INTERVAL:
+            return
+
+        self._queue_sample_id = GLib.timeout_add(
+            int(QUEUE_SAMPLE_INTERVAL * 1000), self._sample_queues)
+
+    def _sample_queues(self):
+        """
+        Sample levels of all queues in the pipeline, and log when a queue
+        stays near capacity or starts dropping buffers.
+        """
+        if not self.is_playing:
+            self._queue_sample_id = None
+            return False
+
+        now = time.monotonic()
+        for element in self.pipeline.iterate_elements():
+            if element.get_factory().get_name() != "queue":
+                continue
+
+            name = element.get_name()
+            monitor = self._queue_monitors.get(name)
+            if not monitor:
+                monitor = self._queue_monitors[name] = telemetry.QueueMonitor(
+                    name, leaky=bool(element.get_property("leaky")))
+            if self._monitored_queues.get(name) is not element:
+                self._monitored_queues[name] = element
+                element.connect("overrun",
+                                lambda queue, monitor: monitor.on_overrun(),
+                                monitor)
+
+            monitor.add_sample(
+                now,
+                [element.get_property("current-level-" + level)
+                 for level in ("buffers", "bytes", "time")],
+                [element.get_property("max-size-" + level)
+                 for level in ("buffers", "bytes", "time")])
+
+            downstream = self.get_connected_element(
+                element.get_static_pad("src"))
+            downstream_name = downstream.get_name() if downstream else None
+            if downstream_name in self._outage_gates:
+                # Queue is filled on purpose while the server is down, and
+                # stays filled with the backlog afterwards.
+                continue
+            for alert in monitor.check(now):
+                self._log_queue_alert(monitor, alert, downstream_name)
+        return True
+
+    def _log_queue_alert(self, monitor, alert, downstream_name):
+        stats = monitor.get_stats()
+        if alert == telemetry.CONGESTED:
+            logger.warning("Queue '{}' is near capacity ({:.0%} full, {:.1f}s"
+                           " buffered), '{}' can't keep up".format(
+                               monitor.name, stats["fill"], stats["time"],
+                               downstream_name))
+        elif alert == telemetry.LEAKING:
+            logger.warning("Queue '{}' drops buffers ({} dropped so far),"
+                           " '{}' can't keep up".format(
+                               monitor.name, stats["dropped"],
+                               downstream_name))
+        else:
+            logger.info("Queue '{}' {} ({:.0%} full)".format(
+                monitor.name, alert, stats["fill"]))
+
+    def get_queue_stats(self):
+        """
+        Get levels of queues sampled while playing, see
+        :const:`QUEUE_SAMPLE_INTERVAL`.
+
+        :return: :class:`dict` as ``{queue name: stats}``, see
+            :meth:`~core.telemetry.QueueMonitor.get_stats`
+        """
+        return {name: monitor.get_stats()
+                for name, monitor in self._queue_monitors.items()}
+
+    def on_qos_message(self, message):
+        """
+        Account a QoS message posted by an element that lost or dropped
+        data.
+
+        :param message: GStreamer bus message of type QOS
+        """
+        name = message.src.get_name()
+        stats = self._qos_stats.get(name)
+        if not stats:
+            stats = self._qos_stats[name] = telemetry.QosStats(name)
+
+        format_, processed, dropped = message.parse_qos_stats()
+        if format_ != Gst.Format.BUFFERS:
+            # Amounts are not counted in frames, audio elements count them
+            # in samples.
+            processed = dropped = None
+        # Unknown amounts are -1 as unsigned integers.
+        unknown = (-1, Gst.CLOCK_TIME_NONE)
+        jitter, proportion, _ = message.parse_qos_values()
+        stats.on_qos(processed if processed not in unknown else None,
+                     dropped if dropped not in unknown else None,
+                     jitter / Gst.SECOND, proportion)
+
+    def on_warning_message(self, message):
+        """
+        Log and count a warning posted by an element.
+
+        :param message: GStreamer bus message of type WARNING
+        """
+        name = message.src.get_name()
+        self._warnings[name] += 1
+        err, debug = message.parse_warning()
+        logger.warning("GStreamer warning from '{}': {} {}".format(
+            name, err, debug))
+
+    def get_qos_stats(self):
+        """
+        Get quality of service reported by elements through QoS messages,
+        along with number of warnings they posted.
+
+        :return: :class:`dict` as ``{element name: stats}``, see
+            :meth:`~core.telemetry.QosStats.get_stats`
+        """
+        stats = {name: qos.get_stats()
+                 for name, qos in self._qos_stats.items()}
+        for name, count in self._warnings.items():
+            stats.setdefault(name, {})["warnings"] = count
+        return stats
+
+    def _start_health_sampling(self):
+        if self._health_sample_id or not HEALTH_SAMPLE_INTERVAL:
+            return
+
+        self._health.reset()
+        self._health_sample_id = GLib.timeout_add(
+            int(HEALTH_SAMPLE_INTERVAL * 1000), self._sample_health)
+
+    def _sample_health(self):
+        """
+        Sample frame counters of the video path, and log when realtime
+        health gets degraded or recovers.
+        """
+        if not self.is_playing:
+            self._health_sample_id = None
+            self._health_stats = None
+            return False
+
+        _, state, _ = self.pipeline.get_state(0)
+        if state != Gst.State.PLAYING:
+            # No frame is expected while paused.
+            self._health.reset()
+            return True
+
+        videorate = self.pipeline.get_by_name("videorate")
+        video_path = self._get_video_path()
+        self._health.add_sample(
+            time.monotonic(),
+            *[videorate.get_property(counter)
+              for counter in ("in", "out", "drop", "duplicate")],
+            sum(stats.dropped for name, stats in self._qos_stats.items()
+                if name in video_path))
+        self._health_stats = stats = self._health.get_stats()
+        if not stats:
+            return True
+
+        degraded = stats["score"] < telemetry.HEALTH_WARNING_SCORE
+        if degraded and not self._health_degraded:
+            logger.warning("Realtime health degraded to {:.0f}%: {}"
+                           " duplicated and {} late or lost frames out of"
+                           " {} in {:.0f}s".format(
+                               stats["score"], stats["duplicated"],
+                               stats["late"], stats["frames_out"],
+                               stats["duration"]))
+        elif not degraded and self._health_degraded:
+            logger.info("Realtime health recovered to {:.0f}%".format(
+                stats["score"]))
+        self._health_degraded = degraded
+        return True
+
+    def _get_video_path(self):
+        """
+        :return: :class:`set` of names of elements from the video source to
+            the video encoder, frames dropped elsewhere (e.g. by the
+            preview) don't affect the broadcast
+        """
+        names = set()
+        element = self.pipeline.get_by_name("vp8_encoder")
+        while element and element.get_name() not in names:
+            names.add(element.get_name())
+            element = self.get_connected_element(
+                element.get_static_pad("sink"))
+        return names
+
+    def get_health(self):
+        """
+        Get realtime health of the video path. It can be called from any
+        thread.
+
+        :return: :class:`dict` or ``None`` if the pipeline isn't playing,
+            see :meth:`~core.telemetry.RealtimeHealth.get_stats`
+        """
+        return self._health_stats
+
     def build_pipeline(self, pipeline, *branches):
         """
         Add and link GStreamer elements into ``pipeline``.
         """
         self.add_elements(pipeline, *branches)
-        self.link_elements(*branches)
+        try:
+            self.link_elements(*branches)
+        except (LinkingElementError, TeePatchingError):
+            self.dump_graph("link-error")
+            raise
+
+    def get_graph(self):
+        """
+        Get graph of the pipeline, elements are annotated with their state,
+        queue levels, throughput and latency if they're measured. Links are
+        annotated with negotiated caps.
+
+        :return: ``(nodes, edges)``, see :func:`~core.graph.format_dot`
+        """
+        annotations = collections.defaultdict(list)
+        for name, pad in self._counted_pads.items():
+            element = pad.get_parent_element()
+            if not element:
+                continue
+            stats = self._pad_counters[name].get_stats()
+            annotations[element.get_name()].append(
+                "{}: {} buffers, {:.1f} kB/s".format(
+                    pad.get_name(), stats["buffers"],
+                    stats["average_rate"] / 1000))
+        elements, _ = self.get_latency_report()
+        for name, latency in elements.items():
+            annotations[name].append("latency: {:.1f} ms".format(
+                latency * 1000))
+
+        nodes = []
+        edges = []
+        for element in self.pipeline.iterate_elements():
+            name = element.get_name()
+            factory_name = element.get_factory().get_name()
+            _, state, pending = element.get_state(0)
+            state = Gst.Element.state_get_name(state)
+            state_line = "state: " + state
+            if pending != Gst.State.VOID_PENDING:
+                state_line += " -> " + Gst.Element.state_get_name(pending)
+            lines = [factory_name, state_line]
+            if factory_name == "queue":
+                levels = [element.get_property("current-level-" + level)
+                          for level in ("buffers", "bytes", "time")]
+                limits = [element.get_property("max-size-" + level)
+                          for level in ("buffers", "bytes", "time")]
+                lines.append("level: {} buffers, {:.1f} kB, {:.2f}s"
+                             " ({:.0%} full)".format(
+                                 levels[0], levels[1] / 1000,
+                                 levels[2] / Gst.SECOND,
+                                 telemetry.get_fill_ratio(levels, limits)))
+            lines.extend(annotations[name])
+            nodes.append(graph.Node(name, state, lines))
+
+            for pad in element.iterate_pads():
+                peer = pad.get_peer()
+                if pad.get_direction() != Gst.PadDirection.SRC or not peer:
+                    continue
+                peer_element = peer.get_parent_element()
+                caps = pad.get_current_caps()
+                edges.append(graph.Edge(
+                    name, pad.get_name(),
+                    peer_element.get_name() if peer_element else "?",
+                    peer.get_name(), caps.to_string() if caps else None))
+
+        nodes.sort(key=lambda node: node.name)
+        return nodes, edges
+
+    def dump_graph(self, reason="manual"):
+        """
+        Write graph of the pipeline into :const:`~core.graph.DUMP_DIRECTORY`,
+        see :meth:`get_graph`.
+
+        :param reason: why the graph is dumped, it's part of the filename
+
+        :return: path of the dump, ``None`` if it couldn't be written
+        """
+        nodes, edges = self.get_graph()
+        try:
+            path = graph.write_dump(
+                graph.format_dot("hubangl", nodes, edges), reason)
+        except OSError as e:
+            logger.error("Failed to dump pipeline graph ({})".format(e))
+            return None
+
+        logger.info("Pipeline graph dumped to {}".format(path))
+        return path
+
+    def dump_graph_on_error(self):
+        """
+        Dump graph of the pipeline after an error, at most once every
+        :const:`~core.graph.ERROR_DUMP_INTERVAL` seconds.
+        """
+        now = time.monotonic()
+        if (self._last_error_dump is not None
+                and now - self._last_error_dump < graph.ERROR_DUMP_INTERVAL):
+            return None
+
+        self._last_error_dump = now
+        return self.dump_graph("error")
 
     def _exist_in_pipeline(self, element):
         """
@@ -862,6 +2385,9 @@ class Pipeline:
         """
         Add a streaming/storing sink to the pipeline.
         """
+        for gate in self._outage_gates.values():
+            gate.start()
+        self._set_muxers_streamable()
         for sinks_dict in (self.store_sink_branches, self.stream_sink_branches):
             for _, sinks in sinks_dict.items():
                 if sinks["branches"]:
@@ -879,20 +2405,64 @@ class Pipeline:
                             element = element.gstelement
                         branch[i - 1].link(element)
 
+    def _set_muxers_streamable(self):
+        """
+        Make the video muxer streamable if a video recording can be written
+        in several files (segments or fallback directories). It then puts
+        its headers in caps, so that they're written at the beginning of
+        each file, and it doesn't seek back to write them once the
+        recording ends, since the file it would seek in may have changed.
+        Such recordings are not seekable until the remux post-processing job
+        rewrites them.
+        """
+        mkv_muxer = self.pipeline.get_by_name("mkv_muxer")
+        if mkv_muxer:
+            mkv_muxer.set_property(
+                "streamable",
+                any(sink.multifile for _, sink
+                    in self.store_sink_branches["video"]["branches"]))
+
     def remove_output_branches(self):
         """
         Remove all output sinks from the GStreamer pipeline.
         """
+        for gate in self._outage_gates.values():
+            gate.stop()
         for sinks_dict in (self.stream_sink_branches, self.store_sink_branches):
             for _, sinks in sinks_dict.items():
                 for branch in sinks["branches"]:
                     self.remove_elements(self.pipeline, branch)
+        closed_recordings = self._close_recordings()
+        self._close_recovery_indexes()
+        # Files are complete once sinks are closed, indexes are closed and
+        # data synced.
+        self._stop_file_syncers(closed_recordings,
+                                self._on_recordings_complete)
+
+        for _, sinks in self.stream_sink_branches.items():
+            for branch in sinks["branches"]:
+                branch[-1].reconnect_state.reset()
+                branch[-1].set_server(0)
 
         for tee, fakesink in self._output_tee_pool.items():
             if not self._exist_in_pipeline(fakesink):
                 self.pipeline.add(fakesink.gstelement)
                 tee.link(fakesink)
 
+    def _on_recordings_complete(self, closed_recordings):
+        for name, stats in self._write_stats.items():
+            stats = stats.get_stats()
+            if not stats["bytes"]:
+                continue
+            logger.info("Recording '{}': {:.1f} MB written, average rate"
+                        " {:.1f} kB/s, longest sync {:.3f}s".format(
+                            name, stats["bytes"] / 1000000,
+                            stats["average_rate"] / 1000,
+                            stats["max_fsync_duration"]))
+        for sink, path in closed_recordings:
+            self._notify_recording_closed(sink, path)
+        return False
+
     def create_audio_sources(self):
         """
         Create all available audio inputs GStreamer elements.
@@ -932,7 +2502,8 @@ class Pipeline:
         return tuple(video_sources)
 
     def create_stream_branch(self, element_name, feed_type, ip, port, mount,
-                             password=None):
+                             password=None, outage_buffer=None,
+                             backup_servers=None):
         """
         Create a stream sink branch and add it to :attr:`stream_sink_branches`.
 
@@ -944,9 +2515,17 @@ class Pipeline:
         :param mount: mountpoint as :class:`str` used on Icecast server
         :param password: password as :class:`str` that allows to add a
             mountpoint
+        :param outage_buffer: if ``True`` the branch queue keeps up to
+            :const:`OUTAGE_BUFFER_DURATION` seconds of data while the server
+            is unreachable, default to :const:`OUTAGE_BUFFER_ENABLED`
+        :param backup_servers: :class:`list` of ``(ip, port)`` of Icecast
+            servers to fail over to, by order of preference
 
         :return: :class:`~core.ioelements.StreamElement`
         """
+        if outage_buffer is None:
+            outage_buffer = OUTAGE_BUFFER_ENABLED
+
         id = str(len(self.stream_sink_branches[feed_type]["branches"]))
 
         queue_name = "queue_" + feed_type + "_streamsink_" + id
@@ -954,14 +2533,33 @@ class Pipeline:
         queue.set_related_tee(self.stream_sink_branches[feed_type]["tee"])
         queue.set_property("flush-on-eos", True)
         queue.set_property("leaky", 2)
+        if outage_buffer:
+            # Queue is nearly empty while connected, so this only bounds the
+            # data kept during an outage.
+            queue.set_property("max-size-buffers", 0)
+            queue.set_property("max-size-time",
+                               int(OUTAGE_BUFFER_DURATION * Gst.SECOND))
+            queue.set_property("max-size-bytes", OUTAGE_BUFFER_MAX_BYTES)
 
         sink_name = element_name + "_" + id
-        sink = ioelements.StreamElement(sink_name, ip, port, mount, password)
-
+        sink = ioelements.StreamElement(sink_name, ip, port, mount, password,
+                                        backup_servers=backup_servers)
+        if outage_buffer:
+            gate = self._outage_gates[sink_name] = reconnect.OutageGate(
+                sink_name)
+            queue.get_static_pad("src").add_probe(
+                Gst.PadProbeType.BUFFER, self._on_outage_buffer_push, gate)
+
+        self._instrument_pad(queue_name, queue, "sink")
+        self._instrument_pad(sink_name, sink.gstelement, "sink")
+        self._watch_pad(sink_name, FEED_ENCODERS[feed_type])
         self._append_sink(self.stream_sink_branches, feed_type, (queue, sink))
         return sink
 
-    def create_store_branch(self, feed_type, filepath, element_name):
+    def create_store_branch(self, feed_type, filepath, element_name,
+                            segment_duration=None, segment_size=None,
+                            crash_safe=None, writer_thread=None,
+                            fallback_directories=None):
         """
         Create a file sink branch and add it to :attr:`store_sink_branches`.
 
@@ -969,18 +2567,61 @@ class Pipeline:
         :param feed_type: could be either ``audiovideo``, ``audio`` or
             ``video`` as :class:`str`
         :param filepath: full filepath as :class:`str`
+        :param segment_duration: split recording in segments of this duration
+            in seconds
+        :param segment_size: split recording in segments of this size in
+            bytes
+        :param crash_safe: write an index along the recording so that it can
+            be recovered after an interruption, default to
+            :const:`CRASH_SAFE_RECORDING`. Segmented recordings don't need
+            it, only the segment being written can be lost.
+        :param writer_thread: use branch queue as a write-behind buffer,
+            default to :const:`STORE_WRITER_THREAD`
+        :param fallback_directories: directories in which recording continues
+            when free space gets low, see :const:`STORE_MIN_FREE_SPACE`
 
         :return: :class:`~core.ioelements.StoreElement`
         """
         id = str(len(self.store_sink_branches[feed_type]["branches"]))
 
+        if writer_thread is None:
+            writer_thread = STORE_WRITER_THREAD
+
         queue_name = "queue_" + feed_type + "_filesink_" + id
         queue = GstElement("queue", queue_name, tee_output=True)
         queue.set_related_tee(self.store_sink_branches[feed_type]["tee"])
+        if writer_thread:
+            # Sink writes in queue streaming thread, the queue absorbs disk
+            # latency as long as it's not full.
+            queue.set_property("max-size-buffers", 0)
+            queue.set_property("max-size-time",
+                               int(STORE_WRITE_BUFFER_MAX_TIME * Gst.SECOND))
+            queue.set_property("max-size-bytes", STORE_WRITE_BUFFER_MAX_BYTES)
 
         sink_name = element_name + "_" + id
-        sink = ioelements.StoreElement(sink_name, filepath)
-
+        if crash_safe is None:
+            crash_safe = CRASH_SAFE_RECORDING
+        sink = ioelements.StoreElement(sink_name, filepath,
+                                       segment_duration=segment_duration,
+                                       segment_size=segment_size,
+                                       crash_safe=crash_safe,
+                                       buffer_size=STORE_BUFFER_SIZE,
+                                       buffer_mode=STORE_BUFFER_MODE,
+                                       fallback_directories=(
+                                           fallback_directories))
+        if sink.crash_safe and not sink.segmented:
+            self._add_recovery_index(sink)
+
+        stats = self._write_stats[sink_name] = storage.WriteStats(sink_name)
+        pad = sink.gstelement.get_static_pad("sink")
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_stored_buffer, stats)
+        if STORE_FSYNC_INTERVAL:
+            self._file_syncers[sink_name] = storage.FileSyncer(
+                sink.get_current_path, STORE_FSYNC_INTERVAL, stats)
+
+        self._instrument_pad(queue_name, queue, "sink")
+        self._instrument_pad(sink_name, sink.gstelement, "sink")
+        self._watch_pad(sink_name, FEED_ENCODERS[feed_type])
         self._append_sink(self.store_sink_branches, feed_type, (queue, sink))
         return sink
 
@@ -1084,7 +2725,8 @@ class Pipeline:
         --->/tee_video_source/
                  |---/queue/---/mkv_muxer/---/tee_output_video/
                  |                                |---<to output branches>
-                 |---/screen_sink/
+                 |---/queue/---/valve/---/videorate/---/videoscale/--->
+                 |    --->/capsfilter/---/screen_sink/
                  |---/vp8_encoder/--->
                   ---><to audiovideo processing (queue_muxer_video)>
 
@@ -1105,8 +2747,8 @@ class Pipeline:
         # Caps:
         caps_string = ("video/x-raw,"
                        + "format=I420,"
-                       + "width=1280,"  # TODO: adjust value
-                       + "height=720,"  # TODO: adjust value
+                       + "width={},".format(VIDEO_WIDTH)
+                       + "height={},".format(VIDEO_HEIGHT)
                        + "framerate=24/1")
         caps = Gst.caps_from_string(caps_string)
         capsfilter = GstElement("capsfilter", "capsfilter")
@@ -1139,16 +2781,34 @@ class Pipeline:
         # Muxer:
         mkv_muxer = GstElement("matroskamux", "mkv_muxer", tee_input=True)
         mkv_muxer.set_related_tee(tee_output_video)
+        # Preview:
+        queue_screensink = GstElement(
+            "queue", "queue_screensink", tee_output=True)
+        queue_screensink.set_related_tee(tee_video_source)
+        queue_screensink.set_property("leaky", 2)
+        queue_screensink.set_property("max-size-buffers", 2)
+        self.preview_valve = GstElement("valve", "preview_valve")
+        self.preview_valve.set_property("drop", not self.preview_enabled)
+        self.preview_rate = GstElement("videorate", "preview_videorate")
+        self.preview_rate.set_property("drop-only", True)
+        self.preview_rate.set_property(
+            "max-rate", self.preview_max_framerate or 2**31 - 1)
+        preview_scale = GstElement("videoscale", "preview_videoscale")
+        self.preview_capsfilter = GstElement("capsfilter",
+                                             "preview_capsfilter")
         # Sink:
-        screen_sink = GstElement("xvimagesink", "screen_sink", tee_output=True)
-        screen_sink.set_related_tee(tee_video_source)
+        screen_sink = GstElement("xvimagesink", "screen_sink")
         screen_sink.set_property("sync", False)
+        # Don't wait for a frame to preroll in case preview is disabled.
+        screen_sink.set_property("async", False)
 
         source_branch = (videorate, capsfilter, self.image_overlay,
                          self.text_overlay, tee_video_source,)
         output_branch_encoding = (vp8_encoder,)
         output_branch_muxing = (queue_muxer_av2, mkv_muxer, tee_output_video)
-        output_branch_screen = (screen_sink,)
+        output_branch_screen = (queue_screensink, self.preview_valve,
+                                self.preview_rate, preview_scale,
+                                self.preview_capsfilter, screen_sink)
 
         return (source_branch,
                 output_branch_encoding,
@@ -1214,53 +2874,3 @@ class Pipeline:
         output_branch_muxing = (webm_muxer, tee_output_audiovideo)
 
         return (source_audio, source_video, output_branch_muxing)
-
-
-class StreamingServerPipeline:
-    """
-    Pipeline able to check if a given stream sink is a working one.
-
-    :param address: server hostname or IP address
-    :param port: server port to connect to
-    :param password: server password
-    """
-    def __init__(self, address, port, password):
-        self.address = address
-        self.port = port
-        self.password = password
-        self._pipeline = None
-        self.error_message = None
-
-    def close(self):
-        self._pipeline.set_state(Gst.State.NULL)
-        self.error_message = None
-
-    def check_streamsink(self):
-        """
-        Check connect and login to the stream sink by using a minimal
-        GStreamer pipeline.
-        If an error is encountered during the process, a summary of the error
-        message would be stored in :attr:`error_message`.
-        """
-        description = ("audiotestsrc ! vorbisenc ! oggmux !"
-                       "shout2send ip={address} port={port}"
-                       " mount=/icecast_check.ogg"
-                       " password={password}".format(
-                           address=self.address, port=self.port,
-                           password=self.password))
-        self._pipeline = Gst.parse_launch(description)
-        self._pipeline.bus.add_signal_watch()
-        self._pipeline.bus.connect("message::error", self.on_error)
-
-        self._pipeline.set_state(Gst.State.PLAYING)
-
-    def on_error(self, bus, message):
-        _, debug = message.parse_error()
-        try:
-            self.error_message = debug.rsplit("failed: err=")[1].lower()
-        except IndexError:
-            logger.error(
-                "[probe pipeline] Failed to parse error message ({})".format(
-                    debug))
-        finally:
-            self._pipeline.set_state(Gst.State.NULL)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import collections
+import contextlib
+import cProfile
+import logging
+import time
+
+
+logger = logging.getLogger("core.profiling")
+
+_profiler = None
+
+
+def setup(start_time=None, cprofile_output=None):
+    """
+    Enable startup profiling.
+
+    :param start_time: reference time as returned by
+        :func:`time.perf_counter`, default to now
+    :param cprofile_output: path to a file where cProfile statistics are
+        dumped, cProfile is not used if ``None``
+
+    :return: :class:`StartupProfiler`
+    """
+    global _profiler
+    _profiler = StartupProfiler(start_time, cprofile_output)
+    return _profiler
+
+
+def get_profiler():
+    """
+    :return: current instance of :class:`StartupProfiler`, ``None`` if
+        profiling is not enabled
+    """
+    return _profiler
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Time a startup phase, it does nothing if profiling is not enabled.
+
+    :param name: name of the phase as :class:`str`
+    """
+    if _profiler is None or _profiler.finished:
+        yield
+        return
+
+    with _profiler.phase(name):
+        yield
+
+
+def mark(name):
+    """
+    Record an instant event, it does nothing if profiling is not enabled.
+
+    :param name: name of the event as :class:`str`
+    """
+    if _profiler is not None and not _profiler.finished:
+        _profiler.mark(name)
+
+
+def finish():
+    """
+    Stop profiling and log the startup report.
+    """
+    if _profiler is None or _profiler.finished:
+        return
+
+    _profiler.finish()
+    for line in _profiler.report().splitlines():
+        logger.info(line)
+
+
+class StartupProfiler:
+    """
+    Timestamp startup phases and produce a breakdown.
+
+    :param start_time: reference time as returned by
+        :func:`time.perf_counter`, default to now
+    :param cprofile_output: path to a file where cProfile statistics are
+        dumped, cProfile is not used if ``None``
+    """
+    def __init__(self, start_time=None, cprofile_output=None):
+        self.start_time = start_time or time.perf_counter()
+        self.end_time = None
+        self.finished = False
+
+        # Formatted as [(name, start, end, depth), ...]
+        self._phases = []
+        # Formatted as [(name, timestamp), ...]
+        self._marks = []
+        self._depth = 0
+
+        self._cprofile_output = cprofile_output
+        self._cprofile = None
+        if cprofile_output:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.add_phase(name, start, time.perf_counter(), self._depth)
+
+    def add_phase(self, name, start, end, depth=0):
+        """
+        Record a phase that has been timed elsewhere.
+
+        :param name: name of the phase as :class:`str`
+        :param start: start time as returned by :func:`time.perf_counter`
+        :param end: end time as returned by :func:`time.perf_counter`
+        :param depth: nesting level of the phase
+        """
+        self._phases.append((name, start, end, depth))
+
+    def mark(self, name):
+        self._marks.append((name, time.perf_counter()))
+
+    def finish(self):
+        """
+        Stop profiling and dump cProfile statistics if requested.
+        """
+        self.end_time = time.perf_counter()
+        self.finished = True
+
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self._cprofile_output)
+            logger.info("cProfile statistics dumped into {}".format(
+                self._cprofile_output))
+
+    def get_breakdown(self):
+        """
+        Get time spent in each phase. Phases sharing the same name are
+        aggregated.
+
+        :return: :class:`list` of :class:`tuple` as
+            ``(name, depth, count, duration, offset)`` where ``duration`` is
+            the total time spent in the phase and ``offset`` the time at which
+            it started for the first time, both in seconds
+        """
+        breakdown = collections.OrderedDict()
+        for name, start, end, depth in sorted(self._phases,
+                                              key=lambda p: p[1]):
+            try:
+                entry = breakdown[name]
+            except KeyError:
+                entry = breakdown[name] = [
+                    name, depth, 0, 0.0, start - self.start_time]
+            entry[2] += 1
+            entry[3] += end - start
+
+        return [tuple(entry) for entry in breakdown.values()]
+
+    def report(self):
+        """
+        :return: human readable startup breakdown as :class:`str`
+        """
+        lines = ["Startup profiling report:"]
+        for name, depth, count, duration, offset in self.get_breakdown():
+            label = "  " * depth + name
+            if count > 1:
+                label += " (x{})".format(count)
+            lines.append("  {:<40} {:>9.1f} ms  (at +{:.1f} ms)".format(
+                label, duration * 1000, offset * 1000))
+
+        for name, timestamp in self._marks:
+            lines.append("  {:<40} {:>9} ms".format(
+                name, "+{:.1f}".format((timestamp - self.start_time) * 1000)))
+
+        end_time = self.end_time or time.perf_counter()
+        lines.append("  {:<40} {:>9.1f} ms".format(
+            "Total", (end_time - self.start_time) * 1000))
+
+        return "\n".join(lines)
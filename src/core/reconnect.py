@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import logging
+import random
+import threading
+import time
+
+
+# Time to wait in seconds before the first attempt to reconnect.
+RECONNECT_INTERVAL = 5
+# Upper bound in seconds of time to wait between two attempts.
+RECONNECT_MAX_INTERVAL = 120
+# Time to wait is multiplied by this factor after each failed attempt.
+RECONNECT_BACKOFF_FACTOR = 2
+# Fraction of time to wait that is randomized, so that several encoders
+# don't reconnect in lockstep.
+RECONNECT_JITTER = .5
+
+CONNECTED = "connected"
+DISCONNECTED = "disconnected"
+RECONNECTING = "reconnecting"
+
+logger = logging.getLogger("core.reconnect")
+
+
+class ReconnectState:
+    """
+    Reconnection state machine of a stream branch.
+
+    State goes from ``connected`` to ``disconnected`` on failure, then to
+    ``reconnecting`` while an attempt is made. It goes back to ``connected``
+    if the attempt succeeds or to ``disconnected`` otherwise, waiting an
+    exponentially growing time before the next attempt.
+
+    :param name: name of the branch as :class:`str`
+    """
+    def __init__(self, name):
+        self.name = name
+
+        self._state = CONNECTED
+        # Attempts made during current outage.
+        self._attempts = 0
+        self._total_attempts = 0
+        self._outages = 0
+        self._down_since = None
+        # Downtime of previous outages in seconds.
+        self._downtime = 0
+        self._next_delay = None
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def attempts(self):
+        """
+        :return: number of attempts made during current outage
+        """
+        return self._attempts
+
+    @property
+    def down_since(self):
+        """
+        :return: date when current outage began in seconds since EPOCH,
+            ``None`` if connected
+        """
+        return self._down_since
+
+    def get_downtime(self):
+        """
+        :return: total downtime in seconds, including current outage
+        """
+        downtime = self._downtime
+        if self._down_since:
+            downtime += time.time() - self._down_since
+        return downtime
+
+    def get_delay(self):
+        """
+        Compute time to wait before next attempt using exponential backoff
+        with jitter.
+
+        :return: delay in seconds as :class:`float`
+        """
+        delay = min(RECONNECT_INTERVAL
+                    * RECONNECT_BACKOFF_FACTOR ** self._attempts,
+                    RECONNECT_MAX_INTERVAL)
+        return delay * (1 - RECONNECT_JITTER * random.random())
+
+    def on_failure(self):
+        """
+        Register a connection failure.
+
+        :return: delay in seconds before next attempt, ``None`` if the
+            failure was already registered
+        """
+        if self._state == DISCONNECTED:
+            # Several errors can be posted for the same failure.
+            return
+
+        if self._state == CONNECTED:
+            self._outages += 1
+            self._down_since = time.time()
+            logger.warning("Stream '{}' is down".format(self.name))
+
+        self._state = DISCONNECTED
+        self._next_delay = self.get_delay()
+        logger.info("Stream '{}' reconnection attempt #{} in {:.1f}s".format(
+            self.name, self._attempts + 1, self._next_delay))
+        return self._next_delay
+
+    def on_attempt(self):
+        """
+        Register a reconnection attempt.
+        """
+        self._state = RECONNECTING
+        self._attempts += 1
+        self._total_attempts += 1
+        self._next_delay = None
+
+    def on_connected(self):
+        """
+        Register a successful (re)connection.
+        """
+        if self._down_since:
+            duration = time.time() - self._down_since
+            self._downtime += duration
+            logger.info("Stream '{}' is up again after {} attempt(s)"
+                        " (downtime: {:.1f}s)".format(
+                            self.name, self._attempts, duration))
+
+        self._state = CONNECTED
+        self._attempts = 0
+        self._down_since = None
+        self._next_delay = None
+
+    def reset(self):
+        """
+        Reset current outage, e.g. when the pipeline is stopped. Counters are
+        kept.
+        """
+        if self._down_since:
+            self._downtime += time.time() - self._down_since
+
+        self._state = CONNECTED
+        self._attempts = 0
+        self._down_since = None
+        self._next_delay = None
+
+    def get_state(self):
+        """
+        :return: :class:`dict` describing reconnection state
+        """
+        return {"state": self._state,
+                "attempts": self._attempts,
+                "total_attempts": self._total_attempts,
+                "outages": self._outages,
+                "down_since": self._down_since,
+                "downtime": self.get_downtime(),
+                "next_delay": self._next_delay}
+
+
+class OutageGate:
+    """
+    Hold data back while the stream sink of an outage buffer is down.
+
+    Data is pushed by the streaming thread of the outage buffer queue. When
+    sending fails, the thread waits until a reconnection attempt is made and
+    then sends the same data again, so nothing is lost across failed
+    attempts. Meanwhile the queue keeps accepting data upstream.
+
+    :param name: name of the stream sink as :class:`str`
+    """
+    def __init__(self, name):
+        self.name = name
+        self._condition = threading.Condition()
+        self._attempts = 0
+        self._stopped = False
+        self._waiting = False
+
+    @property
+    def waiting(self):
+        """
+        ``True`` while data is held back waiting for reconnection.
+        """
+        return self._waiting
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def push(self, send, on_attempt=None):
+        """
+        Send data, retrying after each reconnection attempt until it
+        succeeds or the gate is stopped. It blocks the calling thread.
+
+        :param send: function sending data, it returns ``True`` on success
+        :param on_attempt: function called before sending data again after
+            a reconnection attempt
+
+        :return: ``True`` if data was sent, ``False`` if the gate was stopped
+        """
+        with self._condition:
+            attempts = self._attempts
+
+        while True:
+            if send():
+                self._waiting = False
+                return True
+
+            with self._condition:
+                self._waiting = True
+                while attempts == self._attempts and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    self._waiting = False
+                    return False
+                attempts = self._attempts
+
+            if on_attempt:
+                on_attempt()
+
+    def on_attempt(self):
+        """
+        Register a reconnection attempt, the stream sink must be ready to
+        receive data again.
+        """
+        with self._condition:
+            self._attempts += 1
+            self._condition.notify_all()
+
+    def start(self):
+        with self._condition:
+            self._stopped = False
+
+    def stop(self):
+        """
+        Stop holding data back, e.g. when the pipeline is stopped.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
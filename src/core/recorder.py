@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+"""
+Time series of session telemetry, recorded for post-mortem analysis.
+
+Samples are appended to a binary file made of records, each one being a
+type byte and a payload length followed by the payload:
+
+* a series record maps a series identifier to its name,
+* a sample record holds a wall-clock timestamp and ``(identifier, value)``
+  pairs of the series sampled.
+
+A record cut by a crash is discarded when the file is opened again. Once
+the file reaches its maximum size, it's renamed with a ``.1`` suffix,
+replacing the previous one, and recording goes on in a new file.
+"""
+
+import array
+import logging
+import math
+import os
+import struct
+import time
+
+
+# Interval in seconds between two samples.
+RECORDER_INTERVAL = 5
+# Maximum size in bytes of a telemetry file, up to two files are kept.
+RECORDER_MAX_SIZE = 64 * 1024 * 1024
+ROTATED_SUFFIX = ".1"
+
+MAGIC = b"HUBANGL-TELEMETRY\x01"
+SERIES_RECORD = b"S"
+SAMPLE_RECORD = b"D"
+_RECORD_HEADER = struct.Struct("<cI")
+_SERIES_ID = struct.Struct("<H")
+_TIMESTAMP = struct.Struct("<d")
+_VALUE = struct.Struct("<Hd")
+
+logger = logging.getLogger("core.recorder")
+
+
+class TelemetryError(Exception):
+    pass
+
+
+def _read_records(f):
+    """
+    Read records of an opened telemetry file, positioned after the magic.
+
+    :return: generator of ``(record type, payload, end offset)``, it stops
+        at the first incomplete record
+    """
+    while True:
+        header = f.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return
+        record_type, length = _RECORD_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        yield record_type, payload, f.tell()
+
+
+def _check_magic(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise TelemetryError("{} is not a telemetry file".format(path))
+
+
+class TelemetryRecorder:
+    """
+    Append samples of named series to a telemetry file.
+
+    :param path: path of the telemetry file
+    :param max_size: size in bytes after which the file is rotated
+    """
+    def __init__(self, path, max_size=RECORDER_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._file = None
+        # Map series name to its identifier in the current file.
+        self._series = {}
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._series = {}
+        try:
+            f = open(self.path, "r+b")
+        except FileNotFoundError:
+            f = open(self.path, "w+b")
+
+        try:
+            if f.read(1):
+                f.seek(0)
+                _check_magic(f, self.path)
+                end = f.tell()
+                for record_type, payload, end in _read_records(f):
+                    if record_type == SERIES_RECORD:
+                        series_id, = _SERIES_ID.unpack_from(payload)
+                        self._series[
+                            payload[_SERIES_ID.size:].decode()] = series_id
+                # Drop a record cut by a crash.
+                f.truncate(end)
+                f.seek(end)
+            else:
+                f.write(MAGIC)
+        except Exception:
+            f.close()
+            raise
+
+        self._file = f
+        self._size = f.tell()
+
+    def _rotate(self):
+        self._file.close()
+        os.replace(self.path, self.path + ROTATED_SUFFIX)
+        self._open()
+
+    def _write_record(self, record_type, payload):
+        self._file.write(_RECORD_HEADER.pack(record_type, len(payload))
+                         + payload)
+        self._size += _RECORD_HEADER.size + len(payload)
+
+    def record(self, values, timestamp=None):
+        """
+        Append a sample.
+
+        :param values: :class:`dict` as ``{series name: value}``
+        :param timestamp: wall-clock time of the sample, default to now
+        """
+        if self._size >= self.max_size:
+            self._rotate()
+
+        timestamp = time.time() if timestamp is None else timestamp
+        payload = [_TIMESTAMP.pack(timestamp)]
+        for name, value in values.items():
+            series_id = self._series.get(name)
+            if series_id is None:
+                series_id = self._series[name] = len(self._series)
+                self._write_record(SERIES_RECORD,
+                                   _SERIES_ID.pack(series_id) + name.encode())
+            payload.append(_VALUE.pack(series_id, value))
+        self._write_record(SAMPLE_RECORD, b"".join(payload))
+        # Samples are spread over a long time, they must not be lost in
+        # a buffer if the process is killed.
+        self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def load(*paths):
+    """
+    Load telemetry files, in the given order.
+
+    :return: ``(timestamps, series)``, ``timestamps`` is an
+        :class:`array.array` of wall-clock times and ``series`` maps series
+        names to an :class:`array.array` of values, ``NaN`` where a series
+        has no sample
+    """
+    timestamps = array.array("d")
+    series = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            _check_magic(f, path)
+            names = {}
+            for record_type, payload, _ in _read_records(f):
+                if record_type == SERIES_RECORD:
+                    series_id, = _SERIES_ID.unpack_from(payload)
+                    names[series_id] = payload[_SERIES_ID.size:].decode()
+                    continue
+                elif record_type != SAMPLE_RECORD:
+                    continue
+
+                timestamp, = _TIMESTAMP.unpack_from(payload)
+                for series_id, value in _VALUE.iter_unpack(
+                        payload[_TIMESTAMP.size:]):
+                    values = series.get(names[series_id])
+                    if values is None:
+                        values = series[names[series_id]] = array.array(
+                            "d", [math.nan] * len(timestamps))
+                    values.append(value)
+                timestamps.append(timestamp)
+                for values in series.values():
+                    if len(values) < len(timestamps):
+                        values.append(math.nan)
+    return timestamps, series
+
+
+def summarize(timestamps, series):
+    """
+    :param timestamps: wall-clock times of samples, see :func:`load`
+    :param series: values of series, see :func:`load`
+
+    :return: :class:`list` of :class:`dict` describing each series, sorted
+        by name. ``rate`` is the average increase per second of counters.
+    """
+    summary = []
+    for name, values in sorted(series.items()):
+        samples = [(timestamp, value)
+                   for timestamp, value in zip(timestamps, values)
+                   if not math.isnan(value)]
+        if not samples:
+            continue
+        only_values = [value for _, value in samples]
+        (first_time, first_value), (last_time, last_value) = \
+            samples[0], samples[-1]
+        is_counter = name.split("{", 1)[0].endswith("_total")
+        summary.append({
+            "name": name,
+            "samples": len(samples),
+            "min": min(only_values),
+            "mean": sum(only_values) / len(only_values),
+            "max": max(only_values),
+            "last": last_value,
+            "rate": ((last_value - first_value) / (last_time - first_time)
+                     if is_counter and last_time > first_time else None)})
+    return summary
+
+
+_recorder = None
+
+
+def setup(path, max_size=RECORDER_MAX_SIZE):
+    """
+    Create the telemetry recorder.
+
+    :return: :class:`TelemetryRecorder` or ``None`` if it couldn't be
+        created
+    """
+    global _recorder
+    shutdown()
+    try:
+        _recorder = TelemetryRecorder(path, max_size)
+    except (OSError, TelemetryError) as e:
+        logger.error("Could not record telemetry into {} ({})".format(path,
+                                                                     e))
+        return None
+    logger.info("Recording telemetry into {}".format(path))
+    return _recorder
+
+
+def get_recorder():
+    """
+    :return: :class:`TelemetryRecorder` or ``None`` if telemetry is not
+        recorded
+    """
+    return _recorder
+
+
+def shutdown():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
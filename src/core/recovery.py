@@ -0,0 +1,775 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+
+
+# Interval in seconds between two syncs of index files to disk.
+INDEX_SYNC_INTERVAL = 2
+INDEX_EXTENSION = ".idx"
+# Suffix added to recovered file name when not recovering in place.
+RECOVERED_SUFFIX = ".recovered"
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# EBML/Matroska element IDs.
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_TYPE = 0x83
+CLUSTER = 0x1F43B675
+TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+REFERENCE_BLOCK = 0xFB
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+VOID = 0xEC
+CRC32 = 0xBF
+TAGS = 0x1254C367
+CHAPTERS = 0x1043A770
+ATTACHMENTS = 0x1941A469
+
+TOP_LEVEL_IDS = (SEEK_HEAD, INFO, TRACKS, CLUSTER, CUES, TAGS, CHAPTERS,
+                 ATTACHMENTS)
+# Elements rebuilt during recovery.
+REBUILT_IDS = (SEEK_HEAD, CUES, VOID, CRC32)
+
+VIDEO_TRACK = 1
+
+UNKNOWN_SIZE = -1
+
+OGG_CAPTURE_PATTERN = b"OggS"
+OGG_HEADER_SIZE = 27
+
+logger = logging.getLogger("core.recovery")
+
+
+class RecoveryError(Exception):
+    """
+    Raised when a recording can't be recovered.
+    """
+
+
+def get_index_path(path):
+    """
+    :param path: path of a recording
+
+    :return: path of the index file related to the recording
+    """
+    return path + INDEX_EXTENSION
+
+
+class IndexWriter:
+    """
+    Write keyframe positions of a recording in a sidecar index file. Each
+    line is formatted as ``<byte offset> <timestamp in ns>``, timestamp is
+    ``-1`` if unknown.
+
+    The file is synced to disk at most every ``sync_interval`` seconds, so
+    an interruption loses at most that amount of index points.
+
+    :param path: path of the recording
+    :param sync_interval: interval in seconds between two syncs, default to
+        :const:`INDEX_SYNC_INTERVAL`
+    """
+    def __init__(self, path, sync_interval=None):
+        self.path = get_index_path(path)
+        self.sync_interval = (INDEX_SYNC_INTERVAL if sync_interval is None
+                              else sync_interval)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "w")
+        self._last_sync = time.monotonic()
+
+    def add(self, offset, timestamp=None):
+        """
+        Record a keyframe position.
+
+        :param offset: position in bytes of the keyframe in the recording
+        :param timestamp: timestamp of the keyframe in nanoseconds
+        """
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._file.write("{} {}\n".format(
+                offset, -1 if timestamp is None else timestamp))
+            if time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self, remove=False):
+        """
+        Close the index file.
+
+        :param remove: remove the file once closed, recording doesn't need
+            to be recovered
+        """
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._sync()
+            self._file.close()
+            self._file = None
+            if remove:
+                os.remove(self.path)
+
+
+def read_index(path):
+    """
+    Read keyframe positions written by :class:`IndexWriter`. A line
+    partially written is ignored.
+
+    :param path: path of the recording
+
+    :return: :class:`list` of ``(offset, timestamp)``
+    """
+    points = []
+    try:
+        with open(get_index_path(path)) as f:
+            for line in f:
+                try:
+                    offset, timestamp = (int(v) for v in line.split())
+                except ValueError:
+                    continue
+                points.append((offset, None if timestamp < 0 else timestamp))
+    except FileNotFoundError:
+        pass
+    return points
+
+
+def encode_id(element_id):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+
+
+def encode_size(size, length=None):
+    """
+    Encode an element data size as a variable length integer.
+
+    :param size: size in bytes, :const:`UNKNOWN_SIZE` for unknown size
+    :param length: number of bytes used, smallest length possible if
+        ``None``
+    """
+    if size == UNKNOWN_SIZE:
+        length = length or 8
+        return ((1 << (7 * length + 1)) - 1).to_bytes(length, "big")
+
+    if length is None:
+        length = 1
+        while size >= (1 << (7 * length)) - 1:
+            length += 1
+    return (size | (1 << (7 * length))).to_bytes(length, "big")
+
+
+def encode_uint(value, length=None):
+    if length is None:
+        length = max((value.bit_length() + 7) // 8, 1)
+    return value.to_bytes(length, "big")
+
+
+def encode_element(element_id, data):
+    return encode_id(element_id) + encode_size(len(data)) + data
+
+
+def _read_vint(f, keep_marker=False):
+    """
+    Read a variable length integer.
+
+    :return: ``(value, length)``, value is :const:`UNKNOWN_SIZE` if all its
+        bits are set, ``(None, 0)`` at end of file
+    """
+    first = f.read(1)
+    if not first or first == b"\x00":
+        return None, 0
+
+    first = first[0]
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+
+    rest = f.read(length - 1)
+    if len(rest) != length - 1:
+        return None, 0
+
+    if keep_marker:
+        return int.from_bytes(bytes([first]) + rest, "big"), length
+
+    value = int.from_bytes(bytes([first & (mask - 1)]) + rest, "big")
+    if value == (1 << (7 * length)) - 1:
+        value = UNKNOWN_SIZE
+    return value, length
+
+
+def _read_element_header(f):
+    """
+    :return: ``(id, size, header length)``, ``(None, None, 0)`` if the
+        header can't be read
+    """
+    element_id, id_length = _read_vint(f, keep_marker=True)
+    if element_id is None:
+        return None, None, 0
+    size, size_length = _read_vint(f)
+    if size is None:
+        return None, None, 0
+    return element_id, size, id_length + size_length
+
+
+def _iter_children(data):
+    """
+    Iterate over children of a master element whose data is ``data``.
+
+    :return: generator of ``(id, child data)``
+    """
+    position = 0
+    while position < len(data):
+        view = _BytesReader(data, position)
+        element_id, size, header_length = _read_element_header(view)
+        if element_id is None or size == UNKNOWN_SIZE:
+            return
+        start = position + header_length
+        if start + size > len(data):
+            return
+        yield element_id, data[start:start + size]
+        position = start + size
+
+
+class _BytesReader:
+    """
+    Minimal file-like reader over a :class:`bytes` object.
+    """
+    def __init__(self, data, position=0):
+        self._data = data
+        self._position = position
+
+    def read(self, size):
+        chunk = self._data[self._position:self._position + size]
+        self._position += len(chunk)
+        return chunk
+
+
+def _parse_block_header(data):
+    """
+    :return: ``(track number, relative timecode, flags)``
+    """
+    reader = _BytesReader(data)
+    track, length = _read_vint(reader)
+    if track is None or len(data) < length + 3:
+        raise ValueError("Truncated block header")
+    timecode, flags = struct.unpack(">hB", data[length:length + 3])
+    return track, timecode, flags
+
+
+class _Cluster:
+    def __init__(self, start, end, timecode):
+        # Position of cluster children in source file.
+        self.start = start
+        self.end = end
+        self.timecode = timecode
+        # Formatted as {track number: absolute timecode of first keyframe}
+        self.keyframes = {}
+        self.last_timecode = timecode
+
+
+class MatroskaRecovery:
+    """
+    Rebuild a Matroska/WebM recording that has not been finalized.
+
+    Source file is scanned without reading frame data. The rebuilt file
+    gets known element sizes, a duration, a seek head and cues, so that it
+    is seekable. Data past the last complete element is dropped.
+
+    :param path: path of the recording
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file_size = os.path.getsize(path)
+
+        self.header = None
+        self.timecode_scale = 1000000
+        self.info_children = []
+        self.tracks = None
+        # Formatted as {track number: track type}
+        self.track_types = {}
+        # Top-level elements copied as is.
+        self.extra_elements = []
+        self.clusters = []
+        # Offsets of clusters known from the index file.
+        self._index_offsets = sorted(offset for offset, _
+                                     in read_index(path))
+
+    def scan(self):
+        """
+        Scan the recording structure.
+
+        :raise: :class:`RecoveryError` if it's not a Matroska file
+        """
+        with open(self.path, "rb") as f:
+            element_id, size, header_length = _read_element_header(f)
+            if element_id != EBML or size == UNKNOWN_SIZE:
+                raise RecoveryError("Not a Matroska file")
+            f.seek(0)
+            self.header = f.read(header_length + size)
+
+            element_id, size, _ = _read_element_header(f)
+            if element_id != SEGMENT:
+                raise RecoveryError("Segment not found")
+            segment_end = self.file_size
+            if size != UNKNOWN_SIZE:
+                segment_end = min(f.tell() + size, segment_end)
+
+            self._scan_segment(f, segment_end)
+
+        if self.tracks is None:
+            raise RecoveryError("Tracks not found")
+        if not self.clusters:
+            raise RecoveryError("No complete cluster found")
+
+    def _scan_segment(self, f, segment_end):
+        while f.tell() < segment_end:
+            position = f.tell()
+            element_id, size, header_length = _read_element_header(f)
+            if element_id == CLUSTER:
+                next_position = self._scan_cluster(f, position, size,
+                                                   header_length, segment_end)
+                if next_position is None:
+                    break
+                f.seek(next_position)
+                continue
+            elif element_id not in TOP_LEVEL_IDS + REBUILT_IDS:
+                # Data is corrupted, try to resume at next known cluster.
+                next_position = self._get_next_indexed_cluster(f, position)
+                if next_position is None:
+                    break
+                logger.warning("Skipped corrupted data at {} in {}".format(
+                    position, self.path))
+                f.seek(next_position)
+                continue
+
+            end = position + header_length + size
+            if size == UNKNOWN_SIZE or end > segment_end:
+                break
+
+            if element_id in REBUILT_IDS:
+                f.seek(end)
+                continue
+
+            data = f.read(size)
+            if element_id == INFO:
+                self._parse_info(data)
+            elif element_id == TRACKS:
+                self.tracks = encode_element(TRACKS, data)
+                self._parse_tracks(data)
+            else:
+                self.extra_elements.append(encode_element(element_id, data))
+
+    def _get_next_indexed_cluster(self, f, position):
+        for offset in self._index_offsets:
+            if offset <= position:
+                continue
+            f.seek(offset)
+            element_id, _, _ = _read_element_header(f)
+            if element_id == CLUSTER:
+                return offset
+
+    def _parse_info(self, data):
+        for element_id, child in _iter_children(data):
+            if element_id == TIMECODE_SCALE:
+                self.timecode_scale = int.from_bytes(child, "big")
+            if element_id not in (DURATION, VOID, CRC32):
+                self.info_children.append(encode_element(element_id, child))
+
+    def _parse_tracks(self, data):
+        for element_id, entry in _iter_children(data):
+            if element_id != TRACK_ENTRY:
+                continue
+            number = track_type = None
+            for child_id, child in _iter_children(entry):
+                if child_id == TRACK_NUMBER:
+                    number = int.from_bytes(child, "big")
+                elif child_id == TRACK_TYPE:
+                    track_type = int.from_bytes(child, "big")
+            if number is not None:
+                self.track_types[number] = track_type
+
+    def _scan_cluster(self, f, position, size, header_length, segment_end):
+        """
+        :return: position of the next top-level element, ``None`` if there
+            is nothing else to read
+        """
+        start = position + header_length
+        end = segment_end
+        if size != UNKNOWN_SIZE:
+            end = min(start + size, segment_end)
+
+        cluster = None
+        complete_end = start
+        next_position = end
+        truncated = False
+        f.seek(start)
+        while f.tell() < end:
+            child_position = f.tell()
+            element_id, child_size, child_header_length = \
+                _read_element_header(f)
+            if element_id is None:
+                truncated = True
+                break
+            if size == UNKNOWN_SIZE and element_id in TOP_LEVEL_IDS:
+                # Unknown-sized cluster ends where next top-level element
+                # begins.
+                next_position = child_position
+                break
+            child_end = child_position + child_header_length + child_size
+            if child_size == UNKNOWN_SIZE or child_end > end:
+                truncated = True
+                break
+
+            try:
+                if element_id == TIMECODE:
+                    timecode = int.from_bytes(f.read(child_size), "big")
+                    cluster = _Cluster(start, child_end, timecode)
+                elif element_id == SIMPLE_BLOCK and cluster:
+                    track, timecode, flags = _parse_block_header(
+                        f.read(min(child_size, 16)))
+                    self._add_block(cluster, track, timecode, flags & 0x80)
+                elif element_id == BLOCK_GROUP and cluster:
+                    self._parse_block_group(cluster, f.read(child_size))
+            except ValueError:
+                truncated = True
+                break
+
+            complete_end = child_end
+            f.seek(child_end)
+
+        if truncated:
+            # Data may be corrupted rather than truncated.
+            next_position = self._get_next_indexed_cluster(f, child_position)
+        elif next_position >= segment_end:
+            next_position = None
+
+        if cluster is None:
+            # Cluster timecode is missing, cluster can't be used.
+            return next_position
+
+        cluster.end = complete_end
+        self.clusters.append(cluster)
+        return next_position
+
+    def _parse_block_group(self, cluster, data):
+        block = None
+        keyframe = True
+        for element_id, child in _iter_children(data):
+            if element_id == BLOCK:
+                block = child
+            elif element_id == REFERENCE_BLOCK:
+                keyframe = False
+        if block is not None:
+            track, timecode, _ = _parse_block_header(block)
+            self._add_block(cluster, track, timecode, keyframe)
+
+    def _add_block(self, cluster, track, timecode, keyframe):
+        absolute_timecode = cluster.timecode + timecode
+        cluster.last_timecode = max(cluster.last_timecode, absolute_timecode)
+        if keyframe and track not in cluster.keyframes:
+            cluster.keyframes[track] = absolute_timecode
+
+    def get_cue_track(self):
+        """
+        :return: number of the track used for cues, first video track if any
+        """
+        for number, track_type in sorted(self.track_types.items()):
+            if track_type == VIDEO_TRACK:
+                return number
+        return min(self.track_types) if self.track_types else 1
+
+    def get_duration(self):
+        """
+        :return: duration in timecode scale units as :class:`float`
+        """
+        first = self.clusters[0].timecode
+        return float(max(cluster.last_timecode for cluster in self.clusters)
+                     - first)
+
+    def write(self, output):
+        """
+        Write the rebuilt recording.
+
+        :param output: path of the rebuilt file
+
+        :return: :class:`dict` describing the rebuilt file
+        """
+        cue_track = self.get_cue_track()
+        with open(self.path, "rb") as source, open(output, "wb") as f:
+            f.write(self.header)
+            segment_position = f.tell()
+            f.write(encode_id(SEGMENT) + encode_size(0, 8))
+            segment_start = f.tell()
+
+            seek_head_position = f.tell()
+            f.write(self._build_seek_head({INFO: 0, TRACKS: 0, CUES: 0}))
+
+            positions = {INFO: f.tell() - segment_start}
+            f.write(encode_element(
+                INFO,
+                b"".join(self.info_children)
+                + encode_id(DURATION) + encode_size(8)
+                + struct.pack(">d", self.get_duration())))
+            positions[TRACKS] = f.tell() - segment_start
+            f.write(self.tracks)
+            for element in self.extra_elements:
+                f.write(element)
+
+            cue_points = []
+            for cluster in self.clusters:
+                cluster_position = f.tell() - segment_start
+                f.write(encode_id(CLUSTER)
+                        + encode_size(cluster.end - cluster.start, 8))
+                self._copy(source, f, cluster.start, cluster.end)
+                if cue_track in cluster.keyframes:
+                    cue_points.append((cluster.keyframes[cue_track],
+                                       cluster_position))
+
+            positions[CUES] = f.tell() - segment_start
+            f.write(self._build_cues(cue_track, cue_points))
+            segment_size = f.tell() - segment_start
+
+            f.seek(segment_position + len(encode_id(SEGMENT)))
+            f.write(encode_size(segment_size, 8))
+            f.seek(seek_head_position)
+            f.write(self._build_seek_head(positions))
+
+        return {"clusters": len(self.clusters),
+                "cues": len(cue_points),
+                "duration": (self.get_duration() * self.timecode_scale
+                             / 1000000000)}
+
+    def _copy(self, source, destination, start, end):
+        source.seek(start)
+        remaining = end - start
+        while remaining:
+            chunk = source.read(min(remaining, COPY_CHUNK_SIZE))
+            if not chunk:
+                raise RecoveryError("Unexpected end of file")
+            destination.write(chunk)
+            remaining -= len(chunk)
+
+    def _build_seek_head(self, positions):
+        # Fixed length positions, so that size doesn't change once positions
+        # are known.
+        seeks = b"".join(
+            encode_element(SEEK,
+                           encode_element(SEEK_ID, encode_id(element_id))
+                           + encode_element(SEEK_POSITION,
+                                            encode_uint(position, 8)))
+            for element_id, position in positions.items())
+        return encode_element(SEEK_HEAD, seeks)
+
+    def _build_cues(self, cue_track, cue_points):
+        points = b"".join(
+            encode_element(
+                CUE_POINT,
+                encode_element(CUE_TIME, encode_uint(timecode))
+                + encode_element(
+                    CUE_TRACK_POSITIONS,
+                    encode_element(CUE_TRACK, encode_uint(cue_track))
+                    + encode_element(CUE_CLUSTER_POSITION,
+                                     encode_uint(position))))
+            for timecode, position in cue_points)
+        return encode_element(CUES, points)
+
+
+def recover_ogg(path, output):
+    """
+    Truncate an Ogg recording to its last complete page.
+
+    :param path: path of the recording
+    :param output: path of the recovered file
+
+    :return: :class:`dict` describing the recovered file
+    """
+    pages = 0
+    end = 0
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(OGG_HEADER_SIZE)
+            if (len(header) < OGG_HEADER_SIZE
+                    or not header.startswith(OGG_CAPTURE_PATTERN)):
+                break
+            segment_table = f.read(header[26])
+            if len(segment_table) < header[26]:
+                break
+            page_end = f.tell() + sum(segment_table)
+            if page_end > os.path.getsize(path):
+                break
+            f.seek(page_end)
+            end = page_end
+            pages += 1
+
+        if not pages:
+            raise RecoveryError("No complete Ogg page found")
+
+        with open(output, "wb") as destination:
+            f.seek(0)
+            remaining = end
+            while remaining:
+                chunk = f.read(min(remaining, COPY_CHUNK_SIZE))
+                destination.write(chunk)
+                remaining -= len(chunk)
+
+    return {"pages": pages, "dropped_bytes": os.path.getsize(path) - end}
+
+
+def needs_remux(path):
+    """
+    Check if a recording lacks what players need to seek in it, as a file
+    written by a streamable muxer: a Matroska segment or cluster of unknown
+    size, or no cues. Ogg recordings are seeked by bisection, they never
+    need it.
+
+    :param path: path of the recording
+
+    :return: ``True`` if the recording must be remuxed to be seekable
+
+    :raise: :class:`RecoveryError` if the file format is not supported
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        if magic == OGG_CAPTURE_PATTERN:
+            return False
+        elif magic != encode_id(EBML):
+            raise RecoveryError("Unsupported file format")
+
+        f.seek(0)
+        element_id, size, header_length = _read_element_header(f)
+        if size == UNKNOWN_SIZE:
+            raise RecoveryError("Not a Matroska file")
+        f.seek(header_length + size)
+
+        element_id, size, _ = _read_element_header(f)
+        if element_id != SEGMENT or size == UNKNOWN_SIZE:
+            return True
+
+        segment_end = f.tell() + size
+        while f.tell() < segment_end:
+            element_id, size, _ = _read_element_header(f)
+            if element_id is None or size == UNKNOWN_SIZE:
+                # Element is cut or has been written by a live muxer.
+                return True
+            elif element_id == CUES:
+                return False
+            f.seek(size, os.SEEK_CUR)
+    return True
+
+
+def get_recovered_path(path):
+    root, extension = os.path.splitext(path)
+    return root + RECOVERED_SUFFIX + extension
+
+
+def recover(path, output=None, in_place=False):
+    """
+    Recover an interrupted recording.
+
+    :param path: path of the recording
+    :param output: path of the recovered file, default to ``path`` with
+        :const:`RECOVERED_SUFFIX` added before the extension
+    :param in_place: replace the recording with the recovered file, index
+        file is removed afterwards
+
+    :return: :class:`dict` describing the recovered file, it contains at
+        least the ``output`` key
+
+    :raise: :class:`RecoveryError` if the recording can't be recovered
+    """
+    if in_place:
+        output = path + RECOVERED_SUFFIX
+    elif output is None:
+        output = get_recovered_path(path)
+
+    with open(path, "rb") as f:
+        magic = f.read(4)
+
+    try:
+        if magic == OGG_CAPTURE_PATTERN:
+            result = recover_ogg(path, output)
+        elif magic == encode_id(EBML):
+            recovery = MatroskaRecovery(path)
+            recovery.scan()
+            result = recovery.write(output)
+        else:
+            raise RecoveryError("Unsupported file format")
+    except Exception:
+        if os.path.exists(output):
+            os.remove(output)
+        raise
+
+    if in_place:
+        shutil.move(output, path)
+        output = path
+        try:
+            os.remove(get_index_path(path))
+        except FileNotFoundError:
+            pass
+
+    result["output"] = output
+    logger.info("Recording {} recovered into {}".format(path, output))
+    return result
+
+
+def find_interrupted_recordings(directory):
+    """
+    Find recordings in ``directory`` that have an index file left, meaning
+    they have not been finalized.
+
+    :return: :class:`list` of paths
+    """
+    recordings = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(INDEX_EXTENSION):
+            continue
+        path = os.path.join(directory, name[:-len(INDEX_EXTENSION)])
+        if os.path.isfile(path):
+            recordings.append(path)
+    return recordings
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import collections
+import logging
+import os
+import threading
+import time
+
+
+# Duration in seconds over which write rate is computed.
+RATE_WINDOW = 5
+# Extension of manifests chaining files of a recording, they are M3U
+# playlists.
+MANIFEST_EXTENSION = ".m3u"
+
+logger = logging.getLogger("core.storage")
+
+
+class WriteStats:
+    """
+    Throughput counters of a recording. Counters are updated from GStreamer
+    streaming thread and from :class:`FileSyncer` thread, and can be read
+    from any thread.
+
+    :param name: name of the recording as :class:`str`
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._start_time = None
+        self._bytes = 0
+        self._buffers = 0
+        # Formatted as deque([(timestamp, total bytes), ...])
+        self._samples = collections.deque()
+        self._fsyncs = 0
+        self._last_fsync_duration = 0
+        self._max_fsync_duration = 0
+
+    def add(self, size, now=None):
+        """
+        Register a buffer of ``size`` bytes handed to the file sink.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = now
+            self._bytes += size
+            self._buffers += 1
+            self._samples.append((now, self._bytes))
+            while now - self._samples[0][0] > RATE_WINDOW:
+                self._samples.popleft()
+
+    def on_fsync(self, duration):
+        """
+        Register a sync to disk that took ``duration`` seconds.
+        """
+        with self._lock:
+            self._fsyncs += 1
+            self._last_fsync_duration = duration
+            self._max_fsync_duration = max(self._max_fsync_duration,
+                                           duration)
+
+    def get_rate(self, now=None):
+        """
+        :return: write rate in bytes per second over the last
+            :const:`RATE_WINDOW` seconds
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            samples = [sample for sample in self._samples
+                       if now - sample[0] <= RATE_WINDOW]
+            if len(samples) < 2:
+                return 0.0
+            (first_time, first_bytes), (last_time, last_bytes) = \
+                samples[0], samples[-1]
+            if last_time == first_time:
+                return 0.0
+            return (last_bytes - first_bytes) / (last_time - first_time)
+
+    def get_stats(self, now=None):
+        """
+        :return: :class:`dict` describing throughput of the recording
+        """
+        now = time.monotonic() if now is None else now
+        rate = self.get_rate(now)
+        with self._lock:
+            elapsed = (now - self._start_time
+                       if self._start_time is not None else 0)
+            return {"bytes": self._bytes,
+                    "buffers": self._buffers,
+                    "rate": rate,
+                    "average_rate": self._bytes / elapsed if elapsed else 0.0,
+                    "fsyncs": self._fsyncs,
+                    "last_fsync_duration": self._last_fsync_duration,
+                    "max_fsync_duration": self._max_fsync_duration}
+
+
+class FileSyncer:
+    """
+    Periodically sync a recording to disk from a dedicated thread, so that
+    disk latency never stalls GStreamer streaming threads.
+
+    Only data already written to the file is synced: data still held in the
+    write buffer of the sink is not, so a periodic sync leaves up to a
+    buffer of recent data unsynced. The sink writes its buffer once it's
+    closed, the last sync done on :meth:`stop` then covers the whole file.
+
+    :param get_path: function returning path of the file being written, it
+        can change over time (e.g. segmented recording)
+    :param interval: interval in seconds between two syncs
+    :param stats: :class:`WriteStats` updated after each sync
+    """
+    def __init__(self, get_path, interval, stats=None):
+        self._get_path = get_path
+        self.interval = interval
+        self._stats = stats
+        self._stop_event = None
+        # Functions called once the running thread exits.
+        self._stopped_callbacks = None
+        # Files synced before the running thread exits, the current one if
+        # empty.
+        self._last_paths = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread:
+            return
+
+        self._stop_event = threading.Event()
+        self._stopped_callbacks = []
+        self._last_paths = []
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(self._stop_event, self._stopped_callbacks,
+                  self._last_paths),
+            daemon=True, name="file_syncer")
+        self._thread.start()
+
+    def stop(self, on_stopped=None, paths=None):
+        """
+        Stop syncing, a last sync is done before the thread exits. It
+        doesn't wait for that sync, so that disk latency never stalls the
+        caller.
+
+        :param on_stopped: function called from the syncer thread once the
+            last sync is done
+        :param paths: files synced by the last sync, default to the current
+            file. Files must be closed to be synced entirely.
+        """
+        if not self._thread:
+            return
+
+        if on_stopped:
+            self._stopped_callbacks.append(on_stopped)
+        if paths:
+            self._last_paths.extend(paths)
+        self._stop_event.set()
+        self._thread = None
+
+    def _run(self, stop_event, stopped_callbacks, last_paths):
+        while not stop_event.wait(self.interval):
+            self.sync()
+        for path in last_paths or [None]:
+            self.sync(path)
+        for callback in stopped_callbacks:
+            callback()
+
+    def sync(self, path=None):
+        """
+        Sync a file to disk. Data written by any file descriptor referring to
+        that file is synced.
+
+        :param path: path of the file, default to the current one
+        """
+        if path is None:
+            path = self._get_path()
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            # File is not created yet.
+            return
+
+        start = time.monotonic()
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            logger.warning("Failed to sync {} ({})".format(path, e))
+            return
+        finally:
+            os.close(fd)
+
+        if self._stats:
+            self._stats.on_fsync(time.monotonic() - start)
+
+
+def get_free_space(path):
+    """
+    :return: space in bytes available to unprivileged users on the file
+        system of ``path``, ``None`` if it can't be determined
+    """
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def choose_directory(directories, min_free_space):
+    """
+    Choose the first directory having enough free space.
+
+    :param directories: candidate directories, in order of preference
+    :param min_free_space: minimum free space in bytes
+
+    :return: directory as :class:`str` or ``None`` if none is suitable
+    """
+    for directory in directories:
+        free_space = get_free_space(directory)
+        if free_space is not None and free_space >= min_free_space:
+            return directory
+
+
+def get_manifest_path(location, directory=None):
+    """
+    :param location: path of the first file of a recording
+    :param directory: directory of the manifest, default to the one of
+        ``location``
+
+    :return: path of the manifest chaining files of the recording
+    """
+    root = os.path.splitext(os.path.basename(location))[0]
+    return os.path.join(directory or os.path.dirname(location),
+                        root + MANIFEST_EXTENSION)
+
+
+def write_manifest(path, files):
+    """
+    Write a playlist chaining files of a recording split across several
+    directories, in playing order. It's written atomically.
+
+    :param path: path of the manifest
+    :param files: paths of files
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write("#EXTM3U\n")
+        for file_path in files:
+            f.write(os.path.abspath(file_path) + "\n")
+    os.replace(temp_path, path)
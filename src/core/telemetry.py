@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import collections
+import threading
+
+
+# Fill ratio above which a queue is considered near capacity.
+QUEUE_HIGH_WATERMARK = .9
+# Duration in seconds a queue must stay near capacity, or without dropping
+# buffers, before an alert is raised or cleared.
+QUEUE_ALERT_DURATION = 5
+# Number of samples kept per queue.
+QUEUE_HISTORY_SIZE = 60
+# Duration in seconds over which realtime health is computed.
+HEALTH_WINDOW = 10
+# Health score in percent below which realtime health is degraded.
+HEALTH_WARNING_SCORE = 90
+# Duration in seconds of windows over which audio and video latencies are
+# compared to measure their drift.
+AV_SYNC_WINDOW = 10
+# Number of drift measures kept, four hours worth of windows.
+AV_SYNC_HISTORY_SIZE = 4 * 3600 // AV_SYNC_WINDOW
+
+# Alerts returned by QueueMonitor.check()
+CONGESTED = "congested"
+DECONGESTED = "decongested"
+LEAKING = "leaking"
+STOPPED_LEAKING = "stopped leaking"
+
+# Streams compared by AvSyncMonitor
+AUDIO = "audio"
+VIDEO = "video"
+
+QueueSample = collections.namedtuple(
+    "QueueSample", ("time", "buffers", "bytes", "level_time", "fill"))
+HealthSample = collections.namedtuple(
+    "HealthSample", ("time", "frames_in", "frames_out", "dropped",
+                     "duplicated", "late"))
+
+
+def get_fill_ratio(levels, limits):
+    """
+    :param levels: current levels as ``(buffers, bytes, time)``
+    :param limits: maximum levels as ``(buffers, bytes, time)``, ``0``
+        meaning no limit
+
+    :return: fill ratio of the most constraining limit, between 0 and 1
+    """
+    ratios = [level / limit for level, limit in zip(levels, limits) if limit]
+    return min(max(ratios), 1.0) if ratios else 0.0
+
+
+class QueueMonitor:
+    """
+    Fill level history of a queue element. Samples are added periodically,
+    overruns are registered from GStreamer streaming thread.
+
+    :param name: name of the queue as :class:`str`
+    :param leaky: ``True`` if queue drops buffers when full
+    """
+    def __init__(self, name, leaky=False):
+        self.name = name
+        self.leaky = leaky
+        self.samples = collections.deque(maxlen=QUEUE_HISTORY_SIZE)
+        self.congested = False
+        self.leaking = False
+        self._lock = threading.Lock()
+        self._overruns = 0
+        self._checked_overruns = 0
+        self._high_since = None
+        self._low_since = None
+        self._last_drop_time = None
+
+    @property
+    def overruns(self):
+        """
+        Number of times a buffer reached the queue while it was full. For a
+        leaky queue, it's the number of dropped buffers.
+        """
+        with self._lock:
+            return self._overruns
+
+    def on_overrun(self):
+        with self._lock:
+            self._overruns += 1
+
+    def add_sample(self, now, levels, limits):
+        """
+        :param now: monotonic time of the sample
+        :param levels: current levels as ``(buffers, bytes, nanoseconds)``
+        :param limits: maximum levels as ``(buffers, bytes, nanoseconds)``
+        """
+        self.samples.append(QueueSample(now, levels[0], levels[1],
+                                        levels[2] / 1e9,
+                                        get_fill_ratio(levels, limits)))
+
+    def check(self, now):
+        """
+        Update alert states after new samples.
+
+        :return: :class:`list` of alerts raised or cleared since last check
+        """
+        alerts = []
+        if self.samples:
+            if self.samples[-1].fill >= QUEUE_HIGH_WATERMARK:
+                self._low_since = None
+                if self._high_since is None:
+                    self._high_since = now
+                if (not self.congested
+                        and now - self._high_since >= QUEUE_ALERT_DURATION):
+                    self.congested = True
+                    alerts.append(CONGESTED)
+            else:
+                self._high_since = None
+                if self._low_since is None:
+                    self._low_since = now
+                if (self.congested
+                        and now - self._low_since >= QUEUE_ALERT_DURATION):
+                    self.congested = False
+                    alerts.append(DECONGESTED)
+
+        if self.leaky:
+            overruns = self.overruns
+            if overruns > self._checked_overruns:
+                self._last_drop_time = now
+                if not self.leaking:
+                    self.leaking = True
+                    alerts.append(LEAKING)
+            elif (self.leaking
+                    and now - self._last_drop_time >= QUEUE_ALERT_DURATION):
+                self.leaking = False
+                alerts.append(STOPPED_LEAKING)
+            self._checked_overruns = overruns
+
+        return alerts
+
+    def get_stats(self):
+        """
+        :return: :class:`dict` describing queue levels
+        """
+        samples = tuple(self.samples)
+        last = samples[-1] if samples else QueueSample(None, 0, 0, 0.0, 0.0)
+        fills = [sample.fill for sample in samples]
+        stats = {"buffers": last.buffers,
+                 "bytes": last.bytes,
+                 "time": last.level_time,
+                 "fill": last.fill,
+                 "max_fill": max(fills) if fills else 0.0,
+                 "average_fill": sum(fills) / len(fills) if fills else 0.0,
+                 "overruns": self.overruns,
+                 "congested": self.congested}
+        if self.leaky:
+            stats["dropped"] = stats["overruns"]
+            stats["leaking"] = self.leaking
+        return stats
+
+
+class QosStats:
+    """
+    Quality of service reported by an element through QoS messages, e.g.
+    frames lost by a source or dropped by a late sink.
+
+    :param name: name of the element as :class:`str`
+    """
+    def __init__(self, name):
+        self.name = name
+        self.messages = 0
+        self.jitter = None
+        self.proportion = None
+        self._lock = threading.Lock()
+        # Counters are reset by the element on flush and state change to
+        # READY, totals since the first message are kept in bases.
+        self._processed_base = 0
+        self._processed = 0
+        self._dropped_base = 0
+        self._dropped = 0
+
+    def on_qos(self, processed, dropped, jitter, proportion):
+        """
+        :param processed: units processed since the element was reset,
+            ``None`` if unknown
+        :param dropped: units dropped since the element was reset, ``None``
+            if unknown
+        :param jitter: lateness in seconds of the last unit
+        :param proportion: long term processing rate, above 1 the element
+            can't keep up
+        """
+        with self._lock:
+            self.messages += 1
+            self.jitter = jitter
+            self.proportion = proportion
+            if processed is not None:
+                if processed < self._processed:
+                    self._processed_base += self._processed
+                self._processed = processed
+            if dropped is not None:
+                if dropped < self._dropped:
+                    self._dropped_base += self._dropped
+                self._dropped = dropped
+
+    @property
+    def dropped(self):
+        with self._lock:
+            return self._dropped_base + self._dropped
+
+    def get_stats(self):
+        """
+        :return: :class:`dict` describing quality of service of the element
+        """
+        with self._lock:
+            return {"messages": self.messages,
+                    "processed": self._processed_base + self._processed,
+                    "dropped": self._dropped_base + self._dropped,
+                    "jitter": self.jitter,
+                    "proportion": self.proportion}
+
+
+class RealtimeHealth:
+    """
+    Realtime health of the video path, computed on samples of cumulative
+    frame counters taken over the last :const:`HEALTH_WINDOW` seconds.
+
+    The score is the percentage of output frames that are genuine: frames
+    duplicated to fill gaps and frames lost or dropped for lateness count
+    against it. Frames dropped by rate conversion don't, a source faster
+    than the output framerate is expected.
+    """
+    def __init__(self):
+        self.samples = collections.deque()
+
+    def reset(self):
+        self.samples.clear()
+
+    def add_sample(self, now, frames_in, frames_out, dropped, duplicated,
+                   late):
+        """
+        :param now: monotonic time of the sample
+        :param frames_in: frames received by the rate converter
+        :param frames_out: frames sent by the rate converter
+        :param dropped: frames dropped by the rate converter
+        :param duplicated: frames duplicated by the rate converter
+        :param late: frames lost or dropped for lateness
+        """
+        sample = HealthSample(now, frames_in, frames_out, dropped,
+                              duplicated, late)
+        if self.samples and any(
+                value < previous for value, previous
+                in zip(sample[1:], self.samples[-1][1:])):
+            # Counters have been reset, e.g. pipeline has been restarted.
+            self.samples.clear()
+        self.samples.append(sample)
+        while now - self.samples[0].time > HEALTH_WINDOW:
+            self.samples.popleft()
+
+    def get_stats(self):
+        """
+        :return: :class:`dict` of frame counts over the window and health
+            ``score`` in percent, ``None`` if there's not enough samples
+        """
+        if len(self.samples) < 2:
+            return None
+
+        first, last = self.samples[0], self.samples[-1]
+        stats = {field: getattr(last, field) - getattr(first, field)
+                 for field in HealthSample._fields}
+        stats["duration"] = stats.pop("time")
+        if stats["frames_out"] <= 0:
+            # Video is frozen.
+            stats["score"] = 0.0
+        else:
+            bad_frames = stats["duplicated"] + stats["late"]
+            stats["score"] = 100 * max(
+                0.0, 1 - bad_frames / stats["frames_out"])
+        return stats
+
+
+class AvSyncMonitor:
+    """
+    Drift between audio and video captured on different hardware clocks.
+
+    Latency since capture of audio and video buffers is compared at the
+    muxer inputs. Their lowest latency over each :const:`AV_SYNC_WINDOW`
+    filters out scheduling delays, the offset between both is then
+    compared to the one of the first window. Samples are added from both
+    GStreamer streaming threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Drift in seconds at the end of each window, formatted as
+        # deque([(monotonic time, drift), ...])
+        self.history = collections.deque(maxlen=AV_SYNC_HISTORY_SIZE)
+        self._baseline = None
+        self._window_start = None
+        self._lowest_latencies = {AUDIO: None, VIDEO: None}
+
+    def reset(self):
+        with self._lock:
+            self.history.clear()
+            self._baseline = None
+            self._window_start = None
+            self._lowest_latencies = {AUDIO: None, VIDEO: None}
+
+    def add(self, stream, now, latency):
+        """
+        :param stream: :const:`AUDIO` or :const:`VIDEO`
+        :param now: monotonic time at which the buffer arrived
+        :param latency: time in seconds since the buffer was captured
+        """
+        with self._lock:
+            if self._window_start is None:
+                self._window_start = now
+            elif now - self._window_start >= AV_SYNC_WINDOW:
+                self._close_window(now)
+            lowest = self._lowest_latencies[stream]
+            if lowest is None or latency < lowest:
+                self._lowest_latencies[stream] = latency
+
+    def _close_window(self, now):
+        audio = self._lowest_latencies[AUDIO]
+        video = self._lowest_latencies[VIDEO]
+        if audio is not None and video is not None:
+            offset = audio - video
+            if self._baseline is None:
+                self._baseline = offset
+            self.history.append((now, offset - self._baseline))
+        self._window_start = now
+        self._lowest_latencies = {AUDIO: None, VIDEO: None}
+
+    @property
+    def drift(self):
+        """
+        Drift in seconds measured on the last window, positive if audio
+        gets late relatively to video. ``None`` until a window is complete.
+        """
+        with self._lock:
+            return self.history[-1][1] if self.history else None
+
+    def get_stats(self):
+        """
+        :return: :class:`dict` describing drift in seconds, ``drift_rate``
+            is the trend in seconds per hour
+        """
+        with self._lock:
+            history = tuple(self.history)
+        stats = {"drift": history[-1][1] if history else None,
+                 "max_drift": (max((drift for _, drift in history), key=abs)
+                               if history else None),
+                 "drift_rate": None,
+                 "duration": (history[-1][0] - history[0][0]
+                              if history else 0)}
+        if len(history) >= 2:
+            # Least squares slope of drift over time.
+            times = [sample_time for sample_time, _ in history]
+            mean_time = sum(times) / len(times)
+            mean_drift = sum(drift for _, drift in history) / len(history)
+            variance = sum((sample_time - mean_time) ** 2
+                           for sample_time in times)
+            if variance:
+                stats["drift_rate"] = 3600 * sum(
+                    (sample_time - mean_time) * (drift - mean_drift)
+                    for sample_time, drift in history) / variance
+        return stats
+
+
+def get_av_delays(audio_delay, video_delay, offset):
+    """
+    Delays to apply to audio and video so that audio ends up delayed by
+    ``offset`` relative to video. Current delays are never reduced, since
+    running time would then go backwards into the muxer: the stream that
+    has to be late gets more delay instead.
+
+    :param audio_delay: current delay of audio in seconds
+    :param video_delay: current delay of video in seconds
+    :param offset: delay of audio relative to video in seconds, video is
+        delayed if it's negative
+
+    :return: ``(audio delay, video delay)`` in seconds
+    """
+    if offset >= audio_delay - video_delay:
+        return video_delay + offset, video_delay
+    return audio_delay, audio_delay - offset
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+"""
+Store-and-forward upload of recordings to an ingest server.
+
+Recordings are uploaded with HTTP ``PUT`` requests, one per chunk, each one
+carrying a ``Content-Range`` header. Before resuming a recording, a
+``HEAD`` request on the same URL gives the number of bytes the server
+already has through ``Content-Length`` (``404`` meaning none).
+"""
+
+import http.client
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import urllib.parse
+
+
+# Size in bytes of data sent in a single request.
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# Size in bytes of data sent at once on the socket, rate limit is enforced
+# at this granularity.
+UPLOAD_BLOCK_SIZE = 64 * 1024
+# Duration in seconds after which a request without reply fails.
+UPLOAD_TIMEOUT = 30
+# Delay in seconds before retrying a failed upload, doubled on each
+# consecutive failure.
+UPLOAD_RETRY_DELAY = 5
+UPLOAD_MAX_RETRY_DELAY = 300
+# Interval in seconds between two checks of the pause condition while
+# uploads are paused.
+UPLOAD_PAUSE_CHECK_INTERVAL = 1
+# Duration in seconds to wait for the upload thread on stop, an upload
+# interrupted meanwhile is resumed on next start.
+UPLOAD_STOP_TIMEOUT = 5
+# Duration in seconds of data which can be sent at once after an idle
+# period.
+RATE_LIMIT_MAX_BURST = 1
+DEFAULT_QUEUE_PATH = str(
+    pathlib.Path.home().joinpath(".local", "share", "hubangl",
+                                 "upload_queue.json"))
+
+logger = logging.getLogger("core.upload")
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadQueue:
+    """
+    Queue of recordings to upload, persisted on disk so that uploads are
+    resumed after a restart.
+
+    :param path: path of the file storing the queue
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Formatted as [{"path": recording path, "offset": bytes sent}, ...]
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error("Could not read upload queue {} ({})".format(
+                self.path, e))
+            return []
+        return [entry for entry in entries
+                if isinstance(entry, dict) and "path" in entry]
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(temp_path, self.path)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def add(self, path):
+        """
+        Append a recording to the queue, unless it's already queued.
+
+        :return: ``True`` if the recording has been added
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if any(entry["path"] == path for entry in self._entries):
+                return False
+            self._entries.append({"path": path, "offset": 0})
+            self._save()
+        return True
+
+    def peek(self):
+        """
+        :return: copy of the first entry or ``None`` if queue is empty
+        """
+        with self._lock:
+            return dict(self._entries[0]) if self._entries else None
+
+    def get_entries(self):
+        with self._lock:
+            return [dict(entry) for entry in self._entries]
+
+    def set_offset(self, path, offset):
+        with self._lock:
+            for entry in self._entries:
+                if entry["path"] == path:
+                    entry["offset"] = offset
+                    self._save()
+                    return
+
+    def remove(self, path):
+        with self._lock:
+            self._entries = [entry for entry in self._entries
+                             if entry["path"] != path]
+            self._save()
+
+
+class RateLimiter:
+    """
+    Limit throughput of a transfer.
+
+    :param rate: maximum rate in bytes per second, ``None`` for no limit
+    """
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._start_time = None
+        self._bytes = 0
+
+    def reset(self):
+        self._start_time = None
+        self._bytes = 0
+
+    def get_delay(self, size, now=None):
+        """
+        Register ``size`` bytes about to be sent.
+
+        :return: delay in seconds to wait before sending them
+        """
+        now = time.monotonic() if now is None else now
+        if self._start_time is None:
+            self._start_time = now
+        elif (self.rate and self._start_time + self._bytes / self.rate
+                < now - RATE_LIMIT_MAX_BURST):
+            # Idle time doesn't allow sending more than a short burst.
+            self._start_time = now - RATE_LIMIT_MAX_BURST
+            self._bytes = 0
+        self._bytes += size
+        if not self.rate:
+            return 0
+        return max(0, self._start_time + self._bytes / self.rate - now)
+
+
+class Uploader:
+    """
+    Upload queued recordings one after another from a dedicated thread.
+
+    :param url: base URL of the ingest server, recordings are uploaded to
+        this URL followed by their filename
+    :param queue: :class:`UploadQueue`
+    :param rate: maximum upload rate in bytes per second, ``None`` for no
+        limit
+    :param pause_condition: function returning ``True`` while uploads have
+        to be paused, e.g. when live streaming needs the bandwidth
+    """
+    def __init__(self, url, queue, rate=None, pause_condition=None):
+        self.url = url.rstrip("/")
+        self.queue = queue
+        self.pause_condition = pause_condition
+        self._rate_limiter = RateLimiter(rate)
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._is_paused = False
+        self._retry_delay = UPLOAD_RETRY_DELAY
+        #: Path of the recording being uploaded
+        self.current_path = None
+
+    @property
+    def rate(self):
+        return self._rate_limiter.rate
+
+    @rate.setter
+    def rate(self, value):
+        self._rate_limiter.rate = value
+        self._rate_limiter.reset()
+
+    def start(self):
+        if self._thread:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="uploader")
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop uploading, the current upload is resumed on next start.
+        """
+        if not self._thread:
+            return
+
+        self._stop_event.set()
+        self._wake_event.set()
+        self._thread.join(UPLOAD_STOP_TIMEOUT)
+        self._thread = None
+
+    def enqueue(self, path):
+        """
+        Schedule upload of a recording.
+        """
+        if self.queue.add(path):
+            logger.info("Upload of {} queued".format(path))
+        self._wake_event.set()
+
+    def get_file_url(self, path):
+        return "{}/{}".format(
+            self.url, urllib.parse.quote(os.path.basename(path)))
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            entry = self.queue.peek()
+            if entry is None:
+                self._wake_event.wait()
+                self._wake_event.clear()
+                continue
+
+            self.current_path = entry["path"]
+            try:
+                self._upload(entry)
+            except (OSError, http.client.HTTPException, UploadError) as e:
+                if self._stop_event.is_set():
+                    break
+                logger.warning("Upload of {} failed, retrying in {}s ({})"
+                               .format(entry["path"], self._retry_delay, e))
+                self._stop_event.wait(self._retry_delay)
+                self._retry_delay = min(self._retry_delay * 2,
+                                        UPLOAD_MAX_RETRY_DELAY)
+                continue
+            finally:
+                self.current_path = None
+
+            if not self._stop_event.is_set():
+                self._retry_delay = UPLOAD_RETRY_DELAY
+
+    def _wait_if_paused(self):
+        """
+        Block while :attr:`pause_condition` is met.
+
+        :return: ``False`` if uploader has been stopped meanwhile
+        """
+        while self.pause_condition and self.pause_condition():
+            if not self._is_paused:
+                self._is_paused = True
+                logger.info("Uploads paused while live streaming")
+            if self._stop_event.wait(UPLOAD_PAUSE_CHECK_INTERVAL):
+                return False
+
+        if self._is_paused:
+            self._is_paused = False
+            self._rate_limiter.reset()
+            logger.info("Uploads resumed")
+        return not self._stop_event.is_set()
+
+    def _connect(self, url):
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.scheme == "https":
+            connection_class = http.client.HTTPSConnection
+        elif parsed_url.scheme == "http":
+            connection_class = http.client.HTTPConnection
+        else:
+            raise UploadError("Unsupported URL scheme: " + parsed_url.scheme)
+        path = parsed_url.path
+        if parsed_url.query:
+            path += "?" + parsed_url.query
+        return (connection_class(parsed_url.netloc, timeout=UPLOAD_TIMEOUT),
+                path)
+
+    def get_remote_size(self, url):
+        """
+        :return: number of bytes of the recording the server already has
+        """
+        connection, path = self._connect(url)
+        try:
+            connection.request("HEAD", path)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+
+        if response.status == 404:
+            return 0
+        if response.status >= 300:
+            raise UploadError("HEAD replied {} {}".format(response.status,
+                                                         response.reason))
+        return int(response.getheader("Content-Length", 0))
+
+    def _upload(self, entry):
+        path = entry["path"]
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            logger.error("Recording {} vanished, upload dropped".format(path))
+            self.queue.remove(path)
+            return
+
+        url = self.get_file_url(path)
+        offset = self.get_remote_size(url)
+        if offset > size:
+            raise UploadError("Server has more data than the recording")
+        if offset != entry["offset"]:
+            logger.info("Resuming upload of {} at byte {}".format(path,
+                                                                 offset))
+
+        start_time = time.monotonic()
+        # An empty recording is uploaded with a single empty request.
+        with open(path, "rb") as f:
+            while offset < size or not size:
+                if not self._wait_if_paused():
+                    return
+                f.seek(offset)
+                length = min(UPLOAD_CHUNK_SIZE, size - offset)
+                if not self._send_chunk(url, f, offset, length, size):
+                    return
+                offset += length
+                self.queue.set_offset(path, offset)
+                if not size:
+                    break
+
+        self.queue.remove(path)
+        logger.info("Upload of {} done ({:.1f} MB in {:.1f}s)".format(
+            path, size / 1000000, time.monotonic() - start_time))
+
+    def _send_chunk(self, url, f, offset, length, size):
+        """
+        Send ``length`` bytes read from ``f`` in a single request.
+
+        :return: ``False`` if uploader has been stopped meanwhile
+        """
+        connection, path = self._connect(url)
+        try:
+            connection.putrequest("PUT", path)
+            connection.putheader("Content-Length", str(length))
+            if length:
+                connection.putheader("Content-Range", "bytes {}-{}/{}".format(
+                    offset, offset + length - 1, size))
+            connection.endheaders()
+
+            remaining = length
+            while remaining:
+                block = f.read(min(UPLOAD_BLOCK_SIZE, remaining))
+                if not block:
+                    raise UploadError("Recording shrank during upload")
+                delay = self._rate_limiter.get_delay(len(block))
+                if delay and self._stop_event.wait(delay):
+                    return False
+                connection.send(block)
+                remaining -= len(block)
+
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+
+        if response.status >= 300:
+            raise UploadError("PUT replied {} {}".format(response.status,
+                                                        response.reason))
+        return True
+
+
+_uploader = None
+
+
+def setup(url, queue_path=None, rate=None):
+    """
+    Create and start the uploader, recordings left in the queue by a
+    previous run are uploaded.
+
+    :param url: base URL of the ingest server
+    :param queue_path: path of the queue file, default to
+        :const:`DEFAULT_QUEUE_PATH`
+    :param rate: maximum upload rate in bytes per second
+
+    :return: :class:`Uploader`
+    """
+    global _uploader
+    shutdown()
+    queue = UploadQueue(queue_path or DEFAULT_QUEUE_PATH)
+    _uploader = Uploader(url, queue, rate)
+    _uploader.start()
+    if len(queue):
+        logger.info("{} recordings waiting for upload".format(len(queue)))
+    return _uploader
+
+
+def get_uploader():
+    """
+    :return: :class:`Uploader` or ``None`` if uploads are not set up
+    """
+    return _uploader
+
+
+def shutdown():
+    global _uploader
+    if _uploader is not None:
+        _uploader.stop()
+        _uploader = None
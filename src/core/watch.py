@@ -152,6 +152,23 @@ class RemoteWatcher:
         except KeyError:
             pass
 
+    def get_element(self, address):
+        """
+        Get the element represented by its ``address``.
+
+        :param address: :class:`tuple` as ``(host, port)``
+
+        :return: watched element or ``None`` if the element is not referenced
+        """
+        return self._elements.get(address)
+
+    def get_elements(self):
+        """
+        :return: :class:`dict` as ``{address: RemoteElement}`` of all
+            watched elements
+        """
+        return dict(self._elements)
+
 
 class LocalWatcher:
     """
@@ -296,6 +313,7 @@ class RemoteElement:
             self._unknown_state = True
             return
 
+        self._unknown_state = False
         self._host_running = host_running
         self._port_open = port_open
         self._latency = latency
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import collections
+
+
+class StallWatchdog:
+    """
+    Detect points of a pipeline that stopped passing data. Each point is
+    watched along with the points feeding it, a point starved by a stalled
+    upstream point is not reported, so that only the segment where data
+    flow actually stops is restarted.
+
+    :param timeout: time in seconds without data after which a point is
+        stalled
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        # Map point name to names of points feeding it.
+        self._upstreams = collections.OrderedDict()
+        # Map point name to monotonic time since when data is expected.
+        self._expected_since = {}
+        # Map point name to number of times it stalled.
+        self._stalls = collections.Counter()
+        self._stalled = set()
+
+    def watch(self, name, upstream=()):
+        """
+        :param name: name of the point
+        :param upstream: names of points feeding ``name``
+        """
+        self._upstreams[name] = tuple(upstream)
+
+    def reset(self, now, names=None):
+        """
+        Restart waiting for data, e.g. when the pipeline starts playing or
+        a point is intentionally idle.
+
+        :param names: points to reset, all of them if ``None``
+        """
+        for name in self._upstreams if names is None else names:
+            self._expected_since[name] = now
+            self._stalled.discard(name)
+
+    def _get_expected_since(self, name, now, visited=None):
+        """
+        Data isn't expected at a point before it's expected upstream, e.g.
+        after an upstream point has been restarted.
+        """
+        visited = set() if visited is None else visited
+        since = self._expected_since.setdefault(name, now)
+        for upstream in self._upstreams.get(name, ()):
+            if upstream not in visited:
+                visited.add(upstream)
+                since = max(since,
+                            self._get_expected_since(upstream, now, visited))
+        return since
+
+    def _is_starved(self, name, stalled, visited=None):
+        visited = set() if visited is None else visited
+        for upstream in self._upstreams.get(name, ()):
+            if upstream in visited:
+                continue
+            visited.add(upstream)
+            if (upstream in stalled
+                    or self._is_starved(upstream, stalled, visited)):
+                return True
+        return False
+
+    def check(self, now, last_times):
+        """
+        :param now: current monotonic time
+        :param last_times: :class:`dict` as ``{point name: monotonic time of
+            last buffer}``, time is ``None`` if no buffer went through yet
+
+        :return: :class:`list` of ``(point name, idle time)`` of stalled
+            points whose upstream points are not stalled, in watch order
+        """
+        idle_times = {}
+        for name in self._upstreams:
+            since = self._get_expected_since(name, now)
+            last_time = last_times.get(name)
+            if last_time is not None:
+                since = max(since, last_time)
+            idle_times[name] = now - since
+
+        self._stalled = {name for name, idle_time in idle_times.items()
+                         if idle_time >= self.timeout}
+        return [(name, idle_times[name]) for name in self._upstreams
+                if name in self._stalled
+                and not self._is_starved(name, self._stalled)]
+
+    def on_stall(self, name, now):
+        """
+        Register that stalled point ``name`` has been handled, it's given
+        another :attr:`timeout` to get data flowing again.
+        """
+        self._stalls[name] += 1
+        self.reset(now, (name,))
+
+    def get_stats(self):
+        """
+        :return: :class:`dict` as ``{point name: stats}``
+        """
+        return {name: {"stalled": name in self._stalled,
+                       "stalls": self._stalls[name]}
+                for name in self._upstreams}
@@ -28,10 +28,19 @@ from gi.repository import Gdk
 from gi.repository import GdkX11
 from gi.repository import GstVideo
 from gi.repository import GObject
+from gi.repository import GLib
 
+from core import debuglog
+from core import icecast
+from core import metrics
+from core import postprocess
+from core import upload
 from core import process
+from core import recorder
+from core import profiling
 from gui import audio_displays
 from gui import menus
+from gui import status_bar
 from gui import utils
 
 
@@ -57,22 +66,41 @@ class Feed:
         self.video_monitor.set_valign(Gtk.Align.FILL)
         self.video_monitor.set_size_request(700, 400)
 
-        self.placeholder_pipeline = process.PlaceholderPipeline()
-        self.placeholder_bus = self.create_gstreamer_bus(
-            self.placeholder_pipeline.pipeline)
-
-        self.pipeline = process.Pipeline()
-        self.bus = self.create_gstreamer_bus(self.pipeline.pipeline)
+        with profiling.phase("Placeholder pipeline"):
+            self.placeholder_pipeline = process.PlaceholderPipeline()
+            self.placeholder_bus = self.create_gstreamer_bus(
+                self.placeholder_pipeline.pipeline)
+
+        with profiling.phase("Main pipeline"):
+            self.pipeline = process.Pipeline()
+            self.bus = self.create_gstreamer_bus(self.pipeline.pipeline)
+            self.pipeline.add_recording_callback(self.on_recording_closed)
+            uploader = upload.get_uploader()
+            if uploader:
+                uploader.pause_condition = self.pipeline.is_streaming
+            if metrics.get_server():
+                self.update_metrics()
+                GLib.timeout_add_seconds(metrics.SNAPSHOT_INTERVAL,
+                                         self.update_metrics)
+            if recorder.get_recorder():
+                self.record_telemetry()
+                GLib.timeout_add_seconds(recorder.RECORDER_INTERVAL,
+                                         self.record_telemetry)
         self.xid = None
-
-        self.video_menu = menus.VideoMenu(self.pipeline, self.menu_revealer,
-                                          self.placeholder_pipeline)
-        self.audio_menu = menus.AudioMenu(self.pipeline, self.menu_revealer,
-                                          self.placeholder_pipeline)
-        self.stream_menu = menus.StreamMenu(self.pipeline, self.menu_revealer)
-        self.store_menu = menus.StoreMenu(self.pipeline, self.menu_revealer)
-        self.settings_menu = menus.SettingsMenu(self.pipeline,
+        self.video_monitor.connect("size-allocate",
+                                   self.on_video_monitor_size_allocate)
+
+        with profiling.phase("Menus build"):
+            self.video_menu = menus.VideoMenu(
+                self.pipeline, self.menu_revealer, self.placeholder_pipeline)
+            self.audio_menu = menus.AudioMenu(
+                self.pipeline, self.menu_revealer, self.placeholder_pipeline)
+            self.stream_menu = menus.StreamMenu(self.pipeline,
                                                 self.menu_revealer)
+            self.store_menu = menus.StoreMenu(self.pipeline,
+                                              self.menu_revealer)
+            self.settings_menu = menus.SettingsMenu(self.pipeline,
+                                                    self.menu_revealer)
 
         self.images = images
         self.controls = ControlBar(self.pipeline, self.menu_revealer,
@@ -130,6 +158,11 @@ class Feed:
 
         return hbox
 
+    def on_video_monitor_size_allocate(self, widget, allocation):
+        # Scale the preview down to the monitor size instead of letting
+        # the screen sink handle full size frames.
+        self.pipeline.set_preview_size(allocation.width, allocation.height)
+
     def on_sync_message(self, bus, message):
         if message.get_structure().get_name() == 'prepare-window-handle':
             imagesink = message.src
@@ -200,6 +233,47 @@ class Feed:
                 menu.main_vbox.remove(section.summary_vbox)
             menu.feeds = []
 
+    def update_metrics(self):
+        server = metrics.get_server()
+        if not server:
+            return False
+
+        try:
+            server.set_snapshot(metrics.collect_metrics(self.pipeline))
+        except Exception:
+            logger.exception("Unexpected error on collecting metrics")
+        return True
+
+    def record_telemetry(self):
+        telemetry_recorder = recorder.get_recorder()
+        if not telemetry_recorder:
+            return False
+
+        try:
+            telemetry_recorder.record(
+                metrics.collect_metric_set(self.pipeline).get_values())
+        except OSError as e:
+            logger.error("Failed to record telemetry ({})".format(e))
+        except Exception:
+            logger.exception("Unexpected error on recording telemetry")
+        return True
+
+    def on_recording_closed(self, sink, path):
+        uploader = upload.get_uploader()
+        callback = uploader.enqueue if uploader else None
+        if not postprocess.POSTPROCESS_JOBS:
+            if callback:
+                callback(path)
+            return
+
+        postprocessor = postprocess.get_postprocessor()
+        # Recordings are uploaded once post-processing is over, since jobs
+        # may rewrite them.
+        postprocessor.submit(path, callback)
+        bar = status_bar.get_status_bar()
+        if not bar.get_watched_element(postprocessor):
+            bar.add_postprocessor(postprocessor)
+
     def on_message(self, bus, message):
         # Getting the RMS audio level value:
         message_structure = Gst.Message.get_structure(message)
@@ -214,15 +288,24 @@ class Feed:
                 peak = message_structure.get_value("peak")
                 decay = message_structure.get_value("decay")
                 self.audio_level_display.on_level(rms, peak, decay)
+            elif self.pipeline.is_segment_message(message):
+                self.pipeline.on_segment_closed(message)
         elif message.type == Gst.MessageType.EOS:
             self.pipeline.set_null_state()
+        elif message.type == Gst.MessageType.QOS and bus is self.bus:
+            self.pipeline.on_qos_message(message)
+        elif message.type == Gst.MessageType.WARNING and bus is self.bus:
+            self.pipeline.on_warning_message(message)
         elif message.type == Gst.MessageType.ERROR:
+            if bus is self.bus:
+                debuglog.dump("error")
             if self.pipeline.is_from_streaming(message):
                 self.pipeline.reconnect_streaming_branch(message)
             else:
                 err, debug = message.parse_error()
                 logger.error("Unexpected GStreamer error {} {}".format(
                     err, debug))
+                self.pipeline.dump_graph_on_error()
 
 
 class ControlBar:
@@ -328,32 +411,57 @@ class ControlBar:
         widget.set_icon_widget(icon)
         widget.show_all()
 
-    def _are_streamsinks_working(self):
+    def _check_streamsinks(self, callback):
         """
-        :return: ``True`` if all streamsinks are working ones, ``False``
-            otherwise
+        Probe servers of all streamsinks without blocking the main loop.
+        Probes are started when stream menus are confirmed, so results are
+        usually cached already.
+
+        :param callback: called from the main loop once all probes are
+            done, with ``True`` if all streamsinks are working ones,
+            ``False`` otherwise
         """
+        feeds = [feed_streamed for feed_streamed in self.stream_menu.feeds
+                 if feed_streamed.sink]
+        servers = [feed_streamed.get_probed_servers()
+                   for feed_streamed in feeds]
+        # All servers are probed at once.
+        icecast.probe_all_async(
+            [server for feed_servers in servers for server in feed_servers],
+            lambda errors: GLib.idle_add(self._on_streamsinks_probed, feeds,
+                                         servers, errors, callback))
+
+    def _on_streamsinks_probed(self, feeds, servers, errors, callback):
         all_working = True
-
-        for feed_streamed in self.stream_menu.feeds:
-            error = feed_streamed.probe_pipeline.error_message
-            if not error:
-                feed_streamed.probe_pipeline.close()
+        for feed_streamed, feed_servers in zip(feeds, servers):
+            feed_errors = errors[:len(feed_servers)]
+            errors = errors[len(feed_servers):]
+            if None in feed_errors:
+                # At least one server among primary and backups is working.
                 continue
-            elif "couldn't connect" in error:
+
+            # Report error from primary server.
+            error = feed_errors[0]
+            if error == icecast.COULD_NOT_CONNECT:
                 log_message = "Couldn't connect to server for stream '{}'"
                 sub_message = "Verify address and port entry."
-            elif "login failed" in error:
+            elif error == icecast.LOGIN_FAILED:
                 log_message = "Login failed for stream '{}'"
                 sub_message = "Verify password entry."
+            elif error == icecast.MOUNT_IN_USE:
+                log_message = "Mountpoint already in use for stream '{}'"
+                sub_message = "Verify mountpoint entry."
+            else:
+                log_message = "Unexpected reply from server for stream '{}'"
+                sub_message = "Verify address and port entry."
 
             logger.info(log_message.format(feed_streamed.mountpoint))
             utils.build_error_dialog(log_message.format(
                 feed_streamed.mountpoint), sub_message)
-            feed_streamed.probe_pipeline.close()
             all_working = False
 
-        return all_working
+        callback(all_working)
+        return False
 
     def _refresh_properties(self):
         # FIXME: a change of feed type does not create a new output element
@@ -394,7 +502,13 @@ class ControlBar:
             if not self.state_change_confirmed:
                 return
 
-        if not self._are_streamsinks_working():
+        # Play can't be pressed again while servers are probed.
+        self.play_button.set_sensitive(False)
+        self._check_streamsinks(self._on_streamsinks_checked)
+
+    def _on_streamsinks_checked(self, all_working):
+        self.play_button.set_sensitive(True)
+        if not all_working or self._pipeline.is_playing:
             return
         self._refresh_properties()
 
@@ -412,13 +526,18 @@ class ControlBar:
                                     secondary_text="Go to Feed > Outputs")
             return
 
-        self._switch_widget_icons(widget, "play")
+        self._switch_widget_icons(self.play_button, "play")
 
         # Ensure placeholder pipeline is stopped first in case of
         # loading a session configuration
         self._placeholder_pipeline.set_stop_state()
         self._pipeline.set_play_state()
         self.play_button.set_sensitive(False)
+        # Health is only watched while playing, so that the status bar
+        # doesn't poll when there's nothing to watch.
+        bar = status_bar.get_status_bar()
+        if not bar.get_watched_element(self._pipeline):
+            bar.add_health(self._pipeline)
 
         logger.info(_FEED_STATE_CHANGED.format(state="PLAY"))
 
@@ -444,6 +563,7 @@ class ControlBar:
         self._switch_widget_icons(widget, "stop")
         self._pipeline.set_stop_state()
         self.stop_button.set_sensitive(False)
+        status_bar.get_status_bar().remove_health(self._pipeline)
 
         self._refresh_properties()
 
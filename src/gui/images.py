@@ -20,58 +20,178 @@
 
 import pathlib
 
+import gi
+gi.require_version("GdkPixbuf", "2.0")  # NOQA
+from gi.repository import GdkPixbuf
 from gi.repository import Gtk
 
+from core import profiling
+
+#: Icon names and the versions that are available for each of them.
+ICON_VERSIONS = {"play": ("regular", "regular_16px", "activated"),
+                 "stop": ("regular", "regular_16px", "activated"),
+                 "camera": ("regular", "regular_16px", "activated",
+                            "striked"),
+                 "micro": ("regular", "regular_16px", "activated",
+                           "striked"),
+                 "streaming": ("regular", "regular_16px", "activated"),
+                 "storage": ("regular", "regular_16px", "activated"),
+                 "settings": ("regular", "regular_16px", "activated"),
+                 "speaker": ("regular", "activated", "striked"),
+                 "chat": ("regular", "regular_16px", "activated"),
+                 "slides": ("regular", "regular_16px", "activated"),
+                 "square_red": ("regular", "regular_16px"),
+                 "square_green": ("regular", "regular_16px")}
+
+# Process-wide artwork cache, shared by all HubanglImages instances.
+# Filenames are indexed once, pixbufs are decoded on first use.
+_artwork_files = None  # Formatted as {lowercase filename: path}
+_icons_index = None  # Formatted as {(name, version): path}
+_logos_index = None  # Formatted as {size: path}
+_pixbufs = {}  # Formatted as {path: GdkPixbuf.Pixbuf}
+
+
+def get_artwork_path():
+    root = pathlib.Path(__file__).parents[2]
+    artwork_path = root.joinpath("artwork")
+    if not artwork_path.is_dir():
+        raise FileNotFoundError
+    return artwork_path
+
+
+def _get_artwork_files():
+    """
+    Scan artwork directory, only once per process.
+
+    :return: :class:`dict` as ``{lowercase filename: path}``
+    """
+    global _artwork_files
+    if _artwork_files is None:
+        _artwork_files = {path.name.lower(): path.as_posix()
+                          for path in sorted(get_artwork_path().iterdir())}
+    return _artwork_files
+
+
+def _get_icon_version(filename):
+    """
+    Determine icon version based on its ``filename``.
+
+    :param filename: lowercase filename as :class:`str`
+
+    :return: version as :class:`str`
+    """
+    if "_activated_" in filename and "_striked_" not in filename:
+        return "activated"
+    elif "_striked_" in filename:
+        return "striked"
+    elif "_16-16_" in filename:
+        return "regular_16px"
+    else:
+        return "regular"
+
+
+def _get_icons_index():
+    """
+    :return: :class:`dict` as ``{(name, version): path}``
+    """
+    global _icons_index
+    if _icons_index is not None:
+        return _icons_index
+
+    _icons_index = {}
+    for filename, path in _get_artwork_files().items():
+        version = _get_icon_version(filename)
+        for name in ICON_VERSIONS:
+            if name not in filename:
+                continue
+            if (version == "striked" and "_activated_" in filename
+                    and (name, version) in _icons_index):
+                # Prefer the non-activated striked version.
+                continue
+            _icons_index[(name, version)] = path
+
+    return _icons_index
+
+
+def _get_logos_index():
+    """
+    :return: :class:`dict` as ``{size: path}``
+    """
+    global _logos_index
+    if _logos_index is not None:
+        return _logos_index
+
+    _logos_index = {}
+    for filename, path in _get_artwork_files().items():
+        if "_logo_" not in filename:
+            continue
+        for size in (512, 256, 16):
+            if "_{0}-{0}_".format(size) in filename:
+                _logos_index[size] = path
+
+    return _logos_index
+
+
+def get_pixbuf(path):
+    """
+    Get pixbuf of image located at ``path``, decoding it on first call.
+
+    :param path: path to an image file as :class:`str`
+
+    :return: :class:`GdkPixbuf.Pixbuf`
+    """
+    try:
+        return _pixbufs[path]
+    except KeyError:
+        with profiling.phase("Icon decode"):
+            pixbuf = _pixbufs[path] = GdkPixbuf.Pixbuf.new_from_file(path)
+        return pixbuf
+
+
+def new_image(path):
+    """
+    Create a new :class:`Gtk.Image` from cached pixbuf of ``path``.
+
+    :param path: path to an image file as :class:`str`
+
+    :return: :class:`Gtk.Image`
+    """
+    return Gtk.Image.new_from_pixbuf(get_pixbuf(path))
+
+
+class _IconVersions(dict):
+    """
+    Versions of an icon, :class:`Gtk.Image` is created on first access.
+
+    :param name: name of the icon (e.g: ``play``)
+    """
+    def __init__(self, name):
+        super().__init__()
+        self._name = name
+
+    def __missing__(self, version):
+        if version not in ICON_VERSIONS[self._name]:
+            raise KeyError(version)
+
+        path = _get_icons_index().get((self._name, version))
+        icon = self[version] = new_image(path) if path else None
+        return icon
+
 
 class HubanglImages:
+    """
+    Give access to icons and logos.
+
+    Each instance owns its :class:`Gtk.Image` widgets since a widget can only
+    have one parent, but pixbufs are shared by all instances.
+    """
     def __init__(self):
-        self.artwork_path = self.get_artwork_path()
-        self.icons = {"play": {"regular": None,
-                               "regular_16px": None,
-                               "activated": None},
-                      "stop": {"regular": None,
-                               "regular_16px": None,
-                               "activated": None},
-                      "camera": {"regular": None,
-                                 "regular_16px": None,
-                                 "activated": None,
-                                 "striked": None},
-                      "micro": {"regular": None,
-                                "regular_16px": None,
-                                "activated": None,
-                                "striked": None},
-                      "streaming": {"regular": None,
-                                    "regular_16px": None,
-                                    "activated": None},
-                      "storage": {"regular": None,
-                                  "regular_16px": None,
-                                  "activated": None},
-                      "settings": {"regular": None,
-                                   "regular_16px": None,
-                                   "activated": None},
-                      "speaker": {"regular": None,
-                                  "activated": None,
-                                  "striked": None},
-                      "chat": {"regular": None,
-                               "regular_16px": None,
-                               "activated": None},
-                      "slides": {"regular": None,
-                                 "regular_16px": None,
-                                 "activated": None},
-                      "square_red": {"regular": None,
-                                     "regular_16px": None},
-                      "square_green": {"regular": None,
-                                       "regular_16px": None}
-                      }
-        self.load_icons()
-        self.load_logos()
+        self.artwork_path = get_artwork_path()
+        self.icons = {name: _IconVersions(name) for name in ICON_VERSIONS}
+        self._logos = {}
 
     def get_artwork_path(self):
-        root = pathlib.Path(__file__).parents[2]
-        artwork_path = root.joinpath("artwork")
-        if not artwork_path.is_dir():
-            raise FileNotFoundError
-        return artwork_path
+        return get_artwork_path()
 
     def load_icon(self, name, version):
         """
@@ -83,50 +203,36 @@ class HubanglImages:
         :return: :class:`Gtk.Image`, ``None`` if the icon has not been
             found
         """
-        for icon_path in self.artwork_path.iterdir():
-            filename = icon_path.name.lower()
+        for filename, path in _get_artwork_files().items():
             if name in filename and version in filename:
-                icon = Gtk.Image()
-                icon.set_from_file(icon_path.as_posix())
-                return icon
+                return new_image(path)
 
-    def load_icons(self):
-        """
-        Load all icons used for buttons.
-        """
-        for icon_path in self.artwork_path.iterdir():
-            for key in self.icons:
-                filename = icon_path.name.lower()
-                if key in filename:
-                    icon = Gtk.Image()
-                    icon.set_from_file(icon_path.as_posix())
-                    if ("_activated_" in filename
-                            and "_striked_" not in filename):
-                        self.icons[key]["activated"] = icon
-                    elif "_striked_" in filename:
-                        self.icons[key]["striked"] = icon
-                    elif "_16-16_" in filename:
-                        self.icons[key]["regular_16px"] = icon
-                    else:
-                        self.icons[key]["regular"] = icon
-
-    def load_logos(self):
-        """
-        Load logos used as images and as favicon.
-        """
-        for logo_path in self.artwork_path.iterdir():
-            filename = logo_path.name.lower()
-            if "_logo_" in filename and "_512-512_" in filename:
-                self.logo_512_px = Gtk.Image()
-                self.logo_512_px.set_from_file(logo_path.as_posix())
-            elif "_logo_" in filename and "_256-256_" in filename:
-                self.logo_256_px = Gtk.Image()
-                self.logo_256_px_path = logo_path.as_posix()
-                self.logo_256_px.set_from_file(self.logo_256_px_path)
-            elif "_logo_" in filename and "_16-16_" in filename:
-                self.logo_favicon = Gtk.Image()
-                self.logo_favicon_path = logo_path.as_posix()
-                self.logo_favicon.set_from_file(self.logo_favicon_path)
+    def _get_logo(self, size):
+        try:
+            return self._logos[size]
+        except KeyError:
+            logo = self._logos[size] = new_image(_get_logos_index()[size])
+            return logo
+
+    @property
+    def logo_512_px(self):
+        return self._get_logo(512)
+
+    @property
+    def logo_256_px(self):
+        return self._get_logo(256)
+
+    @property
+    def logo_256_px_path(self):
+        return _get_logos_index()[256]
+
+    @property
+    def logo_favicon(self):
+        return self._get_logo(16)
+
+    @property
+    def logo_favicon_path(self):
+        return _get_logos_index()[16]
 
     def get_activated_icon(self, icon_id):
         """
@@ -137,7 +243,7 @@ class HubanglImages:
         :return: :class:`Gtk.Image` or ``None``
         """
         icon_values = self.icons.get(icon_id, None)
-        if not icon_values:
+        if icon_values is None:
             return
 
         return icon_values["activated"]
@@ -151,7 +257,7 @@ class HubanglImages:
         :return: :class:`Gtk.Image` or ``None``
         """
         icon_values = self.icons.get(icon_id, None)
-        if not icon_values:
+        if icon_values is None:
             return
 
         return icon_values["regular"]
@@ -165,7 +271,7 @@ class HubanglImages:
         :return: :class:`Gtk.Image` or ``None``
         """
         icon_values = self.icons.get(icon_id, None)
-        if not icon_values:
+        if icon_values is None:
             return
 
         if current_icon is icon_values["regular"]:
@@ -54,6 +54,7 @@ class MainWindow:
         self.window.set_position(Gtk.WindowPosition.CENTER)
         self.window.set_icon_from_file(self.images.logo_favicon_path)
         self.window.connect("destroy", self.on_mainwindow_close)
+        self.window.connect("window-state-event", self.on_window_state_event)
         self.window.add_accel_group(self.accel_group)
         utils.set_main_window(self.window)
 
@@ -204,6 +205,25 @@ class MainWindow:
                 accelerator_key="<alt>G"
         )
 
+        # Diagnostics
+        self.subitem_diagnostics = self._build_menu_item(
+            "Diagnostics", self.dropmenu_feed
+        )
+        # Submenu Diagnostics
+        self.dropmenu_diagnostics = Gtk.Menu()
+        self.subitem_diagnostics.set_submenu(self.dropmenu_diagnostics)
+        self.subitem_trace_latency = Gtk.CheckMenuItem.new_with_label(
+            "Trace latency")
+        self.subitem_trace_latency.set_active(
+            self.feed.pipeline.latency_tracing)
+        self.subitem_trace_latency.connect("toggled",
+                                           self.on_trace_latency_toggled)
+        self.dropmenu_diagnostics.append(self.subitem_trace_latency)
+        self.subitem_dump_graph = self._build_menu_item(
+            "Dump pipeline graph", self.dropmenu_diagnostics,
+            callback=self.on_dump_graph_clicked
+        )
+
         return menu_item
 
     def _build_menu_help(self, menu_bar):
@@ -268,6 +288,15 @@ class MainWindow:
         self.feed.pipeline.close()
         Gtk.main_quit()
 
+    def on_window_state_event(self, widget, event):
+        # Nothing is displayed while the window is minimised or hidden, so
+        # there is no need to keep rendering the placeholder.
+        hidden_states = Gdk.WindowState.ICONIFIED | Gdk.WindowState.WITHDRAWN
+        if event.new_window_state & hidden_states:
+            self.feed.placeholder_pipeline.set_pause_state()
+        else:
+            self.feed.placeholder_pipeline.resume()
+
     def on_save_clicked(self, widget):
         file_save_dialog = Gtk.FileChooserDialog(
                 title="Save Session",
@@ -400,5 +429,11 @@ class MainWindow:
     def on_settings_clicked(self, widget):
         self.feed.settings_menu.on_settings_clicked(widget)
 
+    def on_trace_latency_toggled(self, widget):
+        self.feed.pipeline.set_latency_tracing(widget.get_active())
+
+    def on_dump_graph_clicked(self, widget):
+        self.feed.pipeline.dump_graph()
+
     def on_menu_item_file_activate(self, widget):
         pass
@@ -27,6 +27,7 @@ import time
 from gi.repository import Gtk
 import ipaddress
 
+from core import icecast
 from core import process
 from core import watch
 from gui import status_bar
@@ -963,6 +964,8 @@ class StreamMenu(AbstractMenu):
             self.port = None
             self.mountpoint = None
             self.password = None
+            # Formatted as [(address, port), ...]
+            self.backup_servers = []
 
             self.element_name = None
 
@@ -986,10 +989,6 @@ class StreamMenu(AbstractMenu):
             self.summary_vbox = None
 
             self.sink = None
-            # Pipeline used to attempt a connection to the streaming server.
-            # This is done to detect connection error (wrong address or port)
-            # and login error (wrong password).
-            self.probe_pipeline = None
 
         def _build_newstream_vbox(self):
             """
@@ -1012,6 +1011,15 @@ class StreamMenu(AbstractMenu):
             password_hbox = utils.build_multi_widgets_hbox(
                 [Gtk.Label("Password :"), ], [self.password_entry, ])
 
+            self.backup_servers_entry = Gtk.Entry()
+            self.backup_servers_entry.connect("changed",
+                                              self.on_backup_servers_change)
+            self.backup_servers_entry.set_placeholder_text(
+                "host:port, host:port (optional)")
+            backup_servers_hbox = utils.build_multi_widgets_hbox(
+                [Gtk.Label("Backup servers :"), ],
+                [self.backup_servers_entry, ])
+
             radiobutton_hbox = self._build_format_group()
             # FIXME: .mkv format is not supported by shout2send Gst element.
             # It has to be either .ogg or .webm format in order to stream
@@ -1026,6 +1034,7 @@ class StreamMenu(AbstractMenu):
             hbox, vbox = self._build_subsection(address_hbox,
                                                 mountpoint_hbox,
                                                 password_hbox,
+                                                backup_servers_hbox,
                                                 radiobutton_hbox,
                                                 self._audiovideo_format_hbox,
                                                 self.confirm_button)
@@ -1040,26 +1049,46 @@ class StreamMenu(AbstractMenu):
             self.full_mountpoint = (self.mountpoint
                                     + self._get_format_extension())
 
-        def _create_probe_pipeline(self, address, port, password):
+        def get_probed_servers(self):
             """
-            Create a pipeline testing the connection to the stream sink
+            Get Icecast servers to probe in order to detect connection error
+            (wrong address or port) and login error (wrong password).
 
-            :param address: server hostname or IP address
-            :param port: server port to connect to
-            :param password: server password
+            :return: :class:`list` of ``(address, port, mount, password)``,
+                primary server comes first
             """
-            if (self.probe_pipeline
-                    and address == self.probe_pipeline.address
-                    and port == self.probe_pipeline.port
-                    and password == self.probe_pipeline.password):
-                # The pipeline has already run once, no need to run it again
-                # with the same settings
-                return
+            return [(address, port, self.full_mountpoint, self.password)
+                    for address, port in ([(self.address, self.port)]
+                                          + self.backup_servers)]
+
+        def get_backup_servers(self):
+            """
+            Resolve backup servers typed in the entry as comma separated
+            ``host:port``.
 
-            self.probe_pipeline = process.StreamingServerPipeline(address,
-                                                                  port,
-                                                                  password)
-            self.probe_pipeline.check_streamsink()
+            :return: :class:`list` of ``(address, port)``
+            """
+            servers = []
+            for item in self.backup_servers_entry.get_text().split(","):
+                item = item.strip()
+                if not item:
+                    continue
+
+                host, _, port = item.rpartition(":")
+                host = host.strip("[]")
+                try:
+                    port = int(port)
+                    info = socket.getaddrinfo(host, port,
+                                              proto=socket.IPPROTO_TCP)
+                except (ValueError, socket.gaierror):
+                    utils.build_error_dialog(
+                        "Bad input",
+                        "Backup server {} is not valid.\n"
+                        "Verify backup servers entry.".format(item))
+                    raise
+                servers.append((info[0][4][0], port))
+
+            return servers
 
         def _log_changes(self):
             for name, previous_value, new_value in (
@@ -1067,6 +1096,8 @@ class StreamMenu(AbstractMenu):
                     ("port", self.port, self.port_entry.get_text()),
                     ("mount point", self.mountpoint, self.mountpoint_entry.get_text()),
                     ("password", self.password, self.password_entry.get_text()),
+                    ("backup servers", self._get_backup_servers_text(),
+                     self.backup_servers_entry.get_text()),
                     ("feed type", self.current_stream_type, self._get_feed_type())):
                 if previous_value != new_value:
                     if name == "password":
@@ -1077,6 +1108,10 @@ class StreamMenu(AbstractMenu):
                                                     name=name,
                                                     value=new_value))
 
+        def _get_backup_servers_text(self):
+            return ", ".join("{}:{}".format(*server)
+                             for server in self.backup_servers)
+
         def get_properties(self):
             """
             Get Gstreamer properties of
@@ -1100,6 +1135,7 @@ class StreamMenu(AbstractMenu):
                     "mountpoint": self.mountpoint,
                     "mount": self.full_mountpoint,  # Only used by StreamElement
                     "password": self.password,
+                    "backup_servers": self.backup_servers_entry.get_text(),
                     "audiovideo_radiobutton": audiovideo_radiobutton_value,
                     "video_radiobutton": video_radiobutton_value,
                     "audio_radiobutton": audio_radiobutton_value,
@@ -1116,6 +1152,7 @@ class StreamMenu(AbstractMenu):
             port_value = kargs.get("port")
             mountpoint_value = kargs.get("mountpoint")
             password_value = kargs.get("password")
+            backup_servers_value = kargs.get("backup_servers", "")
             audiovideo_radiobutton_value = kargs.get("audiovideo_radiobutton")
             video_radiobutton_value = kargs.get("video_radiobutton")
             audio_radiobutton_value = kargs.get("audio_radiobutton")
@@ -1125,6 +1162,7 @@ class StreamMenu(AbstractMenu):
             self.port_entry.set_text(str(port_value))
             self.mountpoint_entry.set_text(mountpoint_value)
             self.password_entry.set_text(password_value)
+            self.backup_servers_entry.set_text(backup_servers_value)
 
             self.audiovideo_radiobutton.set_active(
                 audiovideo_radiobutton_value)
@@ -1153,6 +1191,12 @@ class StreamMenu(AbstractMenu):
                     and self.mountpoint):
                 self.confirm_button.set_sensitive(True)
 
+        def on_backup_servers_change(self, widget):
+            if (self.host_entry.get_text()
+                    and self.port_entry.get_text()
+                    and self.mountpoint):
+                self.confirm_button.set_sensitive(True)
+
         def on_format_radiobutton_toggle(self, widget):
             self._change_output_format(widget)
             self.vbox.reorder_child(self.confirm_button, -1)
@@ -1168,29 +1212,36 @@ class StreamMenu(AbstractMenu):
             self.hostname = self.host_entry.get_text()
             previous_address = self.address
             previous_port = self.port
+            previous_backup_servers = self.backup_servers
             try:
                 self.address, self.port = self.get_ip_address()
+                self.backup_servers = self.get_backup_servers()
             except Exception:
                 # Bad input for host or port, the stream endpoint must not be
                 # created.
                 return
 
-            element = watch.get_remote_watcher().remove_watcher(
-                (previous_address, previous_port))
-            if element:
-                status_bar.get_status_bar().remove_remote_element(element)
+            for address in ([(previous_address, previous_port)]
+                            + previous_backup_servers):
+                element = watch.get_remote_watcher().remove_watcher(address)
+                if element:
+                    status_bar.get_status_bar().remove_remote_element(element)
 
             self.feed_type = self._get_feed_type()
             self.build_full_mountpoint()
             self.password = self.password_entry.get_text()
             self.element_name = self.mountpoint.split("/")[-1]
 
-            self._create_probe_pipeline(self.address, self.port, self.password)
+            # Results are cached, so checking servers is instantaneous when
+            # the feed is started.
+            for server in self.get_probed_servers():
+                icecast.probe_async(*server)
 
             if not self.sink:
                 self.sink = self.pipeline.create_stream_branch(
                     self.element_name, self.current_stream_type, self.address,
-                    self.port, self.full_mountpoint, self.password)
+                    self.port, self.full_mountpoint, self.password,
+                    backup_servers=self.backup_servers)
             else:
                 if self.pipeline.is_playing:
                     utils.build_info_dialog(_PRESS_STOP_MESSAGE)
@@ -1208,6 +1259,18 @@ class StreamMenu(AbstractMenu):
             else:
                 status_bar.get_status_bar().add_remote_element(element)
 
+            for address in self.backup_servers:
+                # Availability of backup servers is used to decide on which
+                # one to fail over.
+                try:
+                    element = watch.get_remote_watcher().add_watcher(address)
+                except socket.herror:
+                    logger.warning("Unknown host ({}) for `{}` backup"
+                                   " server".format(address[0],
+                                                    self.mountpoint))
+                else:
+                    status_bar.get_status_bar().add_remote_element(element)
+
             if not self.summary_vbox:
                 self.summary_vbox = self._build_summary_box(self.index,
                                                             self.element_name)
@@ -1277,6 +1340,12 @@ class StoreMenu(AbstractMenu):
             self.filename = ""
             self.full_filename_label = None
             self.current_stream_type = None
+            # Duration of recording segments in minutes, 0 means that the
+            # recording is not split.
+            self.segment_duration = 0
+            # Directories in which recording continues when free space gets
+            # low.
+            self.fallback_directories = []
 
             self.audiovideo_radiobutton = None
             self.video_radiobutton = None
@@ -1324,6 +1393,41 @@ class StoreMenu(AbstractMenu):
                                self.automatic_naming_checkbutton,
                                automatic_naming_label)
 
+            self.crash_safe_checkbutton = Gtk.CheckButton()
+            self.crash_safe_checkbutton.set_active(
+                process.CRASH_SAFE_RECORDING)
+            self.crash_safe_checkbutton.set_tooltip_text(
+                "Allow to recover the recording after an interruption\n"
+                "with hubangl-recover")
+            crash_safe_label = Gtk.Label("Crash-safe recording")
+            crash_safe_hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+            utils.pack_widgets(crash_safe_hbox,
+                               self.crash_safe_checkbutton,
+                               crash_safe_label)
+
+            self.segment_duration_spinbutton = \
+                Gtk.SpinButton.new_with_range(0, 720, 1)
+            self.segment_duration_spinbutton.set_tooltip_text(
+                "Start a new file every N minutes\n"
+                "0 = Single file")
+            self.segment_duration_spinbutton.connect(
+                "value-changed", self.on_segment_duration_changed)
+            segment_duration_hbox = utils.build_multi_widgets_hbox(
+                [Gtk.Label("Split every (min) :"), ],
+                [self.segment_duration_spinbutton, ])
+
+            self.fallback_directories_entry = Gtk.Entry()
+            self.fallback_directories_entry.connect(
+                "changed", self.on_fallback_directories_change)
+            self.fallback_directories_entry.set_placeholder_text(
+                "/path, /path (optional)")
+            self.fallback_directories_entry.set_tooltip_text(
+                "Continue recording in these folders\n"
+                "when the disk is running out of space")
+            fallback_directories_hbox = utils.build_multi_widgets_hbox(
+                [Gtk.Label("Fallback folders :"), ],
+                [self.fallback_directories_entry, ])
+
             radiobutton_hbox = self._build_format_group()
 
             self.confirm_button = self._build_confirm_changes_button(
@@ -1334,6 +1438,9 @@ class StoreMenu(AbstractMenu):
             hbox, vbox = self._build_subsection(self.folder_chooser_button,
                                                 name_hbox,
                                                 automatic_naming_hbox,
+                                                crash_safe_hbox,
+                                                segment_duration_hbox,
+                                                fallback_directories_hbox,
                                                 radiobutton_hbox,
                                                 self._audiovideo_format_hbox,
                                                 self.confirm_button)
@@ -1365,10 +1472,31 @@ class StoreMenu(AbstractMenu):
             self.filepath = os.path.join(
                 self.folder_selection, self.full_filename)
 
+        def get_fallback_directories(self):
+            """
+            Get fallback directories typed in the entry as comma separated
+            paths. Directories that don't exist are ignored.
+
+            :return: :class:`list` of paths
+            """
+            directories = []
+            for item in self.fallback_directories_entry.get_text().split(","):
+                directory = os.path.expanduser(item.strip())
+                if not directory:
+                    continue
+                if not os.path.isdir(directory):
+                    logger.warning("[gui] store_{} fallback folder '{}' does"
+                                   " not exist".format(self.index, directory))
+                    continue
+                directories.append(directory)
+            return directories
+
         def _log_changes(self):
             for name, previous_value, new_value in (
                     ("directory", self.folder_selection, self.folder_chooser_button.get_filename()),
                     ("filename", self.filename, self.name_entry.get_text()),
+                    ("segment duration", self.segment_duration, self.segment_duration_spinbutton.get_value_as_int()),
+                    ("fallback folders", ", ".join(self.fallback_directories), self.fallback_directories_entry.get_text()),
                     ("feed type", self.current_stream_type, self._get_feed_type())):
                 if previous_value != new_value:
                     logger.info("[gui] store_{index} {name} set to"
@@ -1386,6 +1514,11 @@ class StoreMenu(AbstractMenu):
             folder_selected = self.folder_chooser_button.get_filename()
             name_entry_value = self.name_entry.get_text()
             automatic_naming_value = self.automatic_naming_checkbutton.get_active()
+            segment_duration_value = (
+                self.segment_duration_spinbutton.get_value_as_int())
+            crash_safe_value = self.crash_safe_checkbutton.get_active()
+            fallback_directories_value = (
+                self.fallback_directories_entry.get_text())
 
             audiovideo_radiobutton_value = self.audiovideo_radiobutton.get_active()
             video_radiobutton_value = self.video_radiobutton.get_active()
@@ -1396,6 +1529,9 @@ class StoreMenu(AbstractMenu):
                     "name_entry": name_entry_value,
                     "automatic_naming_checkbutton": automatic_naming_value,
                     "location": self.filepath,
+                    "segment_duration_spinbutton": segment_duration_value,
+                    "crash_safe_checkbutton": crash_safe_value,
+                    "fallback_directories": fallback_directories_value,
                     "audiovideo_radiobutton": audiovideo_radiobutton_value,
                     "video_radiobutton": video_radiobutton_value,
                     "audio_radiobutton": audio_radiobutton_value,
@@ -1411,6 +1547,11 @@ class StoreMenu(AbstractMenu):
             folder_selected = kargs.get("folder_selection")
             name_entry_value = kargs.get("name_entry")
             automatic_naming_value = kargs.get("automatic_naming_checkbutton")
+            segment_duration_value = kargs.get("segment_duration_spinbutton",
+                                               0)
+            crash_safe_value = kargs.get("crash_safe_checkbutton",
+                                         process.CRASH_SAFE_RECORDING)
+            fallback_directories_value = kargs.get("fallback_directories", "")
             audiovideo_radiobutton_value = kargs.get("audiovideo_radiobutton")
             video_radiobutton_value = kargs.get("video_radiobutton")
             audio_radiobutton_value = kargs.get("audio_radiobutton")
@@ -1420,6 +1561,10 @@ class StoreMenu(AbstractMenu):
             self.name_entry.set_text(name_entry_value)
             self.automatic_naming_checkbutton.set_active(
                 automatic_naming_value)
+            self.segment_duration_spinbutton.set_value(segment_duration_value)
+            self.crash_safe_checkbutton.set_active(crash_safe_value)
+            self.fallback_directories_entry.set_text(
+                fallback_directories_value)
             self.audiovideo_radiobutton.set_active(
                 audiovideo_radiobutton_value)
             self.video_radiobutton.set_active(video_radiobutton_value)
@@ -1438,6 +1583,16 @@ class StoreMenu(AbstractMenu):
                     and self.folder_chooser_button.get_filename()):
                 self.confirm_button.set_sensitive(True)
 
+        def on_segment_duration_changed(self, widget):
+            if (self.folder_chooser_button.get_filename()
+                    and self.name_entry.get_text()):
+                self.confirm_button.set_sensitive(True)
+
+        def on_fallback_directories_change(self, widget):
+            if (self.folder_chooser_button.get_filename()
+                    and self.name_entry.get_text()):
+                self.confirm_button.set_sensitive(True)
+
         def on_format_radiobutton_toggle(self, widget):
             self._change_output_format(widget)
             self.vbox.reorder_child(self.confirm_button, -1)
@@ -1453,10 +1608,16 @@ class StoreMenu(AbstractMenu):
             self.create_unique_filename()
             self.folder_selection = self.folder_chooser_button.get_filename()
             self.build_filepath()
+            self.segment_duration = (
+                self.segment_duration_spinbutton.get_value_as_int())
+            self.fallback_directories = self.get_fallback_directories()
             element_name = self.current_stream_type + "_" + self.filename
             if not self.sink:
                 self.sink = self.pipeline.create_store_branch(
-                    self.current_stream_type, self.filepath, element_name)
+                    self.current_stream_type, self.filepath, element_name,
+                    segment_duration=self.segment_duration * 60 or None,
+                    crash_safe=self.crash_safe_checkbutton.get_active(),
+                    fallback_directories=self.fallback_directories)
             else:
                 if self.pipeline.is_playing:
                     utils.build_info_dialog(_PRESS_STOP_MESSAGE)
@@ -1493,6 +1654,8 @@ class SettingsMenu(AbstractMenu):
         self.requested_image_path = None
         self.hide_text_requested = False
         self.hide_image_requested = False
+        self.disable_preview_requested = not pipeline.preview_enabled
+        self.preview_framerate_requested = pipeline.preview_max_framerate
 
         self.h_alignment = "left"  # DEV
         self.v_alignment = "top"  # DEV
@@ -1538,6 +1701,29 @@ class SettingsMenu(AbstractMenu):
         self.hide_image_checkbutton.connect(
             "toggled", self.on_hide_image_toggle)
 
+        self.disable_preview_checkbutton = Gtk.CheckButton("Disable Preview")
+        self.disable_preview_checkbutton.set_active(
+            self.disable_preview_requested)
+        self.disable_preview_checkbutton.set_margin_top(12)
+        self.disable_preview_checkbutton.set_tooltip_text(
+            "Don't display video feed on screen to save CPU")
+        self.disable_preview_checkbutton.connect(
+            "toggled", self.on_disable_preview_toggle)
+
+        self.preview_framerate_spinbutton = Gtk.SpinButton.new_with_range(
+            0, 30, 1)
+        self.preview_framerate_spinbutton.set_value(
+            self.preview_framerate_requested)
+        self.preview_framerate_spinbutton.set_tooltip_text(
+            "Maximum number of frames per second displayed on screen\n"
+            "0 = No limit")
+        self.preview_framerate_spinbutton.connect(
+            "value-changed", self.on_preview_framerate_changed)
+        preview_framerate_hbox = utils.build_multi_widgets_hbox(
+            [Gtk.Label("Preview framerate"), ],
+            [self.preview_framerate_spinbutton, ])
+        preview_framerate_hbox.set_margin_start(24)
+
         self.confirm_button = self._build_confirm_changes_button(
                 callback=self.on_confirm_clicked)
         self.confirm_button.set_label("Confirm")
@@ -1554,6 +1740,8 @@ class SettingsMenu(AbstractMenu):
                            self.image_chooser_button,
                            self.image_position_combobox,
                            self.hide_image_checkbutton,
+                           self.disable_preview_checkbutton,
+                           preview_framerate_hbox,
                            self.confirm_button)
         self._make_scrolled_window(vbox)
         return vbox
@@ -1570,7 +1758,9 @@ class SettingsMenu(AbstractMenu):
                 ("Text overlay", self.requested_text_overlay, self.text_overlay_entry.get_text()),
                 ("Image overlay path", self.requested_image_path, self.image_chooser_button.get_filename()),
                 ("Hide text", self.hide_text_requested, self.hide_text_checkbutton.get_active()),
-                ("Hide image", self.hide_image_requested, self.hide_image_checkbutton.get_active())):
+                ("Hide image", self.hide_image_requested, self.hide_image_checkbutton.get_active()),
+                ("Disable preview", self.disable_preview_requested, self.disable_preview_checkbutton.get_active()),
+                ("Preview framerate", self.preview_framerate_requested, self.preview_framerate_spinbutton.get_value_as_int())):
             if previous_value != new_value:
                 logger.info("[gui] {name} set to '{value}'".format(
                     name=name, value=new_value))
@@ -1587,13 +1777,18 @@ class SettingsMenu(AbstractMenu):
         image_filename = self.image_chooser_button.get_filename()
         image_position_value = self.image_position_combobox.get_active_text()
         hide_image_value = self.hide_image_checkbutton.get_active()
+        disable_preview_value = self.disable_preview_checkbutton.get_active()
+        preview_framerate_value = (
+            self.preview_framerate_spinbutton.get_value_as_int())
 
         return {"text_overlay_entry": text_overlay_value,
                 "text_position_combobox": text_position_value,
                 "hide_text_checkbutton": hide_text_value,
                 "image_chooser_button": image_filename,
                 "image_position_combobox": image_position_value,
-                "hide_image_checkbutton": hide_image_value}
+                "hide_image_checkbutton": hide_image_value,
+                "disable_preview_checkbutton": disable_preview_value,
+                "preview_framerate_spinbutton": preview_framerate_value}
 
     def set_properties(self, **kargs):
         """
@@ -1607,6 +1802,10 @@ class SettingsMenu(AbstractMenu):
         image_filename = kargs.get("image_chooser_button")
         image_position_value = kargs.get("image_position_combobox")
         hide_image_value = kargs.get("hide_image_checkbutton", False)
+        disable_preview_value = kargs.get(
+            "disable_preview_checkbutton", not process.PREVIEW_ENABLED)
+        preview_framerate_value = kargs.get(
+            "preview_framerate_spinbutton", process.PREVIEW_MAX_FRAMERATE)
 
         self.text_overlay_entry.set_text(text_overlay_value)
         self.set_active_text(self.text_position_combobox,
@@ -1624,6 +1823,8 @@ class SettingsMenu(AbstractMenu):
                              self.positions,
                              image_position_value)
         self.hide_image_checkbutton.set_active(hide_image_value)
+        self.disable_preview_checkbutton.set_active(disable_preview_value)
+        self.preview_framerate_spinbutton.set_value(preview_framerate_value)
 
         self.on_confirm_clicked(self.confirm_button)
         logger.debug(_PROPERTIES_SET.format(section="settings"))
@@ -1643,6 +1844,13 @@ class SettingsMenu(AbstractMenu):
     def on_hide_image_toggle(self, widget):
         self.confirm_button.set_sensitive(True)
 
+    def on_disable_preview_toggle(self, widget):
+        self.preview_framerate_spinbutton.set_sensitive(not widget.get_active())
+        self.confirm_button.set_sensitive(True)
+
+    def on_preview_framerate_changed(self, widget):
+        self.confirm_button.set_sensitive(True)
+
     def on_confirm_clicked(self, widget):
         self._log_changes()
 
@@ -1650,6 +1858,13 @@ class SettingsMenu(AbstractMenu):
         self.requested_image_path = self.image_chooser_button.get_filename()
         self.hide_text_requested = self.hide_text_checkbutton.get_active()
         self.hide_image_requested = self.hide_image_checkbutton.get_active()
+        self.disable_preview_requested = (
+            self.disable_preview_checkbutton.get_active())
+        self.preview_framerate_requested = (
+            self.preview_framerate_spinbutton.get_value_as_int())
+
+        self.pipeline.set_preview_enabled(not self.disable_preview_requested)
+        self.pipeline.set_preview_framerate(self.preview_framerate_requested)
 
         if not self.hide_text_requested:
             self.pipeline.set_text_overlay(
@@ -19,12 +19,17 @@
 # Copyright (c) 2016-2019 David Testé
 
 import abc
+import collections
 import concurrent.futures
 import logging
+import os
+import threading
 import time
 
 from gi.repository import Gtk
 
+from core import postprocess
+from core import telemetry
 from gui import images
 from gui import utils
 
@@ -54,8 +59,10 @@ class StatusBar:
          self._hbox_remote,
          self._hbox_local) = self._build_status_bar()
 
-        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-        self._update_task = self._executor.submit(self._update_status)
+        # Update machinery is only started once an element is watched.
+        self._lock = threading.Lock()
+        self._executor = None
+        self._update_task = None
 
     def _build_status_bar(self):
         hbox_main = Gtk.Box()
@@ -77,24 +84,51 @@ class StatusBar:
         return hbox
 
     def _on_destroy(self, widget):
-        self._is_shutting_down = True
-        self._update_task.cancel()
-        self._update_task.done()
-        self._executor.shutdown()
+        with self._lock:
+            self._is_shutting_down = True
+            if self._update_task:
+                self._update_task.cancel()
+                self._update_task = None
+
+        if self._executor:
+            self._executor.shutdown()
+
+    def _start_updating(self):
+        """
+        Start updating status of watched elements if it's not already running.
+        """
+        with self._lock:
+            if self._update_task or self._is_shutting_down:
+                return
+
+            if not self._executor:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1)
+            self._update_task = self._executor.submit(self._update_status)
 
     def _update_status(self):
         """
         Update periodically the status of all watched elements.
+        It stops by itself once there is no more element to watch.
         This method is supposed to be run in an executor.
         """
-        while not self._is_shutting_down:
-            for watched_element in self._elements:
+        while True:
+            with self._lock:
+                if self._is_shutting_down or not self._elements:
+                    self._update_task = None
+                    return
+                watched_elements = tuple(self._elements)
+
+            for watched_element in watched_elements:
                 watched_element.update_content()
 
             time.sleep(UPDATE_STATUS_FREQUENCY)
 
     def get_watched_element(self, element):
-        for watched_element in self._elements:
+        with self._lock:
+            watched_elements = tuple(self._elements)
+
+        for watched_element in watched_elements:
             if element is watched_element.element:
                 return watched_element
 
@@ -111,6 +145,32 @@ class StatusBar:
             logger.exception(
                 "Unexpected error on adding local element into status bar")
 
+    def add_postprocessor(self, postprocessor):
+        """
+        Add status of post-processing jobs into the status bar.
+
+        :param postprocessor: :class:`core.postprocess.PostProcessor`
+        """
+        try:
+            watched_element = WatchedPostProcessor(postprocessor)
+            self._add_watched_element(self._hbox_local, watched_element)
+        except Exception:
+            logger.exception(
+                "Unexpected error on adding post-processor into status bar")
+
+    def add_health(self, pipeline):
+        """
+        Add realtime health of ``pipeline`` into the status bar.
+
+        :param pipeline: :class:`core.process.Pipeline`
+        """
+        try:
+            watched_element = WatchedHealth(pipeline)
+            self._add_watched_element(self._hbox_local, watched_element)
+        except Exception:
+            logger.exception(
+                "Unexpected error on adding realtime health into status bar")
+
     def add_remote_element(self, element):
         """
         Add a remote watched ``element`` into the status bar.
@@ -126,13 +186,16 @@ class StatusBar:
 
     def _add_watched_element(self, box, watched_element):
         # Keeping a reference is needed to handle its callbacks properly
-        self._elements.add(watched_element)
+        with self._lock:
+            self._elements.add(watched_element)
         box.pack_start(watched_element.button, True, True, 0)
 
         if box.get_no_show_all():
             box.set_no_show_all(False)
         box.show_all()
 
+        self._start_updating()
+
     def remove_local_element(self, element):
         """
         Remove a local watched ``element`` from the status bar.
@@ -141,6 +204,14 @@ class StatusBar:
         """
         self._remove_watched_element(self._hbox_local, element)
 
+    def remove_health(self, pipeline):
+        """
+        Remove realtime health of ``pipeline`` from the status bar.
+
+        :param pipeline: :class:`core.process.Pipeline`
+        """
+        self._remove_watched_element(self._hbox_local, pipeline)
+
     def remove_remote_element(self, element):
         """
         Remove a remote watched ``element`` from the status bar.
@@ -153,16 +224,19 @@ class StatusBar:
         """
         Remove all elements, both local and remote ones, from the status bar.
         """
-        for watched_element in self._elements:
+        with self._lock:
+            watched_elements = self._elements
+            self._elements = set()
+
+        for watched_element in watched_elements:
             if isinstance(watched_element, WatchedRemote):
                 box = self._hbox_remote
-            elif isinstance(watched_element, WatchedLocal):
+            else:
                 box = self._hbox_local
             box.remove(watched_element.button)
 
         self._hbox_remote.hide()
         self._hbox_local.hide()
-        self._elements = set()
 
     def _remove_watched_element(self, box, element):
         watched_element = self.get_watched_element(element)
@@ -175,7 +249,8 @@ class StatusBar:
             # display the box.
             box.hide()
 
-        self._elements.remove(watched_element)
+        with self._lock:
+            self._elements.discard(watched_element)
 
 
 class WatchedElement:
@@ -235,6 +310,103 @@ class WatchedLocal(WatchedElement):
         pass
 
 
+class WatchedPostProcessor(WatchedLocal):
+    """
+    Representation of post-processing jobs status. Button is red if a job
+    has failed.
+
+    :param element: :class:`~core.postprocess.PostProcessor`
+    """
+    def __init__(self, element):
+        self._job_states = collections.OrderedDict(
+            (state, Gtk.Label("0"))
+            for state in (postprocess.RUNNING, postprocess.PENDING,
+                          postprocess.DONE, postprocess.FAILED))
+        self._current_job = Gtk.Label("N/A")
+        super().__init__(element)
+
+    def _build_info_popover(self):
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        vbox.pack_start(Gtk.Label("Post-processing jobs"), False, False, 6)
+        for state, label in self._job_states.items():
+            vbox.pack_start(
+                utils.build_multi_widgets_hbox(
+                    [Gtk.Label(state.capitalize()), ], [label, ], padding=6),
+                False, False, 6)
+        vbox.pack_start(self._current_job, False, False, 6)
+
+        popover = Gtk.Popover()
+        popover.add(vbox)
+        popover.set_position(Gtk.PositionType.TOP)
+
+        return popover
+
+    def update_content(self):
+        summary = self.element.get_summary()
+        if summary[postprocess.FAILED]:
+            self.button.set_icon_widget(self._red_square)
+        else:
+            self.button.set_icon_widget(self._green_square)
+        self.button.show_all()
+
+        for state, label in self._job_states.items():
+            label.set_text(str(summary[state]))
+
+        running = [job for job in self.element.get_jobs()
+                   if job.state == postprocess.RUNNING]
+        self._current_job.set_text(
+            "\n".join("{} {}".format(job.name, os.path.basename(job.path))
+                      for job in running) or "N/A")
+
+
+class WatchedHealth(WatchedLocal):
+    """
+    Representation of realtime health of the video path. Button is red if
+    the health score is below :const:`~core.telemetry.HEALTH_WARNING_SCORE`.
+
+    :param element: :class:`~core.process.Pipeline`
+    """
+    def __init__(self, element):
+        self._score = Gtk.Label("N/A")
+        self._counters = collections.OrderedDict(
+            (counter, Gtk.Label("N/A"))
+            for counter in ("frames_out", "duplicated", "late", "dropped"))
+        super().__init__(element)
+
+    def _build_info_popover(self):
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        vbox.pack_start(
+            utils.build_multi_widgets_hbox(
+                [Gtk.Label("Realtime health (%)"), ], [self._score, ],
+                padding=6),
+            False, False, 6)
+        for counter, label in self._counters.items():
+            vbox.pack_start(
+                utils.build_multi_widgets_hbox(
+                    [Gtk.Label(counter.replace("_", " ").capitalize()), ],
+                    [label, ], padding=6),
+                False, False, 6)
+
+        popover = Gtk.Popover()
+        popover.add(vbox)
+        popover.set_position(Gtk.PositionType.TOP)
+
+        return popover
+
+    def update_content(self):
+        stats = self.element.get_health()
+        if stats and stats["score"] < telemetry.HEALTH_WARNING_SCORE:
+            self.button.set_icon_widget(self._red_square)
+        else:
+            self.button.set_icon_widget(self._green_square)
+        self.button.show_all()
+
+        self._score.set_text(
+            "{:.0f}".format(stats["score"]) if stats else "N/A")
+        for counter, label in self._counters.items():
+            label.set_text(str(stats[counter]) if stats else "N/A")
+
+
 class WatchedRemote(WatchedElement):
     """
     Representation of a remote watched element.
@@ -318,8 +490,16 @@ class WatchedRemote(WatchedElement):
         self._latency.set_text(str(self.element.latency))
 
 
-_status_bar = StatusBar()
+_status_bar = None
 
 
 def get_status_bar():
+    """
+    Get the status bar, it's created on first call.
+
+    :return: :class:`StatusBar`
+    """
+    global _status_bar
+    if _status_bar is None:
+        _status_bar = StatusBar()
     return _status_bar
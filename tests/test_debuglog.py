@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import logging
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from core import debuglog
+
+logging.disable(logging.CRITICAL)
+
+
+class TestLogRing(unittest.TestCase):
+    def test_old_lines_are_dropped(self):
+        ring = debuglog.LogRing(duration=10, max_lines=100)
+        ring.add("spam", now=0)
+        ring.add("eggs", now=5)
+        ring.add("bacon", now=12)
+
+        self.assertEqual(ring.get_records(now=12), ["eggs", "bacon"])
+        self.assertEqual(ring.get_records(now=20), ["bacon"])
+
+    def test_max_lines(self):
+        ring = debuglog.LogRing(duration=10, max_lines=2)
+        for line in ("spam", "eggs", "bacon"):
+            ring.add(line, now=0)
+
+        self.assertEqual(len(ring), 2)
+        self.assertEqual(ring.get_records(now=0), ["eggs", "bacon"])
+
+
+class TestDump(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = unittest.mock.patch("core.graph.DUMP_DIRECTORY",
+                                      self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(debuglog.shutdown)
+
+    def test_no_capture(self):
+        self.assertIsNone(debuglog.dump("error"))
+
+    def test_dump(self):
+        ring = debuglog.setup(duration=10, max_lines=100)
+        ring.add((1.5, 42, "INFO", "spam", "spam.c", 10, "eggs", "bacon"),
+                 now=0)
+        ring.add((2.5, 42, "WARN", "spam", "spam.c", 20, "eggs", "ham"),
+                 now=1)
+
+        path = debuglog.dump("error", now=5)
+        self.assertEqual(os.path.dirname(path), self.directory.name)
+        self.assertTrue(path.endswith("-error.log"))
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual([line.split() for line in lines],
+                         [["1.500000", "42", "INFO", "spam", "spam.c:10:eggs",
+                           "bacon"],
+                          ["2.500000", "42", "WARN", "spam", "spam.c:20:eggs",
+                           "ham"]])
+
+    @unittest.mock.patch("core.debuglog.DUMP_INTERVAL", 10)
+    def test_dumps_are_rate_limited(self):
+        debuglog.setup(duration=10, max_lines=100)
+
+        self.assertIsNotNone(debuglog.dump("error", now=0))
+        self.assertIsNone(debuglog.dump("stall", now=5))
+        self.assertIsNotNone(debuglog.dump("stall", now=10))
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from core import graph
+
+
+class TestFormatDot(unittest.TestCase):
+    def test_format_caps(self):
+        self.assertEqual(graph.format_caps(
+            "video/x-raw, format=(string)I420, width=(int)1280"),
+            "video/x-raw\nformat=I420\nwidth=1280")
+
+    def test_format_dot(self):
+        dot = graph.format_dot(
+            "hubangl",
+            [graph.Node("queue_0", "PLAYING",
+                        ["queue", 'level: 3 buffers "full"']),
+             graph.Node("vp8_encoder", "PAUSED", ["vp8enc"])],
+            [graph.Edge("queue_0", "src", "vp8_encoder", "sink",
+                        "video/x-raw, width=(int)1280"),
+             graph.Edge("vp8_encoder", "src", "webm_muxer", "video_0",
+                        None)])
+
+        self.assertTrue(dot.startswith('digraph "hubangl" {\n'))
+        self.assertIn('"queue_0" [label="queue_0\\nqueue\\nlevel: 3 buffers'
+                      ' \\"full\\"", fillcolor="#c8e6c9"];', dot)
+        self.assertIn('"queue_0" -> "vp8_encoder" [label="src -> sink\\n'
+                      'video/x-raw\\nwidth=1280"];', dot)
+        # Links that failed to negotiate stand out.
+        self.assertIn('"vp8_encoder" -> "webm_muxer" [label="src -> video_0'
+                      '\\nnot negotiated", color=red, style=dashed];', dot)
+        self.assertTrue(dot.endswith("}\n"))
+
+
+class TestWriteDump(unittest.TestCase):
+    def test_write_dump(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                unittest.mock.patch.object(graph, "DOT", "no-such-dot"):
+            path = graph.write_dump("digraph {}\n", "error",
+                                    os.path.join(directory, "graphs"))
+
+            self.assertTrue(os.path.basename(path).startswith("hubangl-"))
+            self.assertTrue(path.endswith("-error.dot"))
+            with open(path) as f:
+                self.assertEqual(f.read(), "digraph {}\n")
+            # Graphviz is not available.
+            self.assertEqual(os.listdir(os.path.dirname(path)),
+                             [os.path.basename(path)])
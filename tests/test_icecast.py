@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import base64
+import logging
+import socket
+import threading
+import unittest
+import unittest.mock
+
+from core import icecast
+
+logging.disable(logging.CRITICAL)
+
+
+class FakeIcecastServer:
+    """
+    Minimal Icecast server replying to source handshakes.
+
+    :param password: source password accepted
+    :param methods: HTTP methods supported
+    """
+    def __init__(self, password="hackme", methods=("PUT", "SOURCE")):
+        self.password = password
+        self.methods = methods
+        self.requests = []
+
+        self._socket = socket.socket()
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(5)
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        # Closing alone doesn't wake up a thread blocked on accept(), the
+        # socket would keep accepting connections.
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            with conn:
+                request = conn.recv(4096).decode()
+                self.requests.append(request)
+                conn.sendall(self._reply(request))
+
+    def _reply(self, request):
+        method = request.split(" ", 1)[0]
+        if method not in self.methods:
+            return b"HTTP/1.0 405 Method Not Allowed\r\n\r\n"
+
+        credentials = base64.b64encode(
+            "source:{}".format(self.password).encode()).decode()
+        if "Authorization: Basic " + credentials not in request:
+            return b"HTTP/1.0 401 Authentication Required\r\n\r\n"
+
+        if method == "PUT":
+            return b"HTTP/1.1 100 Continue\r\n\r\n"
+        return b"HTTP/1.0 200 OK\r\n\r\n"
+
+
+class TestProbe(unittest.TestCase):
+    def setUp(self):
+        icecast.clear_cache()
+        self.server = FakeIcecastServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def _probe(self, password="hackme", port=None):
+        return icecast.probe_async("127.0.0.1", port or self.server.port,
+                                   "/test.ogg", password).result(5)
+
+    def test_probe_succeed(self):
+        self.assertIsNone(self._probe())
+        self.assertTrue(self.server.requests[0].startswith(
+            "PUT /test.ogg HTTP/1.1"))
+
+    def test_probe_login_failed(self):
+        self.assertEqual(self._probe(password="spam"), icecast.LOGIN_FAILED)
+
+    def test_probe_fallback_to_source_method(self):
+        self.server.methods = ("SOURCE",)
+
+        self.assertIsNone(self._probe())
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(self.server.requests[1].startswith("SOURCE "))
+
+    def test_probe_could_not_connect(self):
+        self.server.close()
+
+        self.assertEqual(self._probe(), icecast.COULD_NOT_CONNECT)
+
+    def test_probe_result_is_cached(self):
+        self._probe()
+        self._probe()
+        self.assertEqual(len(self.server.requests), 1)
+
+        # Password is part of the cache key.
+        self._probe(password="spam")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_cached_result_expires(self):
+        self._probe()
+        with unittest.mock.patch("core.icecast.PROBE_CACHE_TTL", -1):
+            self._probe()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_probe_all(self):
+        other_server = FakeIcecastServer(password="spam")
+        self.addCleanup(other_server.close)
+
+        results = icecast.probe_all(
+            [("127.0.0.1", self.server.port, "/test.ogg", "hackme"),
+             ("127.0.0.1", other_server.port, "/test.ogg", "hackme")])
+        self.assertEqual(results, [None, icecast.LOGIN_FAILED])
+
+    def test_probe_all_async(self):
+        other_server = FakeIcecastServer(password="spam")
+        self.addCleanup(other_server.close)
+        done = threading.Event()
+        results = []
+
+        def on_done(errors):
+            results.append(errors)
+            done.set()
+
+        icecast.probe_all_async(
+            [("127.0.0.1", self.server.port, "/test.ogg", "hackme"),
+             ("127.0.0.1", other_server.port, "/test.ogg", "hackme")],
+            on_done)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(results, [[None, icecast.LOGIN_FAILED]])
+
+        # Results are cached, callback is called right away.
+        icecast.probe_all_async(
+            [("127.0.0.1", self.server.port, "/test.ogg", "hackme")],
+            results.append)
+        self.assertEqual(results[-1], [None])
+
+    def test_probe_all_async_no_server(self):
+        results = []
+        icecast.probe_all_async([], results.append)
+        self.assertEqual(results, [[]])
+
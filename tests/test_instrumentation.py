@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import unittest
+
+from core import instrumentation
+
+
+class TestPadCounters(unittest.TestCase):
+    def setUp(self):
+        self.counters = instrumentation.PadCounters("vp8_encoder")
+
+    def test_no_data(self):
+        self.assertEqual(self.counters.get_stats(now=10),
+                         {"buffers": 0, "bytes": 0, "last_timestamp": None,
+                          "idle_time": None, "average_rate": 0.0})
+
+    def test_counters(self):
+        self.counters.add(1, 1000, pts=2 * 10 ** 9, now=10)
+        self.counters.add(3, 3000, now=12)
+
+        self.assertEqual(self.counters.get_stats(now=15),
+                         {"buffers": 4, "bytes": 4000, "last_timestamp": 2.0,
+                          "idle_time": 3, "average_rate": 2000.0})
+
+
+class TestLatencyStats(unittest.TestCase):
+    def test_no_data(self):
+        stats = instrumentation.LatencyStats("vp8_encoder:src")
+        self.assertEqual(stats.get_stats(),
+                         {"samples": 0, "latency": None, "average": None,
+                          "max": None})
+
+    def test_recent_latency(self):
+        stats = instrumentation.LatencyStats("vp8_encoder:src")
+        stats.add(1.0)
+        for _ in range(instrumentation.LATENCY_WINDOW):
+            stats.add(.5)
+
+        stats = stats.get_stats()
+        self.assertEqual(stats["latency"], .5)
+        self.assertEqual(stats["max"], 1.0)
+        self.assertAlmostEqual(stats["average"],
+                               (instrumentation.LATENCY_WINDOW / 2 + 1)
+                               / (instrumentation.LATENCY_WINDOW + 1))
+
+
+class TestLatencyBreakdown(unittest.TestCase):
+    def test_breakdown(self):
+        elements, sinks = instrumentation.get_latency_breakdown({
+            "usb_camera": ([], [.01]),
+            "vp8_encoder": ([.02], [.05]),
+            "tee_output_video": ([.06], [.06, .06]),
+            "webm_muxer": ([.06, .08], [.07]),
+            "video_show_0": ([.1], []),
+            "idle_sink": ([None], [])})
+
+        self.assertEqual(elements["usb_camera"], .01)
+        self.assertAlmostEqual(elements["vp8_encoder"], .03)
+        self.assertEqual(elements["tee_output_video"], 0)
+        # Output timestamped with an earlier input.
+        self.assertEqual(elements["webm_muxer"], 0)
+        self.assertEqual(sinks, {"video_show_0": .1})
+
+    def test_report(self):
+        report = instrumentation.format_latency_report(
+            {"vp8_encoder": .03, "usb_camera": .01}, {"video_show_0": .1})
+
+        lines = report.splitlines()
+        self.assertEqual(lines[0], "End-to-end latency:")
+        self.assertIn("video_show_0", lines[1])
+        self.assertIn("100.0 ms", lines[1])
+        self.assertIn("vp8_encoder", lines[3])
+        self.assertIn("usb_camera", lines[4])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import os
+import tempfile
+import unittest
+
+import gi
+gi.require_version("Gst", "1.0")  # NOQA
+from gi.repository import Gst
+
+from core import ioelements
+
+
+def setUpModule():
+    Gst.init(None)
+
+
+class TestStoreElement(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.main_directory = os.path.join(directory.name, "main")
+        self.fallback_directory = os.path.join(directory.name, "fallback")
+        self.path = os.path.join(self.main_directory, "show.webm")
+
+    def test_single_file(self):
+        sink = ioelements.StoreElement("spam", self.path)
+
+        self.assertFalse(sink.multifile)
+        self.assertEqual(sink.get_property("location"), self.path)
+        self.assertEqual(sink.get_current_path(), self.path)
+
+    def test_switch_directory(self):
+        sink = ioelements.StoreElement(
+            "spam", self.path, fallback_directories=[self.fallback_directory])
+        self.assertTrue(sink.multifile)
+        self.assertFalse(sink.switched)
+        self.assertEqual(sink.get_property("index"), 0)
+        self.assertEqual(sink.get_segment_path(0), self.path)
+
+        index = sink.switch_directory(self.fallback_directory)
+
+        self.assertEqual(index, 1)
+        self.assertTrue(sink.switched)
+        self.assertEqual(sink.directory, self.fallback_directory)
+        self.assertEqual(sink.get_property("location"),
+                         os.path.join(self.fallback_directory,
+                                      "show_%05d.webm"))
+        # First file is kept where it was written.
+        self.assertEqual(sink.get_segment_path(0), self.path)
+        self.assertEqual(sink.get_segment_path(1),
+                         os.path.join(self.fallback_directory,
+                                      "show_00001.webm"))
+
+    def test_switch_segmented_recording(self):
+        sink = ioelements.StoreElement(
+            "spam", self.path, segment_duration=60,
+            fallback_directories=[self.fallback_directory])
+        sink.on_segment_closed(0)
+        sink.on_segment_closed(1)
+        sink.set_property("index", 2)
+
+        self.assertEqual(sink.directory_index, 0)
+
+        index = sink.switch_directory(self.fallback_directory)
+
+        self.assertEqual(index, 3)
+        self.assertEqual(sink.directory_index, 3)
+        self.assertEqual(sink.get_segment_path(1),
+                         os.path.join(self.main_directory, "show_00001.webm"))
+        self.assertEqual(sink.get_segment_path(3),
+                         os.path.join(self.fallback_directory,
+                                      "show_00003.webm"))
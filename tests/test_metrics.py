@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import logging
+import unittest
+import urllib.error
+import urllib.request
+
+from core import metrics
+from core import reconnect
+
+logging.disable(logging.CRITICAL)
+
+
+class FakeStoreSink:
+    directories = ["/"]
+
+
+class FakePipeline:
+    is_playing = True
+    store_sink_branches = {"audio": {"tee": None,
+                                     "branches": [(None, FakeStoreSink())]}}
+
+    def get_stream_states(self):
+        state = reconnect.ReconnectState("stream").get_state()
+        state["server"] = ("127.0.0.1", 8000)
+        return {"audio_show_0": state}
+
+    def get_store_stats(self):
+        return {}
+
+    def get_pad_stats(self):
+        return {"vp8_encoder": {"buffers": 10, "bytes": 4096,
+                                "idle_time": None}}
+
+    def get_stall_stats(self):
+        return {"audio_show_0": {"stalled": False, "stalls": 1}}
+
+    def get_latency_report(self):
+        return {"vp8_encoder": .03}, {"video_show_0": .25}
+
+    def get_queue_stats(self):
+        return {"queue_muxer_audio": {"buffers": 3, "bytes": 100,
+                                      "time": .5, "fill": .25,
+                                      "overruns": 0}}
+
+    def get_qos_stats(self):
+        return {"usb_camera": {"messages": 1, "processed": 100,
+                               "dropped": 3, "jitter": .04,
+                               "proportion": None},
+                "vp8_encoder": {"warnings": 2}}
+
+    def get_av_sync_stats(self):
+        return {"drift": -.025, "correction": 0.0}
+
+    def get_health(self):
+        return {"score": 97.0}
+
+    def get_encoder_stats(self):
+        return {"vorbis_encoder": {"target_bitrate": None},
+                "videorate": {"dropped_frames": 2, "duplicated_frames": 0}}
+
+
+class TestMetric(unittest.TestCase):
+    def test_format(self):
+        metric = metrics.Metric("hubangl_queue_fill_ratio", metrics.GAUGE,
+                                "Fill ratio")
+        metric.add(.5, queue="queue_0")
+        metric.add(True, queue='spam "eggs"\n')
+        metric.add(None, queue="skipped")
+
+        self.assertEqual(metric.format(),
+                         "# HELP hubangl_queue_fill_ratio Fill ratio\n"
+                         "# TYPE hubangl_queue_fill_ratio gauge\n"
+                         'hubangl_queue_fill_ratio{queue="queue_0"} 0.5\n'
+                         'hubangl_queue_fill_ratio{queue="spam \\"eggs\\"\\n"}'
+                         " 1\n")
+
+    def test_collect_metrics(self):
+        text = metrics.collect_metrics(FakePipeline())
+
+        self.assertIn("hubangl_pipeline_playing 1\n", text)
+        self.assertIn('hubangl_stream_connected{server="127.0.0.1:8000",'
+                      'stream="audio_show_0"} 1\n', text)
+        self.assertIn('hubangl_pad_bytes_total{pad="vp8_encoder"} 4096\n',
+                      text)
+        self.assertIn('hubangl_stalls_total{pad="audio_show_0"} 1\n', text)
+        self.assertIn('hubangl_end_to_end_latency_seconds'
+                      '{sink="video_show_0"} 0.25\n', text)
+        self.assertIn('hubangl_queue_level_seconds{queue="queue_muxer_audio"}'
+                      ' 0.5\n', text)
+        self.assertIn("hubangl_video_dropped_frames_total 2\n", text)
+        self.assertIn('hubangl_qos_dropped_total{element="usb_camera"} 3\n',
+                      text)
+        self.assertIn('hubangl_warnings_total{element="vp8_encoder"} 2\n',
+                      text)
+        self.assertIn("hubangl_realtime_health_score 97.0\n", text)
+        self.assertIn("hubangl_av_drift_seconds -0.025\n", text)
+        self.assertIn('hubangl_disk_free_bytes{directory="/"}', text)
+        self.assertIn("hubangl_process_cpu_seconds_total ", text)
+        # Metrics without any sample are left out.
+        self.assertNotIn("pad_idle_seconds", text)
+        self.assertNotIn("encoder_target_bitrate", text)
+
+    def test_get_values(self):
+        metric_set = metrics.MetricSet()
+        metric_set.add("pipeline_playing", metrics.GAUGE, "Playing", True)
+        metric_set.add("queue_fill_ratio", metrics.GAUGE, "Fill ratio", .5,
+                       queue="queue_0")
+
+        self.assertEqual(metric_set.get_values(),
+                         {"hubangl_pipeline_playing": 1.0,
+                          'hubangl_queue_fill_ratio{queue="queue_0"}': .5})
+
+
+class TestMetricsServer(unittest.TestCase):
+    def setUp(self):
+        self.server = metrics.MetricsServer(port=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def test_serve_snapshot(self):
+        self.server.set_snapshot("hubangl_pipeline_playing 0\n")
+
+        with urllib.request.urlopen(self.url + "/metrics") as response:
+            self.assertEqual(response.headers["Content-Type"],
+                             metrics.CONTENT_TYPE)
+            self.assertEqual(response.read(), b"hubangl_pipeline_playing 0\n")
+
+    def test_unknown_path(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(self.url + "/spam")
+        self.assertEqual(context.exception.code, 404)
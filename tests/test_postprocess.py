@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import hashlib
+import io
+import logging
+import os
+import struct
+import tempfile
+import time
+import unittest
+
+from core import postprocess
+
+logging.disable(logging.CRITICAL)
+
+
+def wait_jobs(postprocessor, timeout=10):
+    end_time = time.monotonic() + timeout
+    while time.monotonic() < end_time:
+        summary = postprocessor.get_summary()
+        if not summary[postprocess.PENDING] + summary[postprocess.RUNNING]:
+            return summary
+        time.sleep(.05)
+    raise AssertionError("Post-processing jobs are still running")
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "show.webm")
+        with open(self.path, "wb") as f:
+            f.write(b"spam" * 1000)
+
+    def test_checksum(self):
+        postprocess.checksum(self.path)
+
+        with open(postprocess.get_checksum_path(self.path)) as f:
+            self.assertEqual(
+                f.read(),
+                "{}  show.webm\n".format(
+                    hashlib.sha256(b"spam" * 1000).hexdigest()))
+
+    def test_compute_peaks(self):
+        samples = [0, 10, -20, 5, 7, -3, 100]
+        stream = io.BytesIO(struct.pack("<{}h".format(len(samples)),
+                                        *samples))
+
+        self.assertEqual(postprocess.compute_peaks(stream, 3),
+                         [-20, 10, -3, 7, 100, 100])
+
+    def test_unknown_job(self):
+        with self.assertRaises(ValueError):
+            postprocess.PostProcessor(jobs=("spam",))
+
+
+class TestPostProcessor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _create_recording(self, name, data=b"spam"):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_run_jobs_in_subprocess(self):
+        postprocessor = postprocess.PostProcessor(jobs=("checksum",),
+                                                  workers=2)
+        self.addCleanup(postprocessor.shutdown)
+        paths = [self._create_recording("show_{}.webm".format(index))
+                 for index in range(3)]
+        for path in paths:
+            postprocessor.submit(path)
+
+        summary = wait_jobs(postprocessor)
+        self.assertEqual(summary[postprocess.DONE], 3)
+        for path in paths:
+            self.assertTrue(os.path.exists(
+                postprocess.get_checksum_path(path)))
+
+    def test_failed_job(self):
+        postprocessor = postprocess.PostProcessor(jobs=("remux", "checksum"))
+        self.addCleanup(postprocessor.shutdown)
+        path = self._create_recording("show.webm")
+
+        remux_job, checksum_job = postprocessor.submit(path)
+        wait_jobs(postprocessor)
+
+        # Following jobs are run anyway.
+        self.assertEqual(remux_job.state, postprocess.FAILED)
+        self.assertIn("Unsupported file format", remux_job.error)
+        self.assertEqual(checksum_job.state, postprocess.DONE)
+
+    def test_no_job_after_shutdown(self):
+        postprocessor = postprocess.PostProcessor(jobs=("checksum",))
+        postprocessor.shutdown()
+
+        self.assertEqual(postprocessor.submit(self._create_recording("a")),
+                         [])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import logging
+import unittest
+
+from core import profiling
+
+logging.disable(logging.CRITICAL)
+
+
+class TestStartupProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = profiling.setup()
+
+    def tearDown(self):
+        profiling._profiler = None
+
+    def test_phase_does_nothing_if_disabled(self):
+        profiling._profiler = None
+        with profiling.phase("spam"):
+            pass
+        profiling.mark("eggs")
+        profiling.finish()
+
+    def test_nested_phases(self):
+        with profiling.phase("spam"):
+            with profiling.phase("eggs"):
+                pass
+
+        breakdown = self.profiler.get_breakdown()
+        self.assertEqual([(name, depth) for name, depth, *_ in breakdown],
+                         [("spam", 0), ("eggs", 1)])
+
+    def test_phases_with_same_name_are_aggregated(self):
+        for _ in range(3):
+            with profiling.phase("spam"):
+                pass
+
+        breakdown = self.profiler.get_breakdown()
+        self.assertEqual(len(breakdown), 1)
+        self.assertEqual(breakdown[0][2], 3)
+
+    def test_finish(self):
+        with profiling.phase("spam"):
+            pass
+        profiling.finish()
+        self.assertTrue(self.profiler.finished)
+
+        # Phases are not recorded once profiling is finished
+        with profiling.phase("eggs"):
+            pass
+        self.assertEqual(len(self.profiler.get_breakdown()), 1)
+        self.assertIn("spam", self.profiler.report())
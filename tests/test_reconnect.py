@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import logging
+import threading
+import time
+import unittest
+import unittest.mock
+
+from core import reconnect
+
+logging.disable(logging.CRITICAL)
+
+
+class TestReconnectState(unittest.TestCase):
+    def setUp(self):
+        self.state = reconnect.ReconnectState("spam")
+
+    @unittest.mock.patch("random.random", return_value=0)
+    def test_delay_grows_exponentially(self, _):
+        delays = []
+        for _ in range(4):
+            delays.append(self.state.on_failure())
+            self.state.on_attempt()
+
+        self.assertEqual(delays, [5, 10, 20, 40])
+
+    @unittest.mock.patch("core.reconnect.RECONNECT_MAX_INTERVAL", 30)
+    @unittest.mock.patch("random.random", return_value=0)
+    def test_delay_is_capped(self, _):
+        for _ in range(10):
+            delay = self.state.on_failure()
+            self.state.on_attempt()
+
+        self.assertEqual(delay, 30)
+
+    @unittest.mock.patch("random.random", return_value=1)
+    def test_delay_jitter(self, _):
+        delay = self.state.on_failure()
+        self.assertEqual(
+            delay, reconnect.RECONNECT_INTERVAL
+            * (1 - reconnect.RECONNECT_JITTER))
+
+    def test_failure_registered_once(self):
+        self.assertIsNotNone(self.state.on_failure())
+        self.assertIsNone(self.state.on_failure())
+        self.assertEqual(self.state.get_state()["outages"], 1)
+
+    def test_connected_after_attempts(self):
+        for _ in range(3):
+            self.state.on_failure()
+            self.state.on_attempt()
+        self.state.on_connected()
+
+        state = self.state.get_state()
+        self.assertEqual(state["state"], reconnect.CONNECTED)
+        self.assertEqual(state["attempts"], 0)
+        self.assertEqual(state["total_attempts"], 3)
+        self.assertEqual(state["outages"], 1)
+        self.assertIsNone(state["down_since"])
+        self.assertGreaterEqual(state["downtime"], 0)
+
+    def test_reset(self):
+        self.state.on_failure()
+        self.state.reset()
+
+        self.assertEqual(self.state.state, reconnect.CONNECTED)
+        self.assertIsNone(self.state.down_since)
+
+
+class TestOutageGate(unittest.TestCase):
+    def setUp(self):
+        self.gate = reconnect.OutageGate("spam")
+        self.sink_up = False
+        self.tries = []
+        self.sent = []
+        self.attempts = 0
+
+    def _send(self, data):
+        self.tries.append(data)
+        if self.sink_up:
+            self.sent.append(data)
+        return self.sink_up
+
+    def _on_attempt(self):
+        self.attempts += 1
+
+    def _push_all(self, data, results):
+        for item in data:
+            results.append(self.gate.push(lambda: self._send(item),
+                                          self._on_attempt))
+
+    def _start_pushing(self, data):
+        results = []
+        thread = threading.Thread(target=self._push_all,
+                                  args=(data, results))
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread, results
+
+    def _wait_for_tries(self, count):
+        deadline = time.monotonic() + 5
+        while not (len(self.tries) == count and self.gate.waiting):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(.01)
+
+    def test_data_survives_failed_attempts(self):
+        thread, results = self._start_pushing(["eggs", "bacon"])
+        self._wait_for_tries(1)
+
+        # Server is still unreachable.
+        self.gate.on_attempt()
+        self._wait_for_tries(2)
+        self.gate.on_attempt()
+        self._wait_for_tries(3)
+
+        self.sink_up = True
+        self.gate.on_attempt()
+        thread.join(5)
+
+        self.assertEqual(self.tries, ["eggs", "eggs", "eggs", "eggs",
+                                      "bacon"])
+        self.assertEqual(self.sent, ["eggs", "bacon"])
+        self.assertEqual(results, [True, True])
+        self.assertEqual(self.attempts, 3)
+        self.assertFalse(self.gate.waiting)
+
+    def test_attempt_before_waiting(self):
+        def send():
+            self.tries.append("eggs")
+            if len(self.tries) == 1:
+                # Sink is reconnected before the failure is handled.
+                self.gate.on_attempt()
+                return False
+            return True
+
+        self.assertTrue(self.gate.push(send, self._on_attempt))
+        self.assertEqual(self.tries, ["eggs", "eggs"])
+        self.assertEqual(self.attempts, 1)
+
+    def test_stop(self):
+        thread, results = self._start_pushing(["eggs"])
+        self._wait_for_tries(1)
+
+        self.gate.stop()
+        thread.join(5)
+        self.assertEqual(results, [False])
+        self.assertEqual(self.sent, [])
+        self.assertTrue(self.gate.stopped)
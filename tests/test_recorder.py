@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import logging
+import math
+import os
+import tempfile
+import unittest
+
+from core import recorder
+
+logging.disable(logging.CRITICAL)
+
+
+class TestTelemetryRecorder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "session.telemetry")
+
+    def _record(self, samples, max_size=recorder.RECORDER_MAX_SIZE):
+        telemetry_recorder = recorder.TelemetryRecorder(self.path, max_size)
+        for timestamp, values in samples:
+            telemetry_recorder.record(values, timestamp)
+        telemetry_recorder.close()
+
+    def test_record_and_load(self):
+        self._record([(10, {"spam": 1, "eggs": 2}),
+                      (15, {"spam": 3}),
+                      (20, {"spam": 5, "bacon": 7})])
+
+        timestamps, series = recorder.load(self.path)
+        self.assertEqual(list(timestamps), [10, 15, 20])
+        self.assertEqual(list(series["spam"]), [1, 3, 5])
+        self.assertEqual(series["eggs"][0], 2)
+        self.assertTrue(math.isnan(series["eggs"][1]))
+        self.assertTrue(math.isnan(series["eggs"][2]))
+        self.assertTrue(math.isnan(series["bacon"][0]))
+        self.assertEqual(series["bacon"][2], 7)
+
+    def test_append_to_existing_file(self):
+        self._record([(10, {"spam": 1})])
+        self._record([(15, {"spam": 2, "eggs": 3})])
+
+        timestamps, series = recorder.load(self.path)
+        self.assertEqual(list(timestamps), [10, 15])
+        self.assertEqual(list(series["spam"]), [1, 2])
+        self.assertEqual(series["eggs"][1], 3)
+
+    def test_truncated_record_is_discarded(self):
+        self._record([(10, {"spam": 1}), (15, {"spam": 2})])
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+
+        timestamps, series = recorder.load(self.path)
+        self.assertEqual(list(timestamps), [10])
+
+        self._record([(20, {"spam": 3})])
+        timestamps, series = recorder.load(self.path)
+        self.assertEqual(list(timestamps), [10, 20])
+        self.assertEqual(list(series["spam"]), [1, 3])
+
+    def test_rotation(self):
+        self._record([(timestamp, {"spam": timestamp})
+                      for timestamp in range(100)], max_size=500)
+
+        rotated_path = self.path + recorder.ROTATED_SUFFIX
+        self.assertTrue(os.path.exists(rotated_path))
+        self.assertLess(os.path.getsize(self.path), 600)
+        timestamps, series = recorder.load(rotated_path, self.path)
+        # Samples are contiguous, the oldest ones are dropped.
+        self.assertEqual(timestamps[-1], 99)
+        self.assertEqual(list(timestamps),
+                         list(range(int(timestamps[0]), 100)))
+        self.assertEqual(list(series["spam"]), list(timestamps))
+
+    def test_not_a_telemetry_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"spam and eggs")
+
+        with self.assertRaises(recorder.TelemetryError):
+            recorder.load(self.path)
+        with self.assertRaises(recorder.TelemetryError):
+            recorder.TelemetryRecorder(self.path)
+
+
+class TestSummarize(unittest.TestCase):
+    def test_summarize(self):
+        timestamps = [0, 10, 20]
+        series = {"queue_level": [1, math.nan, 5],
+                  'bytes_total{sink="spam"}': [0, 100, 400]}
+
+        summary = recorder.summarize(timestamps, series)
+        self.assertEqual([stats["name"] for stats in summary],
+                         ['bytes_total{sink="spam"}', "queue_level"])
+        counter, gauge = summary
+        self.assertEqual(counter["rate"], 20)
+        self.assertEqual(counter["last"], 400)
+        self.assertEqual(gauge["samples"], 2)
+        self.assertEqual(gauge["min"], 1)
+        self.assertEqual(gauge["mean"], 3)
+        self.assertEqual(gauge["max"], 5)
+        self.assertIsNone(gauge["rate"])
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import logging
+import os
+import struct
+import tempfile
+import unittest
+
+from core import recovery
+from core.recovery import encode_element, encode_id, encode_size, encode_uint
+
+logging.disable(logging.CRITICAL)
+
+
+def build_simple_block(track, timecode, keyframe, payload=b"\x00" * 32):
+    flags = 0x80 if keyframe else 0
+    data = (encode_size(track) + struct.pack(">hB", timecode, flags)
+            + payload)
+    return encode_element(recovery.SIMPLE_BLOCK, data)
+
+
+def build_streamable_webm(cluster_count=3):
+    """
+    Build a recording as written by a live muxer: segment and clusters have
+    an unknown size, and there are no cues.
+
+    :return: recording as :class:`bytes` and offsets of clusters
+    """
+    header = encode_element(recovery.EBML,
+                            encode_element(0x4282, b"webm"))
+    info = encode_element(
+        recovery.INFO,
+        encode_element(recovery.TIMECODE_SCALE, encode_uint(1000000)))
+    tracks = encode_element(
+        recovery.TRACKS,
+        encode_element(recovery.TRACK_ENTRY,
+                       encode_element(recovery.TRACK_NUMBER, encode_uint(1))
+                       + encode_element(recovery.TRACK_TYPE, encode_uint(1)))
+        + encode_element(recovery.TRACK_ENTRY,
+                         encode_element(recovery.TRACK_NUMBER, encode_uint(2))
+                         + encode_element(recovery.TRACK_TYPE,
+                                          encode_uint(2))))
+
+    data = (header + encode_id(recovery.SEGMENT)
+            + encode_size(recovery.UNKNOWN_SIZE) + info + tracks)
+    offsets = []
+    for index in range(cluster_count):
+        offsets.append(len(data))
+        data += (encode_id(recovery.CLUSTER)
+                 + encode_size(recovery.UNKNOWN_SIZE)
+                 + encode_element(recovery.TIMECODE,
+                                  encode_uint(index * 1000)))
+        for timecode in range(0, 1000, 250):
+            data += build_simple_block(1, timecode, timecode == 0)
+            data += build_simple_block(2, timecode, True)
+
+    return data, offsets
+
+
+def parse_elements(data):
+    """
+    :return: :class:`list` of ``(id, data)``
+    """
+    return list(recovery._iter_children(data))
+
+
+class TestRecovery(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "show.webm")
+
+    def _write(self, data):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def _read_segment(self, path):
+        with open(path, "rb") as f:
+            elements = parse_elements(f.read())
+        self.assertEqual([element_id for element_id, _ in elements],
+                         [recovery.EBML, recovery.SEGMENT])
+        return dict(parse_elements(elements[1][1])), parse_elements(
+            elements[1][1])
+
+    def test_recover_truncated_matroska(self):
+        data, _ = build_streamable_webm()
+        # Last block is partially written.
+        self._write(data[:-10])
+
+        result = recovery.recover(self.path)
+        self.assertEqual(result["clusters"], 3)
+        self.assertEqual(result["cues"], 3)
+        self.assertEqual(result["duration"], 2.75)
+
+        segment, children = self._read_segment(result["output"])
+        self.assertIn(recovery.SEEK_HEAD, segment)
+        self.assertIn(recovery.CUES, segment)
+        info = dict(parse_elements(segment[recovery.INFO]))
+        self.assertEqual(struct.unpack(">d", info[recovery.DURATION])[0],
+                         2750.0)
+        clusters = [child for element_id, child in children
+                    if element_id == recovery.CLUSTER]
+        self.assertEqual(len(clusters), 3)
+        # Partial block is dropped.
+        self.assertEqual(len(parse_elements(clusters[-1])), 8)
+
+    def test_cues_point_to_clusters(self):
+        data, _ = build_streamable_webm()
+        self._write(data)
+
+        output = recovery.recover(self.path)["output"]
+        with open(output, "rb") as f:
+            content = f.read()
+        segment_start = content.index(encode_id(recovery.SEGMENT)) + 12
+        segment, _ = self._read_segment(output)
+
+        for _, cue_point in parse_elements(segment[recovery.CUES]):
+            cue_point = dict(parse_elements(cue_point))
+            positions = dict(
+                parse_elements(cue_point[recovery.CUE_TRACK_POSITIONS]))
+            # Video track is used for cues.
+            self.assertEqual(positions[recovery.CUE_TRACK], b"\x01")
+            position = int.from_bytes(
+                positions[recovery.CUE_CLUSTER_POSITION], "big")
+            self.assertEqual(
+                content[segment_start + position:segment_start + position + 4],
+                encode_id(recovery.CLUSTER))
+
+    def test_recover_in_place(self):
+        data, _ = build_streamable_webm()
+        self._write(data)
+        recovery.IndexWriter(self.path).close()
+
+        result = recovery.recover(self.path, in_place=True)
+        self.assertEqual(result["output"], self.path)
+        self.assertFalse(os.path.exists(recovery.get_index_path(self.path)))
+        with open(self.path, "rb") as f:
+            self.assertIn(encode_id(recovery.CUES), f.read())
+
+    def test_skip_corrupted_data_with_index(self):
+        data, offsets = build_streamable_webm()
+        # Garbage overwrites the beginning of the second cluster.
+        data = (data[:offsets[1]] + b"\x00" * 8 + data[offsets[1] + 8:])
+        self._write(data)
+
+        writer = recovery.IndexWriter(self.path)
+        for offset in offsets:
+            writer.add(offset)
+        writer.close()
+
+        result = recovery.recover(self.path)
+        self.assertEqual(result["clusters"], 2)
+
+    def test_recover_truncated_ogg(self):
+        page = (b"OggS" + b"\x00" * 22 + b"\x01" + b"\x10" + b"\xff" * 16)
+        self._write(page * 3 + page[:20])
+
+        result = recovery.recover(self.path)
+        self.assertEqual(result["pages"], 3)
+        self.assertEqual(os.path.getsize(result["output"]), len(page) * 3)
+
+    def test_recover_unsupported_format(self):
+        self._write(b"spam" * 10)
+
+        with self.assertRaises(recovery.RecoveryError):
+            recovery.recover(self.path)
+        self.assertFalse(os.path.exists(
+            recovery.get_recovered_path(self.path)))
+
+    def test_needs_remux(self):
+        data, _ = build_streamable_webm()
+        self._write(data)
+        self.assertTrue(recovery.needs_remux(self.path))
+
+        # Recovered file has known sizes and cues.
+        output = recovery.recover(self.path)["output"]
+        self.assertFalse(recovery.needs_remux(output))
+
+        self._write(b"OggS" + b"\x00" * 40)
+        self.assertFalse(recovery.needs_remux(self.path))
+
+        self._write(b"spam" * 10)
+        with self.assertRaises(recovery.RecoveryError):
+            recovery.needs_remux(self.path)
+
+
+class TestIndexWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "show.webm")
+
+    def test_write_and_read_index(self):
+        writer = recovery.IndexWriter(self.path, sync_interval=0)
+        writer.add(0, 0)
+        writer.add(4096)
+        # Index is readable while being written.
+        self.assertEqual(recovery.read_index(self.path), [(0, 0), (4096, None)])
+
+        writer.close()
+        self.assertEqual(recovery.find_interrupted_recordings(
+            self.directory.name), [])
+        open(self.path, "w").close()
+        self.assertEqual(recovery.find_interrupted_recordings(
+            self.directory.name), [self.path])
+
+    def test_close_and_remove(self):
+        writer = recovery.IndexWriter(self.path)
+        writer.close(remove=True)
+        self.assertFalse(os.path.exists(recovery.get_index_path(self.path)))
+        # Adding once closed does nothing.
+        writer.add(0)
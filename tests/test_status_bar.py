@@ -38,6 +38,16 @@ class TestStatusBar(unittest.TestCase):
     def test_remove_watched_element(self):
         pass
 
+    def test_update_not_started_without_watched_element(self):
+        self.assertIsNone(self.status_bar._executor)
+        self.assertIsNone(self.status_bar._update_task)
+
+    def test_get_status_bar_is_lazy(self):
+        self.assertIsNone(status_bar._status_bar)
+        self.assertIs(status_bar.get_status_bar(),
+                      status_bar.get_status_bar())
+        status_bar._status_bar = None
+
 
 class TestWatchedElement(unittest.TestCase):
     def setUp(self):
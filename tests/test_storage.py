@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+import logging
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from core import storage
+
+logging.disable(logging.CRITICAL)
+
+
+class TestWriteStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = storage.WriteStats("spam")
+
+    def test_counters(self):
+        self.stats.add(1000, now=0)
+        self.stats.add(3000, now=2)
+
+        stats = self.stats.get_stats(now=2)
+        self.assertEqual(stats["bytes"], 4000)
+        self.assertEqual(stats["buffers"], 2)
+        self.assertEqual(stats["rate"], 1500)
+        self.assertEqual(stats["average_rate"], 2000)
+
+    @unittest.mock.patch("core.storage.RATE_WINDOW", 5)
+    def test_rate_uses_recent_samples_only(self):
+        self.stats.add(100000, now=0)
+        self.stats.add(1000, now=10)
+        self.stats.add(1000, now=11)
+
+        self.assertEqual(self.stats.get_rate(now=11), 1000)
+        # No data written recently.
+        self.assertEqual(self.stats.get_rate(now=30), 0)
+
+    def test_fsync_counters(self):
+        self.stats.on_fsync(.5)
+        self.stats.on_fsync(.1)
+
+        stats = self.stats.get_stats()
+        self.assertEqual(stats["fsyncs"], 2)
+        self.assertEqual(stats["last_fsync_duration"], .1)
+        self.assertEqual(stats["max_fsync_duration"], .5)
+
+
+class TestFileSyncer(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "show.webm")
+        self.stats = storage.WriteStats("spam")
+        self.syncer = storage.FileSyncer(lambda: self.path, 60, self.stats)
+
+    def test_sync_missing_file(self):
+        self.syncer.sync()
+        self.assertEqual(self.stats.get_stats()["fsyncs"], 0)
+
+    def test_sync(self):
+        open(self.path, "w").close()
+
+        with unittest.mock.patch("os.fsync") as fsync_mock:
+            self.syncer.sync()
+        self.assertTrue(fsync_mock.called)
+        self.assertEqual(self.stats.get_stats()["fsyncs"], 1)
+
+    def test_stop_does_last_sync(self):
+        open(self.path, "w").close()
+        stopped = threading.Event()
+
+        self.syncer.start()
+        self.syncer.stop(stopped.set)
+        self.assertFalse(self.syncer.running)
+        self.assertTrue(stopped.wait(5))
+        self.assertEqual(self.stats.get_stats()["fsyncs"], 1)
+        # Does nothing if not started.
+        self.syncer.stop()
+
+    def test_stop_syncs_closed_files(self):
+        closed_path = self.path + ".closed"
+        open(closed_path, "w").close()
+        stopped = threading.Event()
+
+        with unittest.mock.patch("os.open", wraps=os.open) as open_mock:
+            self.syncer.start()
+            self.syncer.stop(stopped.set, [closed_path])
+            self.assertTrue(stopped.wait(5))
+        self.assertEqual([args[0] for args, _ in open_mock.call_args_list],
+                         [closed_path])
+        self.assertEqual(self.stats.get_stats()["fsyncs"], 1)
+
+    def test_stop_doesnt_wait_for_sync(self):
+        open(self.path, "w").close()
+        sync_started = threading.Event()
+        release_sync = threading.Event()
+        stopped = threading.Event()
+
+        def fsync(fd):
+            sync_started.set()
+            release_sync.wait(5)
+
+        with unittest.mock.patch("os.fsync", fsync):
+            self.syncer.start()
+            self.syncer.stop(stopped.set)
+            # Last sync is stuck on disk, stop() returned anyway.
+            self.assertTrue(sync_started.wait(5))
+            self.assertFalse(stopped.is_set())
+            release_sync.set()
+            self.assertTrue(stopped.wait(5))
+
+
+class TestFallbackDirectories(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_get_free_space(self):
+        self.assertGreater(storage.get_free_space(self.directory.name), 0)
+        self.assertIsNone(storage.get_free_space(
+            os.path.join(self.directory.name, "spam")))
+
+    def test_choose_directory(self):
+        free_spaces = {"/full": 10, "/missing": None, "/empty": 1000}
+
+        with unittest.mock.patch("core.storage.get_free_space",
+                                 side_effect=free_spaces.get):
+            self.assertEqual(storage.choose_directory(
+                ["/full", "/missing", "/empty"], 100), "/empty")
+            self.assertIsNone(storage.choose_directory(
+                ["/full", "/missing"], 100))
+
+    def test_write_manifest(self):
+        location = os.path.join(self.directory.name, "show.webm")
+        path = storage.get_manifest_path(location)
+        self.assertEqual(path, os.path.join(self.directory.name, "show.m3u"))
+        self.assertEqual(storage.get_manifest_path(location, "/fallback"),
+                         "/fallback/show.m3u")
+
+        storage.write_manifest(path, [location, "/fallback/show_00001.webm"])
+        with open(path) as f:
+            self.assertEqual(f.read().splitlines(),
+                             ["#EXTM3U", location,
+                              "/fallback/show_00001.webm"])
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import unittest
+
+from core import telemetry
+
+
+class TestQueueMonitor(unittest.TestCase):
+    def setUp(self):
+        self.monitor = telemetry.QueueMonitor("queue_muxer_audio")
+
+    def _sample(self, now, buffers):
+        self.monitor.add_sample(now, (buffers, 0, 0), (200, 0, 0))
+        return self.monitor.check(now)
+
+    def test_fill_ratio(self):
+        # Most constraining limit is used, 0 means no limit.
+        self.assertEqual(telemetry.get_fill_ratio((10, 500, 0),
+                                                  (100, 1000, 0)), .5)
+        self.assertEqual(telemetry.get_fill_ratio((10, 0, 0), (0, 0, 0)), 0)
+        self.assertEqual(telemetry.get_fill_ratio((300, 0, 0), (200, 0, 0)),
+                         1)
+
+    def test_congestion_alert(self):
+        self.assertEqual(self._sample(0, 190), [])
+        self.assertEqual(self._sample(4, 200), [])
+        self.assertEqual(self._sample(5, 200), [telemetry.CONGESTED])
+        self.assertEqual(self._sample(6, 200), [])
+
+        # Alert is cleared once the queue stays below the watermark.
+        self.assertEqual(self._sample(7, 10), [])
+        self.assertEqual(self._sample(12, 10), [telemetry.DECONGESTED])
+
+    def test_short_peak_is_ignored(self):
+        for now, buffers in enumerate((200, 200, 10, 200, 200, 10)):
+            self.assertEqual(self._sample(now, buffers), [])
+
+    def test_leaking_alert(self):
+        monitor = telemetry.QueueMonitor("queue_audio_streamsink_0",
+                                         leaky=True)
+        self.assertEqual(monitor.check(0), [])
+
+        monitor.on_overrun()
+        monitor.on_overrun()
+        self.assertEqual(monitor.check(1), [telemetry.LEAKING])
+        self.assertEqual(monitor.check(2), [])
+        self.assertEqual(monitor.check(6), [telemetry.STOPPED_LEAKING])
+        self.assertEqual(monitor.get_stats()["dropped"], 2)
+
+    def test_stats(self):
+        self.monitor.add_sample(0, (50, 1000, 2 * 10 ** 9), (200, 0, 0))
+        self.monitor.add_sample(1, (150, 3000, 10 ** 9), (200, 0, 0))
+
+        stats = self.monitor.get_stats()
+        self.assertEqual(stats["buffers"], 150)
+        self.assertEqual(stats["time"], 1.0)
+        self.assertEqual(stats["fill"], .75)
+        self.assertEqual(stats["max_fill"], .75)
+        self.assertEqual(stats["average_fill"], .5)
+        self.assertNotIn("dropped", stats)
+
+
+class TestQosStats(unittest.TestCase):
+    def test_counters_reset(self):
+        stats = telemetry.QosStats("usb_camera")
+        stats.on_qos(100, 2, .04, 1.0)
+        stats.on_qos(150, 5, .02, 1.1)
+        # Element has been flushed.
+        stats.on_qos(10, 1, 0, 1.0)
+        stats.on_qos(None, None, 0, 1.0)
+
+        self.assertEqual(stats.get_stats(),
+                         {"messages": 4, "processed": 160, "dropped": 6,
+                          "jitter": 0, "proportion": 1.0})
+        self.assertEqual(stats.dropped, 6)
+
+
+class TestRealtimeHealth(unittest.TestCase):
+    def setUp(self):
+        self.health = telemetry.RealtimeHealth()
+
+    def test_not_enough_samples(self):
+        self.assertIsNone(self.health.get_stats())
+        self.health.add_sample(0, 0, 0, 0, 0, 0)
+        self.assertIsNone(self.health.get_stats())
+
+    def test_score(self):
+        self.health.add_sample(0, 100, 100, 0, 0, 0)
+        # Frames dropped by rate conversion don't count against health.
+        self.health.add_sample(5, 330, 220, 110, 0, 0)
+        self.assertEqual(self.health.get_stats()["score"], 100)
+
+        self.health.add_sample(10, 530, 340, 190, 12, 12)
+        stats = self.health.get_stats()
+        self.assertEqual(stats["frames_out"], 240)
+        self.assertEqual(stats["duration"], 10)
+        self.assertEqual(stats["score"], 90)
+
+    def test_window(self):
+        self.health.add_sample(0, 0, 0, 0, 0, 0)
+        self.health.add_sample(1, 24, 24, 0, 24, 0)
+        for now in range(2, 13):
+            self.health.add_sample(now, 24 * now, 24 * now, 0, 24, 0)
+
+        # Duplicated frames are out of the window.
+        self.assertEqual(self.health.get_stats()["score"], 100)
+
+    def test_frozen_video(self):
+        self.health.add_sample(0, 100, 100, 0, 0, 0)
+        self.health.add_sample(5, 100, 100, 0, 0, 0)
+        self.assertEqual(self.health.get_stats()["score"], 0)
+
+    def test_counters_reset(self):
+        self.health.add_sample(0, 100, 100, 0, 0, 0)
+        self.health.add_sample(1, 0, 0, 0, 0, 0)
+        self.assertIsNone(self.health.get_stats())
+
+
+class TestAvSyncMonitor(unittest.TestCase):
+    def setUp(self):
+        self.monitor = telemetry.AvSyncMonitor()
+
+    def _add_window(self, start, audio_latency, video_latency):
+        for offset in range(telemetry.AV_SYNC_WINDOW):
+            # Scheduling delays only add latency.
+            delay = .005 if offset % 2 else 0
+            self.monitor.add(telemetry.AUDIO, start + offset,
+                             audio_latency + delay)
+            self.monitor.add(telemetry.VIDEO, start + offset + .5,
+                             video_latency + delay)
+
+    def test_drift(self):
+        self.assertIsNone(self.monitor.drift)
+        window = telemetry.AV_SYNC_WINDOW
+        # Offset of the first window is structural, not a drift.
+        self._add_window(0, .030, .010)
+        self._add_window(window, .030, .010)
+        self._add_window(2 * window, .040, .010)
+        self.monitor.add(telemetry.AUDIO, 3 * window, .040)
+
+        self.assertAlmostEqual(self.monitor.drift, .010)
+        stats = self.monitor.get_stats()
+        self.assertAlmostEqual(stats["max_drift"], .010)
+        self.assertEqual(stats["duration"], 2 * window)
+        self.assertGreater(stats["drift_rate"], 0)
+
+    def test_drift_rate(self):
+        window = telemetry.AV_SYNC_WINDOW
+        for index in range(10):
+            # Audio gets 1 ms late every window.
+            self._add_window(index * window, .020 + index / 1000, .010)
+        self.monitor.add(telemetry.AUDIO, 10 * window, 0)
+
+        self.assertAlmostEqual(self.monitor.get_stats()["drift_rate"],
+                               3600 / window / 1000)
+
+    def test_reset(self):
+        self._add_window(0, .030, .010)
+        self.monitor.add(telemetry.AUDIO, telemetry.AV_SYNC_WINDOW, .030)
+        self.monitor.reset()
+
+        self.assertIsNone(self.monitor.drift)
+        self.assertEqual(self.monitor.get_stats(),
+                         {"drift": None, "max_drift": None,
+                          "drift_rate": None, "duration": 0})
+
+
+class TestAvDelays(unittest.TestCase):
+    def _check_delays(self, delays, offset):
+        new_delays = telemetry.get_av_delays(*delays, offset)
+        self.assertGreaterEqual(new_delays[0], delays[0])
+        self.assertGreaterEqual(new_delays[1], delays[1])
+        self.assertAlmostEqual(new_delays[0] - new_delays[1], offset)
+        return new_delays
+
+    def test_initial_offset(self):
+        self.assertEqual(telemetry.get_av_delays(0, 0, .020), (.020, 0))
+        self.assertEqual(telemetry.get_av_delays(0, 0, -.020), (0, .020))
+        self.assertEqual(telemetry.get_av_delays(0, 0, 0), (0, 0))
+
+    def test_correction_changes_sign(self):
+        delays = self._check_delays((0, 0), .020)
+        # Audio must now be early, video gets delayed instead of removing
+        # delay from audio.
+        delays = self._check_delays(delays, -.010)
+        self.assertAlmostEqual(delays[0], .020)
+        self.assertAlmostEqual(delays[1], .030)
+        delays = self._check_delays(delays, .005)
+        self.assertAlmostEqual(delays[0], .035)
+        self.assertAlmostEqual(delays[1], .030)
+
+    def test_smaller_correction(self):
+        delays = self._check_delays((0, 0), .020)
+        delays = self._check_delays(delays, .010)
+        self.assertAlmostEqual(delays[0], .020)
+        self.assertAlmostEqual(delays[1], .010)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+import http.server
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+from core import upload
+
+logging.disable(logging.CRITICAL)
+
+
+class IngestHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path,
+                                     self.headers.get("Content-Range")))
+        data = self.server.files.setdefault(self.path, bytearray())
+        content_range = self.headers.get("Content-Range")
+        if content_range:
+            start = int(re.match(r"bytes (\d+)-", content_range).group(1))
+            if start != len(data):
+                self.send_response(416)
+                self.end_headers()
+                return
+        data.extend(body)
+        self.send_response(204)
+        self.end_headers()
+
+
+class IngestServer(http.server.HTTPServer):
+    """
+    HTTP server storing uploaded files in memory.
+    """
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), IngestHandler)
+        self.files = {}
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/ingest".format(self.server_port)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def wait_for(condition, timeout=5):
+    end_time = time.monotonic() + timeout
+    while time.monotonic() < end_time:
+        if condition():
+            return
+        time.sleep(.02)
+    raise AssertionError("Condition not met in time")
+
+
+@unittest.mock.patch("core.upload.UPLOAD_CHUNK_SIZE", 1000)
+@unittest.mock.patch("core.upload.UPLOAD_BLOCK_SIZE", 100)
+class TestUploader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.server = IngestServer()
+        self.addCleanup(self.server.close)
+        self.queue = upload.UploadQueue(
+            os.path.join(self.directory.name, "queue.json"))
+        self.data = bytes(range(256)) * 10
+
+    def _create_recording(self, name="show.webm"):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as f:
+            f.write(self.data)
+        return path
+
+    def _start_uploader(self, **kwargs):
+        uploader = upload.Uploader(self.server.url, self.queue, **kwargs)
+        uploader.start()
+        self.addCleanup(uploader.stop)
+        return uploader
+
+    def test_upload_in_chunks(self):
+        uploader = self._start_uploader()
+        uploader.enqueue(self._create_recording())
+
+        wait_for(lambda: not len(self.queue))
+        self.assertEqual(self.server.files["/ingest/show.webm"], self.data)
+        self.assertEqual([content_range for _, content_range
+                          in self.server.requests],
+                         ["bytes 0-999/2560", "bytes 1000-1999/2560",
+                          "bytes 2000-2559/2560"])
+
+    def test_resume_upload(self):
+        self.server.files["/ingest/show.webm"] = bytearray(self.data[:1500])
+        uploader = self._start_uploader()
+        uploader.enqueue(self._create_recording())
+
+        wait_for(lambda: not len(self.queue))
+        self.assertEqual(self.server.files["/ingest/show.webm"], self.data)
+        self.assertEqual(self.server.requests[0][1], "bytes 1500-2499/2560")
+
+    def test_queue_is_persistent(self):
+        path = self._create_recording()
+        self.queue.add(path)
+        self.queue.set_offset(path, 1000)
+
+        queue = upload.UploadQueue(self.queue.path)
+        self.assertEqual(queue.get_entries(), [{"path": path,
+                                                "offset": 1000}])
+        # Already queued.
+        self.assertFalse(queue.add(path))
+
+    def test_pause_while_streaming(self):
+        streaming = threading.Event()
+        streaming.set()
+        with unittest.mock.patch("core.upload.UPLOAD_PAUSE_CHECK_INTERVAL",
+                                 .01):
+            uploader = self._start_uploader(
+                pause_condition=streaming.is_set)
+            uploader.enqueue(self._create_recording())
+            time.sleep(.1)
+            self.assertEqual(self.server.requests, [])
+
+            streaming.clear()
+            wait_for(lambda: not len(self.queue))
+        self.assertEqual(self.server.files["/ingest/show.webm"], self.data)
+
+    def test_retry_on_server_error(self):
+        self.server.close()
+        with unittest.mock.patch("core.upload.UPLOAD_RETRY_DELAY", .01):
+            uploader = self._start_uploader()
+            uploader.enqueue(self._create_recording())
+            time.sleep(.1)
+            self.assertEqual(len(self.queue), 1)
+
+            self.server = IngestServer()
+            self.addCleanup(self.server.close)
+            uploader.url = self.server.url
+            wait_for(lambda: not len(self.queue))
+        self.assertEqual(self.server.files["/ingest/show.webm"], self.data)
+
+    def test_missing_recording_is_dropped(self):
+        self.queue.add(os.path.join(self.directory.name, "spam.webm"))
+        self._start_uploader()
+
+        wait_for(lambda: not len(self.queue))
+        self.assertEqual(self.server.requests, [])
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_get_delay(self):
+        limiter = upload.RateLimiter(rate=1000)
+
+        self.assertEqual(limiter.get_delay(500, now=10), .5)
+        self.assertEqual(limiter.get_delay(500, now=10.5), .5)
+        # Idle period only allows a short burst.
+        self.assertEqual(limiter.get_delay(1500, now=20), .5)
+
+    def test_no_limit(self):
+        self.assertEqual(upload.RateLimiter().get_delay(10 ** 9, now=0), 0)
@@ -82,6 +82,12 @@ class TestRemoteWatcher(unittest.TestCase):
         self.watcher.remove_watcher(self.address)
         self.assertNotIn(self.address, self.watcher._elements)
 
+    def test_get_element(self):
+        self.assertIsNone(self.watcher.get_element(self.address))
+
+        element = self.watcher.add_watcher(self.address)
+        self.assertIs(self.watcher.get_element(self.address), element)
+
 
 class TestRemoteElement(unittest.TestCase):
     # TODO:
@@ -139,6 +145,13 @@ class TestRemoteElement(unittest.TestCase):
         self.assertFalse(self.element.port_open)
         self.assertEqual(self.element.latency, -1)
 
+    def test_set_state_after_unknown_state(self):
+        self.element._set_state(None, None, -1)
+        self.element._set_state(True, True, self.latency)
+
+        self.assertFalse(self.element.unknown_state)
+        self.assertTrue(self.element.available)
+
     @unittest.mock.patch("core.watch.REMOTE_PING_TIMEOUT", .1)
     def test_ping_timeout(self):
         self.element._ping_command = ["sleep", "100"]
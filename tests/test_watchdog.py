@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of HUBAngl.
+# HUBAngl Uses Broadcaster Angle
+#
+# HUBAngl is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# HUBAngl is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HUBAngl.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (c) 2016-2019 David Testé
+
+
+
+import unittest
+
+from core import watchdog
+
+
+class TestStallWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.watchdog = watchdog.StallWatchdog(10)
+        self.watchdog.watch("video_source")
+        self.watchdog.watch("vp8_encoder", ("video_source",))
+        self.watchdog.watch("video_show_0", ("vp8_encoder",))
+        self.watchdog.reset(0)
+
+    def test_flowing_data(self):
+        last_times = {"video_source": 14, "vp8_encoder": 14,
+                      "video_show_0": 14}
+        self.assertEqual(self.watchdog.check(15, last_times), [])
+
+    def test_no_data_since_start(self):
+        self.assertEqual(self.watchdog.check(9, {}), [])
+        # Downstream points are only starved by the source.
+        self.assertEqual(self.watchdog.check(10, {}), [("video_source", 10)])
+
+    def test_stalled_sink(self):
+        last_times = {"video_source": 20, "vp8_encoder": 20,
+                      "video_show_0": 8}
+        self.assertEqual(self.watchdog.check(20, last_times),
+                         [("video_show_0", 12)])
+        self.assertTrue(self.watchdog.get_stats()["video_show_0"]["stalled"])
+
+    def test_stall_handled(self):
+        self.watchdog.check(10, {})
+        self.watchdog.on_stall("video_source", 10)
+
+        stats = self.watchdog.get_stats()
+        self.assertEqual(stats["video_source"],
+                         {"stalled": False, "stalls": 1})
+        # Source and points it feeds are given another timeout.
+        self.assertEqual(self.watchdog.check(19, {"video_source": 11}), [])
+        self.assertEqual(self.watchdog.check(20, {"video_source": 19}),
+                         [("vp8_encoder", 10)])
+
+    def test_reset(self):
+        self.watchdog.reset(5, ["video_show_0"])
+        last_times = {"video_source": 12, "vp8_encoder": 12}
+        self.assertEqual(self.watchdog.check(12, last_times), [])
+        self.assertEqual(self.watchdog.check(15, last_times),
+                         [("video_show_0", 10)])